@@ -0,0 +1,216 @@
+"""Phân bổ tồn kho theo FIFO an toàn khi nhiều người xuất kho cùng lúc.
+
+Các lô hàng của một sản phẩm được khóa (SELECT ... FOR UPDATE) trong một
+transaction, số lượng được trừ bằng F() kèm điều kiện không âm, và toàn bộ
+thao tác được thử lại khi gặp xung đột tuần tự hóa/deadlock. Số lượng lấy từ
+từng lô được ghi vào ExportAllocation để hoàn trả chính xác khi xóa hoặc sửa dòng xuất,
+và vào sổ biến động tồn kho (StockMovement).
+"""
+import time
+
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from products.models import Product
+from .models import Batch, ExportAllocation, ExportItem, StockMovement, schedule_inventory_version_bump
+
+
+class InsufficientStockError(Exception):
+    """Tồn kho không đủ để xuất"""
+
+    def __init__(self, requested, available):
+        self.requested = requested
+        self.available = available
+        super().__init__(f'Số lượng xuất ({requested}) vượt quá tồn kho ({available})')
+
+
+class StockConflictError(Exception):
+    """Lô hàng bị thay đổi bởi transaction khác giữa lúc đọc và lúc trừ tồn kho"""
+
+
+def allocate_fifo(product_id, quantity, document=''):
+    """Trừ `quantity` khỏi các lô hàng của sản phẩm theo FIFO.
+
+    Phải được gọi bên trong transaction.atomic(). Trả về danh sách
+    (batch, số lượng lấy từ lô) theo thứ tự đã phân bổ; document là mã phiếu
+    xuất ghi vào sổ biến động tồn kho.
+    """
+    # Khóa dòng sản phẩm trước để các lần xuất cùng sản phẩm được xếp hàng tuần tự
+    Product.objects.filter(pk=product_id).lock_for_update()
+    batches = list(
+        Batch.objects.select_for_update()
+        .filter(product_id=product_id, is_active=True, remaining_quantity__gt=0)
+        .order_by('import_date', 'id')
+    )
+
+    available = sum(batch.remaining_quantity for batch in batches)
+    if quantity > available:
+        raise InsufficientStockError(quantity, available)
+
+    allocations = []
+    remaining = quantity
+    for batch in batches:
+        if remaining <= 0:
+            break
+        take = min(remaining, batch.remaining_quantity)
+        updated = Batch.objects.filter(pk=batch.pk, remaining_quantity__gte=take).update(
+            remaining_quantity=F('remaining_quantity') - take
+        )
+        if not updated:
+            raise StockConflictError(batch.batch_code)
+        batch.remaining_quantity -= take
+        allocations.append((batch, take))
+        remaining -= take
+
+    # update() không gửi signal nên đồng bộ tồn kho, sổ biến động và phiên bản dữ liệu thủ công
+    Product.objects.filter(pk=product_id).refresh_stock()
+    StockMovement.record([(product_id, batch.pk, -taken) for batch, taken in allocations], 'export', document)
+    schedule_inventory_version_bump()
+    return allocations
+
+
+def run_with_retry(func, max_retries=5, backoff=0.05):
+    """Chạy func() trong một transaction mới, thử lại khi gặp xung đột.
+
+    Không được gọi bên trong một transaction.atomic() khác, vì khi đó
+    transaction ngoài không thể tiếp tục sau lỗi của database.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            with transaction.atomic():
+                return func()
+        except (OperationalError, StockConflictError):
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+
+def export_product(export_order, product, quantity, unit_price, discount_percent=0):
+    """Tạo một dòng xuất kho cho sản phẩm, trừ tồn kho theo FIFO trong một transaction"""
+    if quantity <= 0:
+        raise ValueError('Số lượng xuất phải lớn hơn 0')
+
+    def _export():
+        allocations = allocate_fifo(product.pk, quantity, export_order.export_code)
+        # ExportItem lưu lô đầu tiên làm đại diện, chi tiết từng lô nằm trong ExportAllocation
+        export_item = ExportItem.objects.create(
+            export_order=export_order,
+            batch=allocations[0][0],
+            quantity=quantity,
+            unit_price=unit_price,
+            discount_percent=discount_percent,
+        )
+        ExportAllocation.objects.bulk_create([
+            ExportAllocation(export_item=export_item, batch=batch, quantity=taken)
+            for batch, taken in allocations
+        ])
+        return export_item
+
+    return run_with_retry(_export)
+
+
+def restore_export_items(export_items):
+    """Hoàn trả tồn kho của các dòng xuất về đúng những lô đã dùng.
+
+    Phải được gọi bên trong transaction.atomic(), trước khi xóa các dòng xuất.
+    """
+    items = list(export_items.select_related('batch', 'export_order'))
+    if not items:
+        return
+
+    restored = {
+        row['batch']: row['total']
+        for row in ExportAllocation.objects.filter(export_item__in=items)
+        .values('batch')
+        .annotate(total=Sum('quantity'))
+    }
+    allocated_item_ids = set(
+        ExportAllocation.objects.filter(export_item__in=items).values_list('export_item_id', flat=True)
+    )
+    product_ids = {item.batch.product_id for item in items}
+    # Khóa sản phẩm trước lô hàng, cùng thứ tự với allocate_fifo
+    Product.objects.filter(pk__in=product_ids).lock_for_update()
+
+    # Dòng xuất tạo trước khi có ExportAllocation: hoàn trả theo cách cũ (đoán theo lô)
+    for item in items:
+        if item.pk not in allocated_item_ids:
+            _restore_legacy_item(item, restored)
+
+    batch_products = {}
+    if restored:
+        batch_products = dict(Batch.objects.select_for_update().filter(pk__in=restored).values_list('pk', 'product_id'))
+        Batch.objects.filter(pk__in=restored).update(
+            remaining_quantity=F('remaining_quantity') + Case(
+                *[When(pk=batch_id, then=Value(quantity)) for batch_id, quantity in restored.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+
+    Product.objects.filter(pk__in=product_ids).refresh_stock()
+    StockMovement.record(
+        [(batch_products[batch_id], batch_id, quantity) for batch_id, quantity in restored.items() if batch_id in batch_products],
+        'export_cancel',
+        ', '.join(sorted({item.export_order.export_code for item in items})),
+    )
+    schedule_inventory_version_bump()
+
+
+def _restore_legacy_item(item, restored):
+    remaining = item.quantity
+    batches = Batch.objects.filter(product_id=item.batch.product_id, is_active=True).order_by('import_date')
+    for batch in batches:
+        if remaining <= 0:
+            break
+        exported_from_batch = batch.import_quantity - batch.remaining_quantity - restored.get(batch.pk, 0)
+        if exported_from_batch > 0:
+            restore_quantity = min(remaining, exported_from_batch)
+            restored[batch.pk] = restored.get(batch.pk, 0) + restore_quantity
+            remaining -= restore_quantity
+
+
+def delete_export_item(export_item):
+    """Xóa một dòng xuất và hoàn trả tồn kho trong một transaction"""
+
+    def _delete():
+        restore_export_items(ExportItem.objects.filter(pk=export_item.pk))
+        export_item.delete()
+
+    run_with_retry(_delete)
+
+
+def update_export_item_quantity(export_item, quantity):
+    """Đổi số lượng của một dòng xuất trong một transaction.
+
+    Hoàn trả đúng các lô dòng xuất đã dùng rồi phân bổ lại theo FIFO; nếu
+    không đủ tồn kho thì InsufficientStockError và dòng xuất giữ nguyên.
+    """
+    if quantity <= 0:
+        raise ValueError('Số lượng xuất phải lớn hơn 0')
+
+    def _update():
+        items = ExportItem.objects.filter(pk=export_item.pk)
+        product_id = items.values_list('batch__product_id', flat=True).get()
+        restore_export_items(items)
+        ExportAllocation.objects.filter(export_item=export_item).delete()
+        allocations = allocate_fifo(product_id, quantity, export_item.export_order.export_code)
+        export_item.batch = allocations[0][0]
+        export_item.quantity = quantity
+        export_item.save(update_fields=['batch', 'quantity'])
+        ExportAllocation.objects.bulk_create([
+            ExportAllocation(export_item=export_item, batch=batch, quantity=taken)
+            for batch, taken in allocations
+        ])
+        return export_item
+
+    return run_with_retry(_update)
+
+
+def delete_export(export_order):
+    """Xóa phiếu xuất và hoàn trả tồn kho của mọi dòng xuất trong một transaction"""
+
+    def _delete():
+        restore_export_items(export_order.items.all())
+        export_order.delete()
+
+    run_with_retry(_delete)
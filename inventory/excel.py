@@ -0,0 +1,122 @@
+"""Đọc file Excel nhập kho theo kiểu streaming và lưu tạm vào database.
+
+File .xlsx được đọc bằng openpyxl ở chế độ read_only (từng dòng, bộ nhớ không
+tăng theo kích thước sheet); các dòng được ghi vào StagedImportRow theo từng
+chunk thay vì giữ toàn bộ trong session.
+"""
+import datetime
+from itertools import islice
+
+from .models import StagedImportRow
+
+REQUIRED_COLUMNS = ['Tên SP', 'Danh mục', 'Số lượng', 'Giá nhập', 'Giá bán', 'Đơn vị']
+
+STAGING_CHUNK_SIZE = 500
+
+
+class ExcelImportError(Exception):
+    """File Excel không đúng cấu trúc"""
+
+
+def _normalize_value(value):
+    """Chuyển giá trị ô Excel thành kiểu serialize được bằng JSON"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    value = str(value)
+    return value if value.strip() else None
+
+
+def _iter_xlsx_rows(file):
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_xls_rows(file):
+    import xlrd
+
+    workbook = xlrd.open_workbook(file_contents=file.read(), on_demand=True)
+    try:
+        sheet = workbook.sheet_by_index(0)
+        for index in range(sheet.nrows):
+            values = []
+            for cell in sheet.row(index):
+                if cell.ctype == xlrd.XL_CELL_DATE:
+                    values.append(xlrd.xldate_as_datetime(cell.value, workbook.datemode))
+                elif cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+                    values.append(None)
+                else:
+                    values.append(cell.value)
+            yield tuple(values)
+    finally:
+        workbook.release_resources()
+
+
+def iter_excel_rows(file):
+    """Sinh từng dòng dữ liệu (dict theo tên cột) của sheet đầu tiên"""
+    file.seek(0)
+    rows = _iter_xls_rows(file) if file.name.endswith('.xls') else _iter_xlsx_rows(file)
+
+    header = next(rows, None)
+    columns = [str(value).strip() if value is not None else '' for value in (header or ())]
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing_columns:
+        rows.close()
+        raise ExcelImportError(f"Thiếu các cột bắt buộc: {', '.join(missing_columns)}")
+
+    for values in rows:
+        row = {
+            column: _normalize_value(value)
+            for column, value in zip(columns, values)
+            if column
+        }
+        # Bỏ qua dòng trống
+        if any(value is not None for value in row.values()):
+            for column in columns:
+                if column:
+                    row.setdefault(column, None)
+            yield row
+
+
+def stage_excel_rows(file, upload_id, user, chunk_size=STAGING_CHUNK_SIZE, progress=None):
+    """Đọc file và ghi các dòng vào StagedImportRow theo từng chunk, trả về số dòng.
+
+    Mỗi chunk được ghi trong transaction riêng để tiến độ (progress(số dòng đã đọc),
+    nếu có) hiển thị được ngay; nếu đọc lỗi giữa chừng, các dòng đã ghi bị xóa.
+    """
+    rows = iter_excel_rows(file)
+    total = 0
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            StagedImportRow.objects.bulk_create([
+                StagedImportRow(upload_id=upload_id, row_number=total + offset, data=data, created_by=user)
+                for offset, data in enumerate(chunk)
+            ])
+            total += len(chunk)
+            if progress is not None:
+                progress(total)
+    except Exception:
+        StagedImportRow.objects.filter(upload_id=upload_id).delete()
+        raise
+    if not total:
+        raise ExcelImportError("File Excel không có dữ liệu")
+    return total
+
+
+def staged_rows(upload_id, user):
+    return StagedImportRow.objects.filter(upload_id=upload_id, created_by=user)
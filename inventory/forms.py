@@ -1,7 +1,8 @@
+import datetime
+
 from django import forms
 from .models import Import, ImportItem, Export, ExportItem, Batch
-from products.models import Product, Category
-import pandas as pd
+from products.models import Product
 from django.core.exceptions import ValidationError
 
 class ImportForm(forms.ModelForm):
@@ -78,302 +79,145 @@ class ImportExcelForm(forms.Form):
         if file.size > 5 * 1024 * 1024:
             raise ValidationError("File quá lớn. Kích thước tối đa là 5MB.")
         
-        try:
-            # Đọc file Excel
-            if file.name.endswith('.xlsx'):
-                df = pd.read_excel(file, engine='openpyxl')
-            else:
-                df = pd.read_excel(file, engine='xlrd')
-            
-            # Kiểm tra cấu trúc cột
-            required_columns = ['Tên SP', 'Danh mục', 'Số lượng', 'Giá nhập', 'Giá bán', 'Đơn vị']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            
-            if missing_columns:
-                raise ValidationError(f"Thiếu các cột bắt buộc: {', '.join(missing_columns)}")
-            
-            # Kiểm tra dữ liệu
-            if df.empty:
-                raise ValidationError("File Excel không có dữ liệu")
-            
-            # Kiểm tra danh mục tồn tại (chỉ để thông báo, không bắt buộc)
-            category_names = df['Danh mục'].dropna().astype(str)
-            existing_categories = Category.objects.filter(name__in=category_names)
-            existing_category_names = set(existing_categories.values_list('name', flat=True))
-            
-            missing_categories = set(category_names) - existing_category_names
-            if missing_categories:
-                # Lưu thông tin danh mục thiếu vào session để hiển thị cảnh báo
-                if not hasattr(self, 'missing_categories'):
-                    self.missing_categories = list(missing_categories)
-            
-            # Chuyển đổi DataFrame thành dictionary để có thể serialize
-            # Xử lý các cột ngày tháng và số để tránh lỗi JSON serialization
-            excel_data_dict = []
-            for index, row in df.iterrows():
-                row_dict = {}
-                for col in df.columns:
-                    value = row[col]
-                    
-                    # Xử lý các loại dữ liệu khác nhau
-                    if pd.isna(value):
-                        row_dict[col] = None
-                    elif isinstance(value, pd.Timestamp):
-                        # Chuyển Timestamp thành string
-                        row_dict[col] = value.strftime('%Y-%m-%d')
-                    elif isinstance(value, (int, float)):
-                        # Giữ nguyên số
-                        row_dict[col] = value
-                    else:
-                        # Chuyển thành string
-                        row_dict[col] = str(value)
-                
-                excel_data_dict.append(row_dict)
-            
-            # Lưu dữ liệu đã xử lý vào session
-            self.excel_data = excel_data_dict
-            
-        except Exception as e:
-            raise ValidationError(f"Lỗi khi đọc file Excel: {str(e)}")
-        
+        # Nội dung file được đọc theo kiểu streaming khi lưu tạm (xem inventory.excel)
         return file
 
-class ImportItemBulkForm(forms.Form):
-    """Form để xác nhận dữ liệu import từ Excel"""
-    
-    def __init__(self, excel_data=None, *args, **kwargs):
+def _excel_text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class StagedImportRowForm(forms.Form):
+    """Form cho một dòng Excel trên bảng xác nhận import (theo trang).
+
+    Danh sách danh mục được truyền vào từ view (tải một lần cho mỗi request),
+    form không tự truy vấn database.
+    """
+
+    product_name = forms.CharField(
+        max_length=200,
+        error_messages={'required': 'Tên sản phẩm không được để trống'},
+        widget=forms.TextInput(attrs={'class': 'form-control form-control-sm', 'style': 'width: 150px;'})
+    )
+    category = forms.ChoiceField(
+        error_messages={'required': 'Vui lòng chọn danh mục'},
+        widget=forms.Select(attrs={'class': 'form-control form-control-sm', 'style': 'width: 120px;'})
+    )
+    quantity = forms.IntegerField(
+        min_value=1,
+        error_messages={'min_value': 'Số lượng phải lớn hơn 0'},
+        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'style': 'width: 80px;'})
+    )
+    import_price = forms.DecimalField(
+        min_value=0,
+        decimal_places=2,
+        error_messages={'min_value': 'Giá nhập không được âm'},
+        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'style': 'width: 100px;'})
+    )
+    selling_price = forms.DecimalField(
+        min_value=0,
+        decimal_places=2,
+        error_messages={'min_value': 'Giá bán không được âm'},
+        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'style': 'width: 100px;'})
+    )
+    unit = forms.CharField(
+        max_length=20,
+        error_messages={'required': 'Đơn vị không được để trống'},
+        widget=forms.TextInput(attrs={'class': 'form-control form-control-sm', 'style': 'width: 80px;'})
+    )
+    expiry_date = forms.DateField(
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date', 'style': 'width: 130px;'})
+    )
+
+    def __init__(self, *args, categories=(), excel_category=None, **kwargs):
+        """categories: danh sách (id, tên) danh mục; excel_category: tên danh mục trong file"""
         super().__init__(*args, **kwargs)
-        if excel_data is not None:
-            self.excel_data = excel_data
-            self._create_dynamic_fields()
-    
-    def _create_dynamic_fields(self):
-        """Tạo các trường động từ dữ liệu Excel"""
-        for index, row in enumerate(self.excel_data):
-            product_name = str(row['Tên SP'])
-            category_name = str(row['Danh mục'])
-            quantity = row['Số lượng']
-            import_price = row['Giá nhập']
-            selling_price = row['Giá bán']
-            unit = str(row['Đơn vị'])
-            description = str(row.get('Mô tả', ''))
-            
-            # Kiểm tra và tạo field cho tên sản phẩm
-            product_name_is_valid = product_name.strip() and len(product_name.strip()) <= 200
-            if product_name_is_valid:
-                self.fields[f'product_name_{index}'] = forms.CharField(
-                    initial=product_name,
-                    max_length=200,
-                    widget=forms.TextInput(attrs={'class': 'form-control form-control-sm product-name-valid', 'style': 'width: 150px;'})
-                )
-            else:
-                self.fields[f'product_name_{index}'] = forms.CharField(
-                    initial=product_name,
-                    max_length=200,
-                    widget=forms.TextInput(attrs={'class': 'form-control form-control-sm product-name-invalid', 'style': 'width: 150px;'})
-                )
-            
-            # Kiểm tra và tạo field cho số lượng
-            try:
-                quantity_valid = isinstance(quantity, (int, float)) and quantity > 0
-                if quantity_valid:
-                    self.fields[f'quantity_{index}'] = forms.IntegerField(
-                        initial=quantity,
-                        min_value=1,
-                        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm quantity-valid', 'style': 'width: 80px;'})
-                    )
-                else:
-                    self.fields[f'quantity_{index}'] = forms.IntegerField(
-                        initial=1,
-                        min_value=1,
-                        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm quantity-invalid', 'style': 'width: 80px;'})
-                    )
-            except (ValueError, TypeError):
-                self.fields[f'quantity_{index}'] = forms.IntegerField(
-                    initial=1,
-                    min_value=1,
-                    widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm quantity-invalid', 'style': 'width: 80px;'})
-                )
-            
-            # Kiểm tra và tạo field cho giá nhập
-            try:
-                import_price_valid = isinstance(import_price, (int, float)) and import_price >= 0
-                if import_price_valid:
-                    self.fields[f'import_price_{index}'] = forms.DecimalField(
-                        initial=import_price,
-                        min_value=0,
-                        decimal_places=2,
-                        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm import-price-valid', 'style': 'width: 100px;'})
-                    )
-                else:
-                    self.fields[f'import_price_{index}'] = forms.DecimalField(
-                        initial=0,
-                        min_value=0,
-                        decimal_places=2,
-                        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm import-price-invalid', 'style': 'width: 100px;'})
-                    )
-            except (ValueError, TypeError):
-                self.fields[f'import_price_{index}'] = forms.DecimalField(
-                    initial=0,
-                    min_value=0,
-                    decimal_places=2,
-                    widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm import-price-invalid', 'style': 'width: 100px;'})
-                )
-            
-            # Kiểm tra và tạo field cho giá bán
-            try:
-                selling_price_valid = isinstance(selling_price, (int, float)) and selling_price >= 0
-                if selling_price_valid:
-                    self.fields[f'selling_price_{index}'] = forms.DecimalField(
-                        initial=selling_price,
-                        min_value=0,
-                        decimal_places=2,
-                        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm selling-price-valid', 'style': 'width: 100px;'})
-                    )
-                else:
-                    self.fields[f'selling_price_{index}'] = forms.DecimalField(
-                        initial=0,
-                        min_value=0,
-                        decimal_places=2,
-                        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm selling-price-invalid', 'style': 'width: 100px;'})
-                    )
-            except (ValueError, TypeError):
-                self.fields[f'selling_price_{index}'] = forms.DecimalField(
-                    initial=0,
-                    min_value=0,
-                    decimal_places=2,
-                    widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm selling-price-invalid', 'style': 'width: 100px;'})
-                )
-            
-            # Tạo field cho danh mục (dropdown hoặc text input)
-            # Kiểm tra xem danh mục có tồn tại không
-            existing_categories = Category.objects.all().order_by('name')
-            category_exists = existing_categories.filter(name=category_name).exists()
-            
-            if category_exists:
-                # Nếu danh mục tồn tại, sử dụng dropdown với giá trị mặc định
-                self.fields[f'category_{index}'] = forms.ModelChoiceField(
-                    queryset=existing_categories,
-                    initial=existing_categories.filter(name=category_name).first(),
-                    widget=forms.Select(attrs={'class': 'form-control form-control-sm', 'style': 'width: 120px;'})
-                )
-            else:
-                # Nếu danh mục không tồn tại, sử dụng dropdown với option "Tạo mới"
-                choices = [('', '-- Chọn danh mục --')] + [(cat.id, cat.name) for cat in existing_categories] + [('new', f'Tạo mới: {category_name}')]
-                self.fields[f'category_{index}'] = forms.ChoiceField(
-                    choices=choices,
-                    initial='',
-                    widget=forms.Select(attrs={'class': 'form-control form-control-sm', 'style': 'width: 120px;'})
-                )
-            
-            # Tạo field cho đơn vị (có thể chỉnh sửa)
-            unit = str(row['Đơn vị'])
-            # Kiểm tra đơn vị hợp lệ (không rỗng và có độ dài hợp lý)
-            unit_is_valid = unit.strip() and len(unit.strip()) <= 20
-            
-            if unit_is_valid:
-                self.fields[f'unit_{index}'] = forms.CharField(
-                    initial=unit,
-                    max_length=20,
-                    widget=forms.TextInput(attrs={'class': 'form-control form-control-sm unit-valid', 'style': 'width: 80px;'})
-                )
-            else:
-                self.fields[f'unit_{index}'] = forms.CharField(
-                    initial=unit,
-                    max_length=20,
-                    widget=forms.TextInput(attrs={'class': 'form-control form-control-sm unit-invalid', 'style': 'width: 80px;'})
-                )
-            
-            # Tạo field cho hạn sử dụng (có thể chỉnh sửa)
-            expiry_date = row.get('Hạn sử dụng', None)
-            if expiry_date is None:
-                from django.utils import timezone
-                expiry_date = timezone.now().date() + timezone.timedelta(days=365)
-                expiry_is_valid = False
-            else:
-                # Kiểm tra hạn sử dụng hợp lệ
-                try:
-                    if isinstance(expiry_date, str):
-                        # Nếu là string, thử parse
-                        from datetime import datetime
-                        expiry_date = datetime.strptime(expiry_date, '%Y-%m-%d').date()
-                    elif hasattr(expiry_date, 'date'):
-                        # Nếu là datetime object
-                        expiry_date = expiry_date.date()
-                    
-                    # Kiểm tra hạn sử dụng không trong quá khứ
-                    from django.utils import timezone
-                    today = timezone.now().date()
-                    expiry_is_valid = expiry_date >= today
-                except:
-                    # Nếu có lỗi parse, đặt ngày mặc định
-                    from django.utils import timezone
-                    expiry_date = timezone.now().date() + timezone.timedelta(days=365)
-                    expiry_is_valid = False
-            
-            if expiry_is_valid:
-                self.fields[f'expiry_date_{index}'] = forms.DateField(
-                    initial=expiry_date,
-                    widget=forms.DateInput(attrs={'class': 'form-control form-control-sm expiry-valid', 'type': 'date', 'style': 'width: 130px;'})
-                )
-            else:
-                self.fields[f'expiry_date_{index}'] = forms.DateField(
-                    initial=expiry_date,
-                    widget=forms.DateInput(attrs={'class': 'form-control form-control-sm expiry-invalid', 'type': 'date', 'style': 'width: 130px;'})
-                )
-            
-            # Tạo field checkbox để chọn sản phẩm
-            self.fields[f'include_{index}'] = forms.BooleanField(
-                initial=True,
-                required=False,
-                widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
-            )
-    
-    def clean(self):
-        """Validation cho form"""
-        cleaned_data = super().clean()
-        
-        # Kiểm tra từng item được chọn
-        for index, row in enumerate(self.excel_data):
-            if cleaned_data.get(f'include_{index}', False):
-                # Kiểm tra tên sản phẩm
-                product_name = cleaned_data.get(f'product_name_{index}', '').strip()
-                if not product_name:
-                    self.add_error(f'product_name_{index}', 'Tên sản phẩm không được để trống')
-                elif len(product_name) > 200:
-                    self.add_error(f'product_name_{index}', 'Tên sản phẩm không được quá 200 ký tự')
-                
-                # Kiểm tra số lượng
-                quantity = cleaned_data.get(f'quantity_{index}')
-                if not quantity or quantity <= 0:
-                    self.add_error(f'quantity_{index}', 'Số lượng phải lớn hơn 0')
-                
-                # Kiểm tra giá nhập
-                import_price = cleaned_data.get(f'import_price_{index}')
-                if import_price is None or import_price < 0:
-                    self.add_error(f'import_price_{index}', 'Giá nhập không được âm')
-                
-                # Kiểm tra giá bán
-                selling_price = cleaned_data.get(f'selling_price_{index}')
-                if selling_price is None or selling_price < 0:
-                    self.add_error(f'selling_price_{index}', 'Giá bán không được âm')
-                
-                # Kiểm tra đơn vị
-                unit = cleaned_data.get(f'unit_{index}', '').strip()
-                if not unit:
-                    self.add_error(f'unit_{index}', 'Đơn vị không được để trống')
-                elif len(unit) > 20:
-                    self.add_error(f'unit_{index}', 'Đơn vị không được quá 20 ký tự')
-                
-                # Kiểm tra hạn sử dụng
-                expiry_date = cleaned_data.get(f'expiry_date_{index}')
-                if expiry_date:
-                    from django.utils import timezone
-                    today = timezone.now().date()
-                    if expiry_date < today:
-                        self.add_error(f'expiry_date_{index}', 'Hạn sử dụng không được trong quá khứ')
-        
-        return cleaned_data
+        choices = [('', '-- Chọn danh mục --')] + [(str(pk), name) for pk, name in categories]
+        if excel_category and excel_category not in {name for _, name in categories}:
+            choices.append(('new', f'Tạo mới: {excel_category}'))
+        self.fields['category'].choices = choices
+
+    def clean_expiry_date(self):
+        expiry_date = self.cleaned_data['expiry_date']
+        from django.utils import timezone
+        if expiry_date < timezone.now().date():
+            raise ValidationError('Hạn sử dụng không được trong quá khứ')
+        return expiry_date
+
+    def stored_values(self):
+        """Giá trị đã kiểm tra, dạng lưu được vào JSONField"""
+        data = self.cleaned_data
+        return {
+            'product_name': data['product_name'],
+            'category': data['category'],
+            'quantity': data['quantity'],
+            'import_price': str(data['import_price']),
+            'selling_price': str(data['selling_price']),
+            'unit': data['unit'],
+            'expiry_date': data['expiry_date'].isoformat(),
+        }
+
+    def raw_values(self):
+        """Giá trị người dùng nhập (kể cả khi không hợp lệ) để hiển thị lại"""
+        return {name: self[name].value() for name in self.fields}
+
+    @staticmethod
+    def initial_from_excel(row, category_ids_by_name, today):
+        """Giá trị mặc định của một dòng Excel chưa chỉnh sửa và các lỗi cần người dùng sửa.
+
+        Giá trị số không hợp lệ được thay bằng mặc định (1 hoặc 0) như bảng xác nhận
+        trước đây; tên, đơn vị, danh mục và hạn sử dụng thì phải được sửa trước khi nhập.
+        """
+        product_name = _excel_text(row.get('Tên SP'))
+        unit = _excel_text(row.get('Đơn vị'))
+        category_name = _excel_text(row.get('Danh mục'))
+        quantity = row.get('Số lượng')
+        import_price = row.get('Giá nhập')
+        selling_price = row.get('Giá bán')
+
+        issues = {}
+        if not product_name:
+            issues['product_name'] = 'Tên sản phẩm không được để trống'
+        elif len(product_name) > 200:
+            issues['product_name'] = 'Tên sản phẩm không được quá 200 ký tự'
+        if not unit:
+            issues['unit'] = 'Đơn vị không được để trống'
+        elif len(unit) > 20:
+            issues['unit'] = 'Đơn vị không được quá 20 ký tự'
+
+        category_id = category_ids_by_name.get(category_name)
+        if category_id is None:
+            issues['category'] = 'Vui lòng chọn danh mục'
+
+        if not (_is_number(quantity) and quantity > 0):
+            quantity = 1
+        elif not float(quantity).is_integer():
+            issues['quantity'] = 'Số lượng phải là số nguyên'
+        if not (_is_number(import_price) and import_price >= 0):
+            import_price = 0
+        if not (_is_number(selling_price) and selling_price >= 0):
+            selling_price = 0
+
+        try:
+            expiry_date = datetime.date.fromisoformat(str(row.get('Hạn sử dụng'))[:10])
+        except ValueError:
+            expiry_date = today + datetime.timedelta(days=365)
+        if expiry_date < today:
+            issues['expiry_date'] = 'Hạn sử dụng không được trong quá khứ'
+
+        values = {
+            'product_name': product_name,
+            'category': str(category_id) if category_id is not None else '',
+            'quantity': quantity,
+            'import_price': str(import_price),
+            'selling_price': str(selling_price),
+            'unit': unit,
+            'expiry_date': expiry_date.isoformat(),
+        }
+        return values, issues
 
 class ImportItemFormSet(forms.BaseFormSet):
     """FormSet cho nhiều items"""
@@ -394,12 +238,15 @@ class ExportForm(forms.ModelForm):
 
 class ExportItemForm(forms.ModelForm):
     """Form cho từng item trong phiếu xuất kho"""
-    # Thêm field để chọn sản phẩm thay vì batch
+    # Sản phẩm được chọn bằng ô tìm kiếm (typeahead), form chỉ nhận ID
     product = forms.ModelChoiceField(
         queryset=None,
-        empty_label="Chọn sản phẩm...",
-        widget=forms.Select(attrs={'class': 'form-select'}),
-        label="Sản phẩm"
+        widget=forms.HiddenInput(),
+        label="Sản phẩm",
+        error_messages={
+            'required': 'Vui lòng chọn sản phẩm',
+            'invalid_choice': 'Sản phẩm không tồn tại hoặc đã hết hàng',
+        },
     )
     
     class Meta:
@@ -413,22 +260,11 @@ class ExportItemForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Chỉ hiển thị các sản phẩm có tồn kho > 0 và loại bỏ trùng lặp theo tên
+        # Chỉ nhận sản phẩm còn hàng; ModelChoiceField kiểm tra ID bằng một câu truy vấn,
+        # không tải danh sách sản phẩm vì widget là HiddenInput
         from products.models import Product
         
-        # Lấy sản phẩm có tồn kho > 0 và loại bỏ trùng lặp theo tên
-        products_with_stock = []
-        seen_names = set()
-        
-        for product in Product.objects.filter(is_active=True).order_by('name', 'id'):
-            if product.name not in seen_names and product.total_stock > 0:
-                products_with_stock.append(product)
-                seen_names.add(product.name)
-        
-        self.fields['product'].queryset = Product.objects.filter(id__in=[p.id for p in products_with_stock])
-        
-        # Tùy chỉnh cách hiển thị - chỉ hiển thị tên sản phẩm
-        self.fields['product'].label_from_instance = lambda obj: obj.name
+        self.fields['product'].queryset = Product.objects.filter(is_active=True, stock_quantity__gt=0)
         
         # Set giá trị mặc định cho discount_percent
         self.fields['discount_percent'].initial = 0
@@ -0,0 +1,250 @@
+"""Ghi phiếu nhập kho từ nhiều dòng dữ liệu bằng các thao tác hàng loạt.
+
+Danh mục và sản phẩm được tra theo tên bằng một câu truy vấn mỗi loại, phần
+còn thiếu được tạo bằng bulk_create; mã sản phẩm/mã lô được giữ theo dải từ
+DocumentSequence; ImportItem rồi Batch (gắn với dòng nhập) được chèn theo lô. Toàn bộ chạy trong
+một transaction, số câu truy vấn không tăng theo số dòng (chỉ theo batch_size).
+"""
+import datetime
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import transaction
+
+from products.models import Category, DocumentSequence, Product
+from products.search import build_search_text, index_products
+from .excel import STAGING_CHUNK_SIZE
+from .forms import StagedImportRowForm
+from .models import Batch, Import, ImportItem, StockMovement, schedule_inventory_version_bump
+
+BULK_BATCH_SIZE = 1000
+
+
+@dataclass
+class ImportResult:
+    rows: int
+    created_products: int
+    elapsed: float
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else float(self.rows)
+
+
+def _reserve_codes(kind, prefixes, year):
+    """Giữ mã loại `kind` cho từng tiền tố (một lần ghi mỗi tiền tố), trả về iterator theo tiền tố"""
+    counts = defaultdict(int)
+    for prefix in prefixes:
+        counts[prefix] += 1
+    return {
+        prefix: iter(DocumentSequence.next_codes(kind, prefix, year, count))
+        for prefix, count in counts.items()
+    }
+
+
+def _resolve_categories(rows):
+    """Gắn Category cho từng dòng: theo id có sẵn hoặc theo tên (tạo mới nếu chưa có)"""
+    ids = {int(row['category_id']) for row in rows if row.get('category_id')}
+    by_id = Category.objects.in_bulk(ids)
+    if len(by_id) != len(ids):
+        raise Category.DoesNotExist(f"Không tìm thấy danh mục: {sorted(ids - set(by_id))}")
+
+    names = {row['category_name'] for row in rows if not row.get('category_id')}
+    by_name = {}
+    for category in Category.objects.filter(name__in=names).order_by('-id'):
+        by_name[category.name] = category
+    missing = names - set(by_name)
+    if missing:
+        Category.objects.bulk_create([Category(name=name) for name in missing])
+        by_name.update({category.name: category for category in Category.objects.filter(name__in=missing)})
+
+    for row in rows:
+        if row.get('category_id'):
+            row['category'] = by_id[int(row['category_id'])]
+        else:
+            row['category'] = by_name[row['category_name']]
+
+
+def bulk_import_rows(import_order, rows, user, batch_size=BULK_BATCH_SIZE):
+    """Tạo ImportItem và Batch cho tất cả các dòng trong một transaction.
+
+    Mỗi dòng là dict gồm: product_name, category_id hoặc category_name,
+    quantity, import_price, selling_price, unit, description, expiry_date.
+    """
+    started = time.perf_counter()
+    year = datetime.datetime.now().year
+    import_date = import_order.import_date.date()
+
+    with transaction.atomic():
+        _resolve_categories(rows)
+
+        # Tra sản phẩm theo (tên, danh mục) bằng một câu truy vấn
+        names = {row['product_name'] for row in rows}
+        category_ids = {row['category'].pk for row in rows}
+        products = {}
+        for product in Product.objects.filter(name__in=names, category_id__in=category_ids).order_by('-id'):
+            products[(product.name, product.category_id)] = product
+        # Khóa sản phẩm đã có trước khi ghi lô hàng, cùng thứ tự với xuất kho (allocate_fifo)
+        Product.objects.filter(pk__in=[product.pk for product in products.values()]).lock_for_update()
+
+        # Sản phẩm mới: lấy giá trị từ dòng đầu tiên của sản phẩm đó
+        new_products = {}
+        for row in rows:
+            key = (row['product_name'], row['category'].pk)
+            if key not in products and key not in new_products:
+                new_products[key] = Product(
+                    name=row['product_name'],
+                    category=row['category'],
+                    unit=row['unit'],
+                    selling_price=row['selling_price'],
+                    purchase_price=row['import_price'],
+                    expiry_date=row['expiry_date'],
+                    description=row['description'] or '',
+                    is_active=True,
+                )
+        if new_products:
+            codes = _reserve_codes('product', [p.category.name[:3].upper() for p in new_products.values()], year)
+            for product in new_products.values():
+                product.code = next(codes[product.category.name[:3].upper()])
+                product.search_text = build_search_text(product)
+            Product.objects.bulk_create(new_products.values(), batch_size=batch_size)
+            if any(product.pk is None for product in new_products.values()):
+                # Database không trả về id sau bulk_create: tra lại theo mã bằng một câu truy vấn
+                ids = dict(
+                    Product.objects.filter(code__in=[product.code for product in new_products.values()])
+                    .values_list('code', 'pk')
+                )
+                for product in new_products.values():
+                    product.pk = ids[product.code]
+            products.update(new_products)
+            # bulk_create không gửi signal nên ghi từ khóa tìm kiếm thủ công
+            index_products([product.pk for product in new_products.values()])
+
+        # Cập nhật thông tin sản phẩm cũ (giống luồng nhập từng dòng trước đây)
+        changed = {}
+        for row in rows:
+            key = (row['product_name'], row['category'].pk)
+            if key in new_products:
+                continue
+            product = products[key]
+            if row['selling_price']:
+                product.selling_price = row['selling_price']
+            if not product.purchase_price and row['import_price']:
+                product.purchase_price = row['import_price']
+            if not product.unit:
+                product.unit = row['unit']
+            if not product.description:
+                product.description = row['description'] or ''
+            if not product.expiry_date and row['expiry_date']:
+                product.expiry_date = row['expiry_date']
+            changed[product.pk] = product
+        if changed:
+            Product.objects.bulk_update(
+                changed.values(),
+                ['selling_price', 'purchase_price', 'unit', 'description', 'expiry_date'],
+                batch_size=batch_size,
+            )
+
+        items = [
+            ImportItem(
+                import_order=import_order,
+                product=products[(row['product_name'], row['category'].pk)],
+                quantity=row['quantity'],
+                unit_price=row['import_price'],
+            )
+            for row in rows
+        ]
+        existing_item_ids = set(import_order.items.values_list('pk', flat=True))
+        ImportItem.objects.bulk_create(items, batch_size=batch_size)
+        if any(item.pk is None for item in items):
+            # Database không trả về id sau bulk_create: các dòng mới có id tăng dần theo thứ tự chèn
+            new_ids = [
+                pk for pk in import_order.items.order_by('pk').values_list('pk', flat=True)
+                if pk not in existing_item_ids
+            ]
+            for item, pk in zip(items, new_ids):
+                item.pk = pk
+
+        # Mỗi lô gắn với dòng nhập đã tạo ra nó, hạn sử dụng theo dòng (không có thì theo sản phẩm)
+        batches = [
+            Batch(
+                product=item.product,
+                import_date=import_date,
+                import_quantity=item.quantity,
+                remaining_quantity=item.quantity,
+                expiry_date=row['expiry_date'] or item.product.expiry_date,
+                import_item=item,
+                created_by=user,
+            )
+            for item, row in zip(items, rows)
+        ]
+        codes = _reserve_codes('batch', [batch.product.name[:3].upper() for batch in batches], year)
+        for batch in batches:
+            batch.batch_code = next(codes[batch.product.name[:3].upper()])
+        Batch.objects.bulk_create(batches, batch_size=batch_size)
+
+        # bulk_create không gửi signal nên đồng bộ tồn kho, sổ biến động, tổng phiếu nhập và phiên bản dữ liệu thủ công
+        Product.objects.filter(pk__in={product.pk for product in products.values()}).refresh_stock()
+        StockMovement.record(
+            [(batch.product_id, batch.pk, batch.remaining_quantity) for batch in batches],
+            'import',
+            import_order.import_code,
+        )
+        Import.objects.filter(pk=import_order.pk).refresh_totals()
+        schedule_inventory_version_bump()
+
+    return ImportResult(
+        rows=len(rows),
+        created_products=len(new_products),
+        elapsed=time.perf_counter() - started,
+    )
+
+
+def category_lookup():
+    """Danh sách danh mục (id, tên) và bảng tra id theo tên, một câu truy vấn cho mỗi lần gọi"""
+    categories = list(Category.objects.order_by('name').values_list('id', 'name'))
+    category_ids_by_name = {}
+    for pk, name in categories:
+        category_ids_by_name.setdefault(name, pk)
+    return categories, category_ids_by_name
+
+
+def import_item_from_values(values, data):
+    """Chuyển giá trị của một dòng đã kiểm tra thành dict cho bulk_import_rows"""
+    item = {
+        'product_name': values['product_name'],
+        'quantity': int(values['quantity']),
+        'import_price': Decimal(values['import_price']),
+        'selling_price': Decimal(values['selling_price']),
+        'unit': values['unit'],
+        'description': str(data.get('Mô tả') or ''),
+        'expiry_date': datetime.date.fromisoformat(values['expiry_date']),
+    }
+    # 'new' là tạo danh mục theo tên trong file Excel, còn lại là ID danh mục
+    if values['category'] == 'new':
+        item['category_name'] = str(data['Danh mục'])
+    else:
+        item['category_id'] = int(values['category'])
+    return item
+
+
+def collect_staged_rows(staged, category_ids_by_name, today):
+    """Gom các dòng chờ nhập được chọn thành dict cho bulk_import_rows.
+
+    Dòng đã sửa dùng giá trị đã kiểm tra khi lưu, dòng chưa sửa dùng dữ liệu Excel.
+    Trả về (rows, problem_rows) với problem_rows là số thứ tự các dòng còn lỗi.
+    """
+    rows = []
+    problem_rows = []
+    for row in staged.filter(include=True).iterator(chunk_size=STAGING_CHUNK_SIZE):
+        if row.values is not None:
+            values, issues = row.values, row.errors
+        else:
+            values, issues = StagedImportRowForm.initial_from_excel(row.data, category_ids_by_name, today)
+        if issues:
+            problem_rows.append(row.row_number)
+        else:
+            rows.append(import_item_from_values(values, row.data))
+    return rows, problem_rows
@@ -0,0 +1,361 @@
+import http.client
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from http.cookiejar import Cookie, CookieJar
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+
+from inventory.models import ORDER_TOTAL_FIELDS, Batch, Export, ExportItem, Import, StockMovement
+from products.models import Product
+from products.search import tokenize
+
+# Tỉ lệ các loại thao tác của một nhân viên ảo
+ACTION_WEIGHTS = {
+    'list': 30,
+    'search': 25,
+    'export_line': 25,
+    'import_line': 10,
+    'report': 10,
+}
+LIST_URLS = ['products:product_list', 'inventory:export_list', 'inventory:import_list']
+REPORT_URLS = ['reports:inventory_report', 'reports:import_export_report', 'reports:profit_report']
+# Số dòng trên một phiếu trước khi nhân viên ảo tạo phiếu mới
+LINES_PER_ORDER = 5
+LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1'}
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Không theo redirect: 302 sau khi POST là dấu hiệu form được chấp nhận"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _percentile(values, percent):
+    """Phân vị theo hạng gần nhất của danh sách đã sắp xếp"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, round(percent / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+class VirtualUser:
+    """Một nhân viên đăng nhập (cookie session riêng) gửi các thao tác ngẫu nhiên tới server.
+
+    Mỗi request được ghi vào samples: (thao tác, độ trễ giây, mã trạng thái hoặc tên lỗi,
+    bị từ chối). POST trả về 200 nghĩa là form hiện lại (ví dụ không đủ tồn kho).
+    """
+
+    def __init__(self, base_url, session_key, rng, products, words, timeout):
+        self.base_url = base_url
+        self.samples = []
+        self.rng = rng
+        self.products = products
+        self.words = words
+        self.timeout = timeout
+        self.jar = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.jar), _NoRedirect)
+        self._set_cookie(settings.SESSION_COOKIE_NAME, session_key)
+        self.export_url = None
+        self.export_lines = 0
+        self.import_url = None
+        self.import_lines = 0
+
+    def _set_cookie(self, name, value):
+        host = urllib.parse.urlsplit(self.base_url).hostname
+        # CookieJar so khớp tên máy không có dấu chấm dưới dạng "<tên>.local"
+        if '.' not in host:
+            host = f'{host}.local'
+        self.jar.set_cookie(Cookie(
+            0, name, value, None, False, host, False, False, '/', True, False, None, False, None, None, {},
+        ))
+
+    def _csrf_token(self):
+        for cookie in self.jar:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                return cookie.value
+        return ''
+
+    def request(self, action, path, data=None):
+        """Gửi GET (data None) hoặc POST; trả về (mã trạng thái, header Location), (None, None) nếu lỗi kết nối"""
+        started = time.monotonic()
+        try:
+            status, location = self._send(path, data)
+        except (OSError, http.client.HTTPException) as e:
+            self.samples.append((action, time.monotonic() - started, type(e).__name__, False))
+            return None, None
+        self.samples.append((action, time.monotonic() - started, status, data is not None and status == 200))
+        return status, location
+
+    def _send(self, path, data):
+        headers = {}
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['X-CSRFToken'] = self._csrf_token()
+            headers['Referer'] = self.base_url + path
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status, response.headers.get('Location')
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get('Location')
+
+    def _create_order(self, action, url_name, data):
+        """Tạo phiếu mới, trả về đường dẫn trang thêm sản phẩm của phiếu (None nếu lỗi)"""
+        path = reverse(url_name)
+        # Mở form trước để nhận cookie csrftoken như trình duyệt
+        self.request(action, path)
+        status, location = self.request(action, path, data)
+        if status != 302 or not location:
+            return None
+        return urllib.parse.urlsplit(location).path
+
+    def export_line(self):
+        if self.export_url is None or self.export_lines >= LINES_PER_ORDER:
+            self.export_url = self._create_order('export_create', 'inventory:export_create', {'customer': 'Khách tải thử'})
+            self.export_lines = 0
+            if self.export_url is None:
+                return
+        product_id, selling_price, _ = self.rng.choice(self.products)
+        self.request('export_line', self.export_url, {
+            'product': product_id,
+            'quantity': self.rng.randint(1, 3),
+            'unit_price': selling_price,
+            'discount_percent': 0,
+        })
+        self.export_lines += 1
+
+    def import_line(self):
+        if self.import_url is None or self.import_lines >= LINES_PER_ORDER:
+            self.import_url = self._create_order(
+                'import_create', 'inventory:import_create', {'supplier': 'Nhà cung cấp tải thử'}
+            )
+            self.import_lines = 0
+            if self.import_url is None:
+                return
+        product_id, _, purchase_price = self.rng.choice(self.products)
+        self.request('import_line', self.import_url, {
+            'product': product_id,
+            'quantity': self.rng.randint(5, 20),
+            'unit_price': purchase_price,
+            'expiry_date': '2030-12-31',
+        })
+        self.import_lines += 1
+
+    def list(self):
+        self.request('list', reverse(self.rng.choice(LIST_URLS)))
+
+    def search(self):
+        word = self.rng.choice(self.words)
+        if self.rng.random() < 0.5:
+            path = f"{reverse('products:product_list')}?{urllib.parse.urlencode({'search': word})}"
+        else:
+            path = f"{reverse('inventory:export_product_typeahead')}?{urllib.parse.urlencode({'q': word})}"
+        self.request('search', path)
+
+    def report(self):
+        self.request('report', reverse(self.rng.choice(REPORT_URLS)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Chạy N nhân viên ảo đồng thời (mỗi người một thread) vào server local: xem danh sách, tìm kiếm, "
+        "thêm dòng phiếu xuất (FIFO) và phiếu nhập, xem báo cáo; báo cáo throughput, độ trễ p50/p95/p99, "
+        "tỉ lệ lỗi và kiểm tra các ràng buộc tồn kho sau khi chạy"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Địa chỉ server local')
+        parser.add_argument('--users', type=int, default=10, help='Số nhân viên ảo')
+        parser.add_argument('--duration', type=float, default=30, help='Thời gian chạy (giây)')
+        parser.add_argument('--think-time', type=float, default=0, help='Thời gian nghỉ tối đa giữa hai thao tác (giây)')
+        parser.add_argument('--hot-products', type=int, default=50, help='Số sản phẩm được xuất/nhập (ít hơn thì tranh chấp lô nhiều hơn)')
+        parser.add_argument('--timeout', type=float, default=30, help='Timeout mỗi request (giây)')
+        parser.add_argument('--seed', type=int, default=42, help='Seed của các nhân viên ảo')
+        parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+
+    def handle(self, *args, **options):
+        base_url = options['url'].rstrip('/')
+        host = urllib.parse.urlsplit(base_url).hostname
+        # Các thao tác ghi dữ liệu thật (phiếu nhập/xuất) vào database của server
+        if host not in LOCAL_HOSTS:
+            raise CommandError(f'Chỉ chạy kiểm thử tải với server local, không phải {host}')
+        if options['users'] < 1 or options['duration'] <= 0:
+            raise CommandError('Số nhân viên ảo và thời gian chạy phải lớn hơn 0')
+
+        products = list(
+            Product.objects.filter(is_active=True, stock_quantity__gt=0, selling_price__isnull=False)
+            .order_by('-stock_quantity', 'pk')
+            .values_list('pk', 'selling_price', 'purchase_price')[:options['hot_products']]
+        )
+        if not products:
+            raise CommandError(
+                'Không có sản phẩm còn hàng để xuất; tạo dữ liệu trước (ví dụ dữ liệu giả lập của inventory.synthetic)'
+            )
+        products = [(pk, selling, purchase or selling) for pk, selling, purchase in products]
+        words = sorted({
+            token for name in Product.objects.filter(pk__in=[row[0] for row in products]).values_list('name', flat=True)
+            for token in tokenize(name) if len(token) > 2 and not token.isdigit()
+        }) or ['son']
+
+        users = self._virtual_users(base_url, options, products, words)
+        status, _ = users[0].request('dashboard', reverse('products:dashboard'))
+        if status != 200:
+            raise CommandError(
+                f'Server {base_url} không trả về trang chủ (HTTP {status}); server có đang chạy với cùng database không?'
+            )
+        users[0].samples.clear()
+
+        self.stdout.write(f"Chạy {options['users']} nhân viên ảo trong {options['duration']:.0f} giây vào {base_url}")
+        deadline = time.monotonic() + options['duration']
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=self._work, args=(user, deadline, options['think_time']))
+            for user in users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        samples = [sample for user in users for sample in user.samples]
+        report = self._summary(samples, elapsed, options['users'])
+        report['invariants'] = self._check_invariants()
+        self._print(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        violations = sum(len(rows) for rows in report['invariants'].values())
+        if violations:
+            raise CommandError(f"Có {violations} vi phạm ràng buộc tồn kho")
+        self.stdout.write(self.style.SUCCESS("Tồn kho, phân bổ FIFO, sổ biến động và tổng phiếu đều khớp"))
+
+    def _virtual_users(self, base_url, options, products, words):
+        """Tài khoản loadtest<N> đăng nhập sẵn bằng session (không tốn thời gian băm mật khẩu)"""
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        users = []
+        for number in range(options['users']):
+            user, _ = User.objects.get_or_create(username=f'loadtest{number}')
+            session = store()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.save()
+            rng = random.Random(options['seed'] + number)
+            users.append(VirtualUser(base_url, session.session_key, rng, products, words, options['timeout']))
+        return users
+
+    def _work(self, user, deadline, think_time):
+        actions = list(ACTION_WEIGHTS)
+        weights = list(ACTION_WEIGHTS.values())
+        while time.monotonic() < deadline:
+            getattr(user, user.rng.choices(actions, weights)[0])()
+            if think_time:
+                time.sleep(user.rng.uniform(0, think_time))
+
+    def _summary(self, samples, elapsed, user_count):
+        by_action = defaultdict(list)
+        for sample in samples:
+            by_action[sample[0]].append(sample)
+
+        def stats(rows):
+            latencies = sorted(latency * 1000 for _, latency, _, _ in rows)
+            errors = sum(1 for _, _, status, _ in rows if not isinstance(status, int) or status >= 400)
+            return {
+                'requests': len(rows),
+                'errors': errors,
+                'error_rate': round(errors / len(rows), 4) if rows else 0,
+                'rejected': sum(1 for row in rows if row[3]),
+                'p50_ms': round(_percentile(latencies, 50), 1),
+                'p95_ms': round(_percentile(latencies, 95), 1),
+                'p99_ms': round(_percentile(latencies, 99), 1),
+            }
+
+        return {
+            'users': user_count,
+            'duration_s': round(elapsed, 1),
+            'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0,
+            'total': stats(samples),
+            'actions': {name: stats(rows) for name, rows in sorted(by_action.items())},
+        }
+
+    def _check_invariants(self):
+        """Các dòng vi phạm ràng buộc tồn kho sau khi chạy (tối đa 20 dòng mỗi loại)"""
+        stock_drift = (
+            Product.objects
+            .annotate(actual_stock=Coalesce(Sum('batches__remaining_quantity', filter=Q(batches__is_active=True)), 0))
+            .exclude(stock_quantity=F('actual_stock'))
+            .values_list('code', 'stock_quantity', 'actual_stock')
+        )
+        bad_batches = (
+            Batch.objects.filter(Q(remaining_quantity__lt=0) | Q(remaining_quantity__gt=F('import_quantity')))
+            .values_list('batch_code', 'import_quantity', 'remaining_quantity')
+        )
+        # Dòng xuất tạo trước khi có ExportAllocation không có phân bổ nào, không tính là sai lệch
+        allocation_drift = (
+            ExportItem.objects
+            .annotate(allocated=Sum('allocations__quantity'))
+            .filter(allocated__isnull=False)
+            .exclude(quantity=F('allocated'))
+            .values_list('pk', 'quantity', 'allocated')
+        )
+        last_balance = (
+            StockMovement.objects.filter(product=OuterRef('pk'))
+            .order_by('-created_at', '-id')
+            .values('balance')[:1]
+        )
+        ledger_drift = (
+            Product.objects.annotate(ledger_balance=Subquery(last_balance))
+            .filter(ledger_balance__isnull=False)
+            .exclude(ledger_balance=F('stock_quantity'))
+            .values_list('code', 'stock_quantity', 'ledger_balance')
+        )
+        return {
+            'stock_quantity': [list(row) for row in stock_drift[:20]],
+            'batch_quantity': [list(row) for row in bad_batches[:20]],
+            'export_allocation': [list(row) for row in allocation_drift[:20]],
+            'stock_ledger': [list(row) for row in ledger_drift[:20]],
+            'import_totals': self._order_total_drift(Import, 'import_code'),
+            'export_totals': self._order_total_drift(Export, 'export_code'),
+        }
+
+    def _order_total_drift(self, model, code_field):
+        actual = {f'actual_{name}': expression for name, expression in model.objects.item_totals().items()}
+        mismatch = Q()
+        for name in ORDER_TOTAL_FIELDS:
+            mismatch |= ~Q(**{name: F(f'actual_{name}')})
+        rows = model.objects.annotate(**actual).filter(mismatch).values_list(code_field, 'total_amount', 'actual_total_amount')
+        return [[code, str(stored), str(computed)] for code, stored, computed in rows[:20]]
+
+    def _print(self, report):
+        total = report['total']
+        self.stdout.write(
+            f"\n{total['requests']} request trong {report['duration_s']} giây: {report['throughput_rps']} request/giây, "
+            f"lỗi {total['errors']} ({total['error_rate']:.2%}), bị từ chối {total['rejected']}"
+        )
+        self.stdout.write(f"{'Thao tác':<16}{'request':>9}{'lỗi':>7}{'từ chối':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, row in [*report['actions'].items(), ('tổng', total)]:
+            self.stdout.write(
+                f"{name:<16}{row['requests']:>9}{row['errors']:>7}{row['rejected']:>9}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            )
+        for name, rows in report['invariants'].items():
+            if rows:
+                self.stdout.write(self.style.ERROR(f"Vi phạm {name}: {rows[:5]}"))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q
+
+from inventory.models import ORDER_TOTAL_FIELDS, Export, Import
+
+
+class Command(BaseCommand):
+    help = "Kiểm tra và tính lại các cột tổng lưu sẵn của phiếu nhập/xuất từ các dòng chi tiết"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Chỉ kiểm tra, không ghi lại dữ liệu (thoát với mã lỗi nếu có sai lệch)',
+        )
+
+    def _drifted(self, model, code_field):
+        """Các phiếu có giá trị lưu sẵn khác với giá trị tính từ dòng chi tiết"""
+        actual = {f'actual_{name}': expression for name, expression in model.objects.item_totals().items()}
+        mismatch = Q()
+        for name in ORDER_TOTAL_FIELDS:
+            mismatch |= ~Q(**{name: F(f'actual_{name}')})
+        return list(
+            model.objects.annotate(**actual)
+            .filter(mismatch)
+            .values_list(code_field, 'total_amount', 'actual_total_amount')
+        )
+
+    def handle(self, *args, **options):
+        drifted = {
+            'phiếu nhập': self._drifted(Import, 'import_code'),
+            'phiếu xuất': self._drifted(Export, 'export_code'),
+        }
+        total_drifted = 0
+        for label, rows in drifted.items():
+            total_drifted += len(rows)
+            for code, stored, actual in rows[:20]:
+                self.stdout.write(f"  {label} {code}: lưu {stored}, thực tế {actual}")
+            if len(rows) > 20:
+                self.stdout.write(f"  ... và {len(rows) - 20} {label} khác")
+
+        if options['check']:
+            if total_drifted:
+                raise CommandError(f"Có {total_drifted} phiếu sai lệch tổng")
+            self.stdout.write(self.style.SUCCESS("Tổng lưu sẵn khớp với dòng chi tiết"))
+            return
+
+        with transaction.atomic():
+            updated = Import.objects.refresh_totals() + Export.objects.refresh_totals()
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã tính lại tổng cho {updated} phiếu ({total_drifted} phiếu bị sai lệch)"
+        ))
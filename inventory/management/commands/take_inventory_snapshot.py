@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory.models import InventorySnapshot
+
+
+class Command(BaseCommand):
+    help = "Lưu tồn kho và giá trị tồn của từng sản phẩm cho một ngày (chạy hằng đêm, chạy lại sẽ ghi đè)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Ngày của snapshot (YYYY-MM-DD), mặc định là hôm nay',
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        snapshot_date = today
+        if options['date']:
+            try:
+                snapshot_date = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Ngày không hợp lệ: {options['date']}")
+            # Snapshot ghi tồn kho hiện tại nên không thể ghi cho một ngày trong tương lai
+            if snapshot_date > today:
+                raise CommandError(f"Không thể lưu snapshot cho ngày trong tương lai: {snapshot_date}")
+
+        created, replaced = InventorySnapshot.take(snapshot_date)
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã lưu snapshot tồn kho ngày {snapshot_date:%d/%m/%Y} cho {created} sản phẩm"
+            + (f" (thay thế {replaced} dòng cũ)" if replaced else "")
+        ))
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Phiên bản')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Cập nhật lúc')),
+            ],
+            options={
+                'verbose_name': 'Phiên bản dữ liệu kho',
+                'verbose_name_plural': 'Phiên bản dữ liệu kho',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_inventory_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='Số lượng')),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='inventory.batch', verbose_name='Lô hàng')),
+                ('export_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='inventory.exportitem', verbose_name='Chi tiết xuất kho')),
+            ],
+            options={
+                'verbose_name': 'Phân bổ lô xuất kho',
+                'verbose_name_plural': 'Phân bổ lô xuất kho',
+            },
+        ),
+    ]
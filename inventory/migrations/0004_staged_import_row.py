@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_export_allocation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedImportRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload_id', models.UUIDField(verbose_name='Mã lần upload')),
+                ('row_number', models.PositiveIntegerField(verbose_name='Số thứ tự dòng')),
+                ('data', models.JSONField(verbose_name='Dữ liệu dòng')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Người tạo')),
+            ],
+            options={
+                'verbose_name': 'Dòng Excel chờ nhập',
+                'verbose_name_plural': 'Dòng Excel chờ nhập',
+                'ordering': ['upload_id', 'row_number'],
+                'constraints': [models.UniqueConstraint(fields=('upload_id', 'row_number'), name='unique_staged_import_row')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_staged_import_row'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stagedimportrow',
+            name='errors',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Lỗi kiểm tra'),
+        ),
+        migrations.AddField(
+            model_name='stagedimportrow',
+            name='include',
+            field=models.BooleanField(default=True, verbose_name='Được chọn'),
+        ),
+        migrations.AddField(
+            model_name='stagedimportrow',
+            name='values',
+            field=models.JSONField(blank=True, null=True, verbose_name='Giá trị đã chỉnh sửa'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:10
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+MONEY = models.DecimalField(max_digits=20, decimal_places=2)
+
+
+def _populate(order_model, item_model, order_field, line_total):
+    items = item_model.objects.filter(**{order_field: OuterRef('pk')}).order_by().values(order_field)
+
+    def total(expression, default, output_field):
+        subquery = Subquery(items.annotate(total=expression).values('total'), output_field=output_field)
+        return Coalesce(subquery, Value(default), output_field=output_field)
+
+    order_model.objects.update(
+        total_amount=total(Sum(line_total, output_field=MONEY), Decimal('0'), MONEY),
+        total_quantity=total(Sum('quantity'), 0, models.IntegerField()),
+        item_count=total(Count('pk'), 0, models.IntegerField()),
+    )
+
+
+def populate_order_totals(apps, schema_editor):
+    _populate(
+        apps.get_model('inventory', 'Import'),
+        apps.get_model('inventory', 'ImportItem'),
+        'import_order',
+        F('quantity') * F('unit_price'),
+    )
+    _populate(
+        apps.get_model('inventory', 'Export'),
+        apps.get_model('inventory', 'ExportItem'),
+        'export_order',
+        F('quantity') * F('unit_price') * (Value(100) - F('discount_percent')) / Value(100),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_staged_import_row_edits'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='item_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Số mặt hàng'),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='total_amount',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Tổng giá trị'),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='total_quantity',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Tổng số lượng'),
+        ),
+        migrations.AddField(
+            model_name='import',
+            name='item_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Số mặt hàng'),
+        ),
+        migrations.AddField(
+            model_name='import',
+            name='total_amount',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Tổng giá trị'),
+        ),
+        migrations.AddField(
+            model_name='import',
+            name='total_quantity',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Tổng số lượng'),
+        ),
+        migrations.AddIndex(
+            model_name='export',
+            index=models.Index(fields=['export_date', 'total_amount'], name='export_date_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='import',
+            index=models.Index(fields=['import_date', 'total_amount'], name='import_date_total_idx'),
+        ),
+        migrations.RunPython(populate_order_totals, migrations.RunPython.noop),
+    ]
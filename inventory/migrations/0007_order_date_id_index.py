@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_order_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='export',
+            index=models.Index(fields=['-export_date', '-id'], name='export_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='import',
+            index=models.Index(fields=['-import_date', '-id'], name='import_date_id_idx'),
+        ),
+    ]
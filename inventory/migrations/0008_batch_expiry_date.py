@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:23
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_product_expiry(apps, schema_editor):
+    Batch = apps.get_model('inventory', 'Batch')
+    Product = apps.get_model('products', 'Product')
+    Batch.objects.update(
+        expiry_date=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('expiry_date')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_order_date_id_index'),
+        ('products', '0009_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='expiry_date',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='Hạn sử dụng'),
+        ),
+        migrations.RunPython(copy_product_expiry, migrations.RunPython.noop),
+    ]
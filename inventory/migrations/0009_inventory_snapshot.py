@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_batch_expiry_date'),
+        ('products', '0009_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_date', models.DateField(verbose_name='Ngày')),
+                ('quantity', models.IntegerField(verbose_name='Tồn kho')),
+                ('stock_value', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Giá trị tồn (giá nhập)')),
+                ('batch_count', models.PositiveIntegerField(verbose_name='Số lô còn hàng')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='products.product', verbose_name='Sản phẩm')),
+            ],
+            options={
+                'verbose_name': 'Snapshot tồn kho',
+                'verbose_name_plural': 'Snapshot tồn kho',
+                'indexes': [models.Index(fields=['product', 'snapshot_date'], name='inventory_snapshot_product_idx')],
+                'constraints': [models.UniqueConstraint(fields=('snapshot_date', 'product'), name='inventory_snapshot_unique')],
+            },
+        ),
+    ]
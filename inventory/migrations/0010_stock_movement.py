@@ -0,0 +1,67 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def record_opening_balances(apps, schema_editor):
+    """Một dòng tồn đầu kỳ cho mỗi lô đang tính vào tồn kho, số dư cộng dồn theo sản phẩm"""
+    Batch = apps.get_model('inventory', 'Batch')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    now = timezone.now()
+    rows = (
+        Batch.objects.filter(is_active=True)
+        .exclude(remaining_quantity=0)
+        .order_by('product_id', 'import_date', 'id')
+        .values_list('product_id', 'id', 'remaining_quantity')
+    )
+    movements = []
+    product_id, balance = None, 0
+    for batch_product_id, batch_id, quantity in rows.iterator(chunk_size=2000):
+        if batch_product_id != product_id:
+            product_id, balance = batch_product_id, 0
+        balance += quantity
+        movements.append(StockMovement(
+            product_id=product_id,
+            batch_id=batch_id,
+            delta=quantity,
+            balance=balance,
+            reason='opening',
+            created_at=now,
+        ))
+        if len(movements) >= 1000:
+            StockMovement.objects.bulk_create(movements)
+            movements = []
+    StockMovement.objects.bulk_create(movements)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_inventory_snapshot'),
+        ('products', '0009_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField(verbose_name='Thay đổi')),
+                ('balance', models.IntegerField(verbose_name='Tồn kho sau biến động')),
+                ('reason', models.CharField(choices=[('opening', 'Tồn đầu kỳ'), ('import', 'Nhập kho'), ('export', 'Xuất kho'), ('export_cancel', 'Hủy xuất kho'), ('batch_delete', 'Xóa lô hàng'), ('adjustment', 'Điều chỉnh')], max_length=20, verbose_name='Lý do')),
+                ('document', models.CharField(blank=True, max_length=100, verbose_name='Chứng từ')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Thời điểm')),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='inventory.batch', verbose_name='Lô hàng')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='products.product', verbose_name='Sản phẩm')),
+            ],
+            options={
+                'verbose_name': 'Biến động tồn kho',
+                'verbose_name_plural': 'Biến động tồn kho',
+                'indexes': [models.Index(fields=['product', 'created_at', 'id'], name='stock_movement_product_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_stock_movement'),
+        ('jobs', '0002_job_files_in_database'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='import',
+            name='source_job',
+            field=models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_import', to='jobs.job', verbose_name='Công việc import'),
+        ),
+    ]
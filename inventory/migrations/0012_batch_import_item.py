@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:00
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def link_batches_to_items(apps, schema_editor):
+    """Gắn lô cũ với dòng nhập theo cách ghép trước đây (sản phẩm, ngày nhập, số lượng), mỗi lô một dòng"""
+    Batch = apps.get_model('inventory', 'Batch')
+    ImportItem = apps.get_model('inventory', 'ImportItem')
+    candidates = defaultdict(list)
+    for pk, product_id, import_date, quantity in (
+        Batch.objects.order_by('pk').values_list('pk', 'product_id', 'import_date', 'import_quantity').iterator()
+    ):
+        candidates[(product_id, import_date, quantity)].append(pk)
+    for key in candidates:
+        candidates[key].reverse()
+
+    links = []
+    items = ImportItem.objects.order_by('pk').values_list(
+        'pk', 'product_id', 'import_order__import_date', 'quantity'
+    )
+    for item_id, product_id, imported_at, quantity in items.iterator():
+        pks = candidates.get((product_id, imported_at.date(), quantity))
+        if pks:
+            links.append(Batch(pk=pks.pop(), import_item_id=item_id))
+    Batch.objects.bulk_update(links, ['import_item'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_import_source_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='import_item',
+            field=models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='batch', to='inventory.importitem', verbose_name='Dòng nhập kho'),
+        ),
+        migrations.RunPython(link_batches_to_items, migrations.RunPython.noop),
+    ]
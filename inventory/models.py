@@ -1,7 +1,72 @@
-from django.db import models
+import contextlib
+import contextvars
+import weakref
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
 from django.utils import timezone
-from products.models import Product
+from products.models import Product, Category, DocumentSequence
+
+# Lô hàng hết hạn trong số ngày này được coi là sắp hết hạn (9 tháng = 270 ngày)
+EXPIRY_WARNING_DAYS = 270
+
+# Các nhóm hạn sử dụng: (khóa, nhãn, từ ngày, đến ngày) tính từ hôm nay, None là không giới hạn
+EXPIRY_BUCKETS = [
+    ('expired', 'Đã hết hạn', None, -1),
+    ('0_3', '0–3 tháng', 0, 90),
+    ('3_6', '3–6 tháng', 91, 180),
+    ('6_9', '6–9 tháng', 181, EXPIRY_WARNING_DAYS),
+]
+
+
+class BatchQuerySet(models.QuerySet):
+    def in_stock(self):
+        """Lô hàng đang hoạt động và còn hàng"""
+        return self.filter(is_active=True, remaining_quantity__gt=0)
+
+    def expiry_summary(self, today=None):
+        """Số lô, số sản phẩm và số lượng còn theo nhóm hạn sử dụng, trong một câu truy vấn.
+
+        Trả về {'buckets': [...], 'batches', 'products', 'quantity'}, các số tổng
+        tính trên toàn bộ lô đã hết hạn hoặc hết hạn trong EXPIRY_WARNING_DAYS ngày.
+        """
+        today = today or timezone.now().date()
+        conditions = {}
+        for key, _, start, end in EXPIRY_BUCKETS:
+            condition = Q(expiry_date__lte=today + timezone.timedelta(days=end))
+            if start is not None:
+                condition &= Q(expiry_date__gte=today + timezone.timedelta(days=start))
+            conditions[key] = condition
+        conditions['total'] = Q(expiry_date__lte=today + timezone.timedelta(days=EXPIRY_WARNING_DAYS))
+
+        aggregates = {}
+        for key, condition in conditions.items():
+            aggregates[f'{key}_batches'] = Count('pk', filter=condition)
+            aggregates[f'{key}_products'] = Count('product', filter=condition, distinct=True)
+            aggregates[f'{key}_quantity'] = Coalesce(Sum('remaining_quantity', filter=condition), 0)
+        totals = self.aggregate(**aggregates)
+
+        return {
+            'buckets': [
+                {
+                    'key': key,
+                    'label': label,
+                    'batches': totals[f'{key}_batches'],
+                    'products': totals[f'{key}_products'],
+                    'quantity': totals[f'{key}_quantity'],
+                }
+                for key, label, _, _ in EXPIRY_BUCKETS
+            ],
+            'batches': totals['total_batches'],
+            'products': totals['total_products'],
+            'quantity': totals['total_quantity'],
+        }
+
 
 class Batch(models.Model):
     """Lô hàng - mỗi lần nhập kho tạo một lô mới"""
@@ -10,11 +75,20 @@ class Batch(models.Model):
     import_date = models.DateField(verbose_name="Ngày nhập")
     import_quantity = models.IntegerField(verbose_name="Số lượng nhập")
     remaining_quantity = models.IntegerField(verbose_name="Số lượng còn lại")
+    # Sao chép từ hạn sử dụng của sản phẩm khi nhập kho, để lọc/nhóm theo hạn dùng trong database
+    expiry_date = models.DateField(null=True, blank=True, db_index=True, verbose_name="Hạn sử dụng")
     is_active = models.BooleanField(default=True, verbose_name="Đang hoạt động")
+    # Dòng nhập kho đã tạo lô này, để sửa/xóa phiếu nhập đúng các lô của phiếu
+    import_item = models.OneToOneField(
+        'ImportItem', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='batch', verbose_name="Dòng nhập kho",
+    )
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Người tạo")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = BatchQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Lô hàng"
         verbose_name_plural = "Lô hàng"
@@ -27,7 +101,34 @@ class Batch(models.Model):
         # Tự động tạo mã lô hàng nếu chưa có
         if not self.batch_code:
             self.batch_code = self.generate_batch_code()
-        super().save(*args, **kwargs)
+        # Lô mới nhận hạn sử dụng hiện tại của sản phẩm
+        if self._state.adding and self.expiry_date is None and self.product_id:
+            self.expiry_date = self.product.expiry_date
+        adding = self._state.adding
+        # Tồn kho của sản phẩm và sổ biến động được cập nhật trong cùng transaction (xem sync_product_stock)
+        with transaction.atomic():
+            # Khóa sản phẩm trước lô hàng, cùng thứ tự với xuất kho (allocate_fifo)
+            Product.objects.filter(pk=self.product_id).lock_for_update()
+            previous = 0 if adding else self._stored_counted_quantity()
+            super().save(*args, **kwargs)
+            StockMovement.record(
+                [(self.product_id, self.pk, self.counted_quantity - previous)],
+                'import' if adding else 'adjustment',
+            )
+
+    @property
+    def counted_quantity(self):
+        """Số lượng của lô được tính vào tồn kho sản phẩm (lô ngừng hoạt động không tính)"""
+        return self.remaining_quantity if self.is_active else 0
+
+    def _stored_counted_quantity(self):
+        row = (
+            Batch.objects.select_for_update()
+            .filter(pk=self.pk)
+            .values_list('remaining_quantity', 'is_active')
+            .first()
+        )
+        return row[0] if row and row[1] else 0
 
     def generate_batch_code(self):
         """Tự động tạo mã lô hàng"""
@@ -39,27 +140,14 @@ class Batch(models.Model):
         # Lấy năm hiện tại
         current_year = datetime.datetime.now().year
         
-        # Tìm số thứ tự tiếp theo trong năm
-        existing_batches = Batch.objects.filter(
-            batch_code__startswith=f"{product_prefix}{current_year}"
-        ).count()
-        
-        # Tạo mã mới: PRODUCT + YEAR + SEQUENCE (3 chữ số)
-        sequence = existing_batches + 1
-        return f"{product_prefix}{current_year}{sequence:03d}"
+        # Lấy số thứ tự tiếp theo từ bộ đếm: PRODUCT + YEAR + SEQUENCE (3 chữ số)
+        return DocumentSequence.next_code("batch", product_prefix, current_year)
 
     @property
     def import_price(self):
         """Lấy giá nhập từ sản phẩm"""
         return self.product.purchase_price or 0
 
-    @property
-    def expiry_date(self):
-        """Lấy hạn sử dụng từ sản phẩm"""
-        if self.product and self.product.expiry_date:
-            return self.product.expiry_date
-        return None
-
     @property
     def is_expired(self):
         """Kiểm tra lô hàng đã hết hạn chưa"""
@@ -71,7 +159,7 @@ class Batch(models.Model):
     def is_expiring_soon(self):
         """Kiểm tra lô hàng sắp hết hạn (9 tháng)"""
         if self.expiry_date:
-            nine_months_from_now = timezone.now().date() + timezone.timedelta(days=270)  # 9 tháng = 270 ngày
+            nine_months_from_now = timezone.now().date() + timezone.timedelta(days=EXPIRY_WARNING_DAYS)
             return self.expiry_date <= nine_months_from_now
         return False
 
@@ -85,6 +173,66 @@ class Batch(models.Model):
         """Tổng giá trị lô hàng"""
         return self.import_price * self.remaining_quantity
 
+MONEY = models.DecimalField(max_digits=20, decimal_places=2)
+
+
+def import_item_total(prefix=''):
+    """Biểu thức SQL của ImportItem.total_price, prefix là đường dẫn tới ImportItem"""
+    return F(f'{prefix}quantity') * F(f'{prefix}unit_price')
+
+
+def export_item_total(prefix=''):
+    """Biểu thức SQL của ExportItem.total_price (sau giảm giá), prefix là đường dẫn tới ExportItem"""
+    return (
+        F(f'{prefix}quantity') * F(f'{prefix}unit_price')
+        * (Value(100) - F(f'{prefix}discount_percent')) / Value(100)
+    )
+
+
+# Các cột tổng lưu sẵn trên phiếu nhập/xuất, được duy trì từ các dòng chi tiết
+ORDER_TOTAL_FIELDS = ('total_amount', 'total_quantity', 'item_count')
+
+
+class OrderQuerySet(models.QuerySet):
+    """Phiếu nhập/xuất với các cột tổng lưu sẵn (total_amount, total_quantity, item_count)"""
+    item_total = None
+
+    def item_totals(self):
+        """Biểu thức subquery tính các cột tổng từ các dòng chi tiết, theo tên cột"""
+        relation = self.model._meta.get_field('items')
+        items = (
+            relation.related_model.objects.filter(**{relation.field.name: OuterRef('pk')})
+            .order_by()
+            .values(relation.field.name)
+        )
+
+        def total(expression, default, output_field):
+            subquery = Subquery(items.annotate(total=expression).values('total'), output_field=output_field)
+            return Coalesce(subquery, Value(default), output_field=output_field)
+
+        return {
+            'total_amount': total(Sum(self.item_total(), output_field=MONEY), Decimal('0'), MONEY),
+            'total_quantity': total(Sum('quantity'), 0, models.IntegerField()),
+            'item_count': total(Count('pk'), 0, models.IntegerField()),
+        }
+
+    def refresh_totals(self):
+        """Tính lại các cột tổng từ các dòng chi tiết (một câu UPDATE)"""
+        return self.update(**self.item_totals())
+
+    def total_value(self):
+        """Tổng giá trị của tất cả các phiếu trong queryset"""
+        return self.aggregate(total=Coalesce(Sum('total_amount'), Value(Decimal('0')), output_field=MONEY))['total']
+
+
+class ImportQuerySet(OrderQuerySet):
+    item_total = staticmethod(import_item_total)
+
+
+class ExportQuerySet(OrderQuerySet):
+    item_total = staticmethod(export_item_total)
+
+
 class Import(models.Model):
     """Phiếu nhập kho"""
     import_code = models.CharField(max_length=50, unique=True, verbose_name="Mã phiếu nhập")
@@ -94,11 +242,27 @@ class Import(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Người tạo")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Tổng lưu sẵn, được cập nhật cùng transaction với mọi thay đổi của ImportItem (xem sync_import_totals)
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0, db_index=True, editable=False, verbose_name="Tổng giá trị")
+    total_quantity = models.IntegerField(default=0, editable=False, verbose_name="Tổng số lượng")
+    item_count = models.IntegerField(default=0, editable=False, verbose_name="Số mặt hàng")
+    # Công việc import Excel đã tạo phiếu này; unique để chạy lại công việc không tạo phiếu thứ hai
+    source_job = models.OneToOneField(
+        'jobs.Job', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='created_import', verbose_name="Công việc import",
+    )
+
+    objects = ImportQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Phiếu nhập kho"
         verbose_name_plural = "Phiếu nhập kho"
         ordering = ['-import_date']
+        indexes = [
+            models.Index(fields=['import_date', 'total_amount'], name='import_date_total_idx'),
+            # Phân trang theo con trỏ trên danh sách phiếu (products.pagination)
+            models.Index(fields=['-import_date', '-id'], name='import_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"PN{self.import_code} - {self.import_date.strftime('%d/%m/%Y')}"
@@ -107,6 +271,12 @@ class Import(models.Model):
         # Tự động tạo mã phiếu nhập nếu chưa có
         if not self.import_code:
             self.import_code = self.generate_import_code()
+        # Không ghi đè các cột tổng bằng giá trị cũ trong bộ nhớ, các cột này do ImportItem duy trì
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ORDER_TOTAL_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def generate_import_code(self):
@@ -116,19 +286,9 @@ class Import(models.Model):
         # Lấy năm hiện tại
         current_year = datetime.datetime.now().year
         
-        # Tìm số thứ tự tiếp theo trong năm
-        existing_imports = Import.objects.filter(
-            import_code__startswith=f"PN{current_year}"
-        ).count()
-        
-        # Tạo mã mới: PN + YEAR + SEQUENCE (3 chữ số)
-        sequence = existing_imports + 1
-        return f"PN{current_year}{sequence:03d}"
+        # Lấy số thứ tự tiếp theo từ bộ đếm: PN + YEAR + SEQUENCE (3 chữ số)
+        return DocumentSequence.next_code("import", "PN", current_year)
 
-    @property
-    def total_amount(self):
-        """Tổng giá trị phiếu nhập"""
-        return sum(item.total_price for item in self.items.all())
 
 class ImportItem(models.Model):
     """Chi tiết phiếu nhập kho"""
@@ -150,6 +310,11 @@ class ImportItem(models.Model):
         """Tổng giá trị của item"""
         return self.quantity * self.unit_price
 
+    def save(self, *args, **kwargs):
+        # Tổng của phiếu nhập được cập nhật trong cùng transaction (xem sync_import_totals)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 class Export(models.Model):
     """Phiếu xuất kho"""
     export_code = models.CharField(max_length=50, unique=True, verbose_name="Mã phiếu xuất")
@@ -159,11 +324,22 @@ class Export(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Người tạo")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Tổng lưu sẵn, được cập nhật cùng transaction với mọi thay đổi của ExportItem (xem sync_export_totals)
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0, db_index=True, editable=False, verbose_name="Tổng giá trị")
+    total_quantity = models.IntegerField(default=0, editable=False, verbose_name="Tổng số lượng")
+    item_count = models.IntegerField(default=0, editable=False, verbose_name="Số mặt hàng")
+
+    objects = ExportQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Phiếu xuất kho"
         verbose_name_plural = "Phiếu xuất kho"
         ordering = ['-export_date']
+        indexes = [
+            models.Index(fields=['export_date', 'total_amount'], name='export_date_total_idx'),
+            # Phân trang theo con trỏ trên danh sách phiếu (products.pagination)
+            models.Index(fields=['-export_date', '-id'], name='export_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"PX{self.export_code} - {self.export_date.strftime('%d/%m/%Y')}"
@@ -172,6 +348,12 @@ class Export(models.Model):
         # Tự động tạo mã phiếu xuất nếu chưa có
         if not self.export_code:
             self.export_code = self.generate_export_code()
+        # Không ghi đè các cột tổng bằng giá trị cũ trong bộ nhớ, các cột này do ExportItem duy trì
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ORDER_TOTAL_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def generate_export_code(self):
@@ -181,19 +363,9 @@ class Export(models.Model):
         # Lấy năm hiện tại
         current_year = datetime.datetime.now().year
         
-        # Tìm số thứ tự tiếp theo trong năm
-        existing_exports = Export.objects.filter(
-            export_code__startswith=f"PX{current_year}"
-        ).count()
-        
-        # Tạo mã mới: PX + YEAR + SEQUENCE (3 chữ số)
-        sequence = existing_exports + 1
-        return f"PX{current_year}{sequence:03d}"
+        # Lấy số thứ tự tiếp theo từ bộ đếm: PX + YEAR + SEQUENCE (3 chữ số)
+        return DocumentSequence.next_code("export", "PX", current_year)
 
-    @property
-    def total_amount(self):
-        """Tổng giá trị phiếu xuất"""
-        return sum(item.total_price for item in self.items.all())
 
 class ExportItem(models.Model):
     """Chi tiết phiếu xuất kho"""
@@ -232,4 +404,321 @@ class ExportItem(models.Model):
         #         raise ValueError("Số lượng xuất không được vượt quá số lượng còn lại")
         #     self.batch.remaining_quantity -= self.quantity
         #     self.batch.save()
-        super().save(*args, **kwargs) 
\ No newline at end of file
+        # Tổng của phiếu xuất được cập nhật trong cùng transaction (xem sync_export_totals)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+class ExportAllocation(models.Model):
+    """Số lượng thực tế lấy từ từng lô hàng cho một dòng xuất kho (FIFO)"""
+    export_item = models.ForeignKey(ExportItem, on_delete=models.CASCADE, related_name='allocations', verbose_name="Chi tiết xuất kho")
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='allocations', verbose_name="Lô hàng")
+    quantity = models.IntegerField(verbose_name="Số lượng")
+
+    class Meta:
+        verbose_name = "Phân bổ lô xuất kho"
+        verbose_name_plural = "Phân bổ lô xuất kho"
+
+    def __str__(self):
+        return f"{self.batch.batch_code} - {self.quantity}"
+
+class StagedImportRow(models.Model):
+    """Dòng dữ liệu Excel đã đọc, chờ người dùng xác nhận nhập kho"""
+    upload_id = models.UUIDField(verbose_name="Mã lần upload")
+    row_number = models.PositiveIntegerField(verbose_name="Số thứ tự dòng")
+    data = models.JSONField(verbose_name="Dữ liệu dòng")
+    # Giá trị người dùng đã sửa trên bảng xác nhận (None: chưa sửa, dùng dữ liệu Excel)
+    values = models.JSONField(null=True, blank=True, verbose_name="Giá trị đã chỉnh sửa")
+    errors = models.JSONField(default=dict, blank=True, verbose_name="Lỗi kiểm tra")
+    include = models.BooleanField(default=True, verbose_name="Được chọn")
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Người tạo")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Dòng Excel chờ nhập"
+        verbose_name_plural = "Dòng Excel chờ nhập"
+        ordering = ['upload_id', 'row_number']
+        constraints = [
+            models.UniqueConstraint(fields=['upload_id', 'row_number'], name='unique_staged_import_row'),
+        ]
+
+    def __str__(self):
+        return f"{self.upload_id} #{self.row_number}"
+
+    @classmethod
+    def purge_stale(cls, max_age_days=1):
+        """Xóa các lần upload bị bỏ dở quá lâu"""
+        cutoff = timezone.now() - timezone.timedelta(days=max_age_days)
+        return cls.objects.filter(created_at__lt=cutoff).delete()
+
+_stock_document = contextvars.ContextVar('stock_document', default='')
+
+@contextlib.contextmanager
+def stock_document(document):
+    """Gắn mã chứng từ (phiếu nhập/xuất) cho các biến động tồn kho ghi trong khối lệnh"""
+    token = _stock_document.set(document)
+    try:
+        yield
+    finally:
+        _stock_document.reset(token)
+
+class StockMovementQuerySet(models.QuerySet):
+    def balance_at(self, product, when):
+        """Tồn kho của sản phẩm tại thời điểm when: số dư của biến động cuối cùng không muộn hơn when"""
+        return (
+            self.filter(product=product, created_at__lte=when)
+            .order_by('-created_at', '-id')
+            .values_list('balance', flat=True)
+            .first()
+        ) or 0
+
+class StockMovement(models.Model):
+    """Sổ biến động tồn kho, chỉ ghi thêm.
+
+    Mỗi thay đổi số lượng tính vào tồn kho của một lô là một dòng, balance là
+    tồn kho của sản phẩm ngay sau biến động đó, nên tồn kho tại một thời điểm là
+    một lần tra index (product, created_at) thay vì cộng dồn lịch sử.
+    """
+    REASON_CHOICES = [
+        ('opening', 'Tồn đầu kỳ'),
+        ('import', 'Nhập kho'),
+        ('export', 'Xuất kho'),
+        ('export_cancel', 'Hủy xuất kho'),
+        ('batch_delete', 'Xóa lô hàng'),
+        ('adjustment', 'Điều chỉnh'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements', verbose_name="Sản phẩm")
+    # Lô bị xóa vẫn giữ lại lịch sử biến động
+    batch = models.ForeignKey(Batch, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements', verbose_name="Lô hàng")
+    delta = models.IntegerField(verbose_name="Thay đổi")
+    balance = models.IntegerField(verbose_name="Tồn kho sau biến động")
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, verbose_name="Lý do")
+    document = models.CharField(max_length=100, blank=True, verbose_name="Chứng từ")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Thời điểm")
+
+    objects = StockMovementQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Biến động tồn kho"
+        verbose_name_plural = "Biến động tồn kho"
+        indexes = [
+            models.Index(fields=['product', 'created_at', 'id'], name='stock_movement_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.delta:+d} -> {self.balance}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Sổ biến động tồn kho chỉ được ghi thêm, không sửa dòng đã ghi')
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def record(cls, changes, reason, document=None):
+        """Ghi các biến động [(product_id, batch_id, delta)], bỏ qua delta bằng 0.
+
+        Phải được gọi trong transaction, sau khi Product.stock_quantity đã được tính
+        lại: số dư cuối của mỗi sản phẩm bằng tồn kho lưu sẵn (dòng sản phẩm đang bị
+        khóa bởi câu UPDATE đó), số dư từng dòng được suy ngược theo thứ tự.
+        """
+        changes = [change for change in changes if change[2]]
+        if not changes:
+            return []
+        if document is None:
+            document = _stock_document.get()
+        stock = dict(
+            Product.objects.filter(pk__in={product_id for product_id, _, _ in changes})
+            .values_list('pk', 'stock_quantity')
+        )
+        balances = {
+            product_id: quantity - sum(delta for changed, _, delta in changes if changed == product_id)
+            for product_id, quantity in stock.items()
+        }
+        now = timezone.now()
+        movements = []
+        for product_id, batch_id, delta in changes:
+            if product_id not in balances:
+                continue
+            balances[product_id] += delta
+            movements.append(cls(
+                product_id=product_id,
+                batch_id=batch_id,
+                delta=delta,
+                balance=balances[product_id],
+                reason=reason,
+                document=document[:100],
+                created_at=now,
+            ))
+        return cls.objects.bulk_create(movements)
+
+class InventoryVersion(models.Model):
+    """Phiên bản dữ liệu kho toàn cục, tăng sau mỗi thay đổi tồn kho/phiếu nhập xuất.
+
+    Dùng làm khóa cache cho các dữ liệu tổng hợp (ví dụ snapshot dashboard).
+    """
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Phiên bản")
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name="Cập nhật lúc")
+
+    class Meta:
+        verbose_name = "Phiên bản dữ liệu kho"
+        verbose_name_plural = "Phiên bản dữ liệu kho"
+
+    def __str__(self):
+        return f"v{self.version}"
+
+    @classmethod
+    def current(cls):
+        """Phiên bản hiện tại (0 nếu chưa có thay đổi nào)"""
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def state(cls):
+        """(phiên bản, thời điểm thay đổi cuối) trong một câu truy vấn; (0, None) nếu chưa có thay đổi"""
+        return cls.objects.filter(pk=1).values_list('version', 'updated_at').first() or (0, None)
+
+    @classmethod
+    def bump(cls):
+        """Tăng phiên bản bằng một câu UPDATE nguyên tử"""
+        updated = cls.objects.filter(pk=1).update(version=F('version') + 1, updated_at=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(pk=1, defaults={'version': 1})
+
+class InventorySnapshotQuerySet(models.QuerySet):
+    def as_of(self, day):
+        """Các dòng của snapshot gần nhất không muộn hơn ngày day (một câu truy vấn theo index ngày)"""
+        latest = (
+            InventorySnapshot.objects.filter(snapshot_date__lte=day)
+            .order_by('-snapshot_date')
+            .values('snapshot_date')[:1]
+        )
+        return self.filter(snapshot_date=Subquery(latest))
+
+class InventorySnapshot(models.Model):
+    """Tồn kho cuối ngày của từng sản phẩm, ghi bởi lệnh take_inventory_snapshot.
+
+    Chỉ lưu sản phẩm còn tồn kho; sản phẩm không có dòng trong một ngày snapshot
+    có tồn kho bằng 0 vào ngày đó.
+    """
+    snapshot_date = models.DateField(verbose_name="Ngày")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='snapshots', verbose_name="Sản phẩm")
+    quantity = models.IntegerField(verbose_name="Tồn kho")
+    stock_value = models.DecimalField(max_digits=15, decimal_places=2, verbose_name="Giá trị tồn (giá nhập)")
+    batch_count = models.PositiveIntegerField(verbose_name="Số lô còn hàng")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = InventorySnapshotQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Snapshot tồn kho"
+        verbose_name_plural = "Snapshot tồn kho"
+        constraints = [
+            models.UniqueConstraint(fields=['snapshot_date', 'product'], name='inventory_snapshot_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'snapshot_date'], name='inventory_snapshot_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.snapshot_date} - {self.product_id}: {self.quantity}"
+
+    @classmethod
+    def take(cls, snapshot_date, batch_size=1000):
+        """Ghi tồn kho hiện tại với ngày snapshot_date, thay thế snapshot cũ cùng ngày.
+
+        Trả về (số dòng đã ghi, số dòng cũ bị thay thế). Xóa và ghi lại trong
+        cùng transaction nên chạy lại nhiều lần cho cùng một ngày vẫn cho một bộ dữ liệu.
+        """
+        batch_count = Count('batches', filter=Q(batches__is_active=True, batches__remaining_quantity__gt=0))
+        rows = (
+            Product.objects.exclude(stock_quantity=0)
+            .annotate(batch_count=batch_count)
+            .order_by('pk')
+            .values_list('pk', 'stock_quantity', 'purchase_price', 'batch_count')
+        )
+        with transaction.atomic():
+            replaced, _ = cls.objects.filter(snapshot_date=snapshot_date).delete()
+            created = 0
+            snapshots = []
+            for product_id, quantity, purchase_price, batches in rows.iterator(chunk_size=batch_size):
+                snapshots.append(cls(
+                    snapshot_date=snapshot_date,
+                    product_id=product_id,
+                    quantity=quantity,
+                    stock_value=(purchase_price or 0) * quantity,
+                    batch_count=batches,
+                ))
+                if len(snapshots) >= batch_size:
+                    cls.objects.bulk_create(snapshots)
+                    created += len(snapshots)
+                    snapshots = []
+            cls.objects.bulk_create(snapshots)
+            created += len(snapshots)
+        return created, replaced
+
+def schedule_inventory_version_bump():
+    """Tăng phiên bản sau khi transaction hiện tại commit (tối đa một lần mỗi transaction).
+
+    Connection chỉ giữ weakref tới callback đang chờ: callback tự xóa cờ khi chạy,
+    còn khi transaction (hoặc savepoint) rollback Django bỏ callback nên weakref
+    hết hiệu lực và lần gọi sau đăng ký lại.
+    """
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'pending_inventory_bump', None)
+    if pending is not None and pending() is not None:
+        return
+
+    def bump():
+        connection.pending_inventory_bump = None
+        InventoryVersion.bump()
+
+    connection.pending_inventory_bump = weakref.ref(bump)
+    transaction.on_commit(bump, robust=True)
+
+@receiver(pre_delete, sender=Batch)
+def lock_batch_product(sender, instance, **kwargs):
+    """Khóa sản phẩm trước khi xóa lô hàng, cùng thứ tự khóa với xuất kho"""
+    Product.objects.filter(pk=instance.product_id).lock_for_update()
+
+@receiver(post_save, sender=Batch)
+@receiver(post_delete, sender=Batch)
+def sync_product_stock(sender, instance, **kwargs):
+    """Đồng bộ tồn kho lưu sẵn của sản phẩm khi lô hàng thay đổi"""
+    Product.objects.filter(pk=instance.product_id).refresh_stock()
+
+@receiver(post_delete, sender=Batch)
+def record_batch_delete(sender, instance, origin=None, **kwargs):
+    """Ghi biến động khi xóa lô hàng (sau sync_product_stock); bỏ qua khi xóa cả sản phẩm"""
+    origin_model = getattr(origin, 'model', type(origin))
+    if origin_model is Product:
+        return
+    StockMovement.record([(instance.product_id, None, -instance.counted_quantity)], 'batch_delete')
+
+@receiver(post_save, sender=ImportItem)
+@receiver(post_delete, sender=ImportItem)
+def sync_import_totals(sender, instance, **kwargs):
+    """Đồng bộ các cột tổng của phiếu nhập khi dòng chi tiết thay đổi"""
+    Import.objects.filter(pk=instance.import_order_id).refresh_totals()
+
+@receiver(post_save, sender=ExportItem)
+@receiver(post_delete, sender=ExportItem)
+def sync_export_totals(sender, instance, **kwargs):
+    """Đồng bộ các cột tổng của phiếu xuất khi dòng chi tiết thay đổi"""
+    Export.objects.filter(pk=instance.export_order_id).refresh_totals()
+
+@receiver(post_save, sender=Batch)
+@receiver(post_delete, sender=Batch)
+@receiver(post_save, sender=Import)
+@receiver(post_delete, sender=Import)
+@receiver(post_save, sender=ImportItem)
+@receiver(post_delete, sender=ImportItem)
+@receiver(post_save, sender=Export)
+@receiver(post_delete, sender=Export)
+@receiver(post_save, sender=ExportItem)
+@receiver(post_delete, sender=ExportItem)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_inventory_version(sender, **kwargs):
+    """Làm mới phiên bản dữ liệu kho để các cache tổng hợp được tính lại"""
+    schedule_inventory_version_bump()
@@ -0,0 +1,237 @@
+"""Sinh dữ liệu kho giả lập, cố định theo seed, cho benchmark và kiểm thử tải.
+
+Toàn bộ dữ liệu được chèn bằng bulk_create theo lô nên không đi qua save() và
+signal: việc trừ tồn kho theo các dòng xuất được tính trước trong bộ nhớ, lô
+hàng được chèn với số lượng còn lại cuối cùng. Sau đó tồn kho lưu sẵn, tổng
+phiếu, từ khóa tìm kiếm, sổ biến động (tồn đầu kỳ), snapshot hôm nay và phiên
+bản dữ liệu được đồng bộ như khi dữ liệu được tạo qua giao diện.
+
+Chỉ dùng trên database trống (database test); mã chứng từ bắt đầu bằng
+SYNTHETIC_PREFIX và không lấy từ DocumentSequence.
+"""
+import datetime
+import random
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Category, Product
+from products.search import build_search_text, index_products
+from .models import (
+    Batch, Export, ExportAllocation, ExportItem, Import, ImportItem, InventorySnapshot, InventoryVersion,
+    StockMovement,
+)
+
+SYNTHETIC_PREFIX = 'SYN'
+CHUNK_SIZE = 5000
+IMPORT_LINES_PER_ORDER = 20
+EXPORT_LINES_PER_ORDER = 10
+# Dữ liệu trải đều trong khoảng này (ngày) trước hôm nay
+HISTORY_DAYS = 365
+
+CATEGORY_NAMES = [
+    'Son môi', 'Kem dưỡng', 'Sữa rửa mặt', 'Serum', 'Nước hoa', 'Mặt nạ', 'Kem chống nắng', 'Phấn phủ',
+    'Tẩy trang', 'Dầu gội', 'Sữa tắm', 'Toner', 'Kẻ mắt', 'Mascara', 'Phấn má', 'Dưỡng thể',
+]
+NAME_WORDS = [
+    'hoa hồng', 'trà xanh', 'nha đam', 'vitamin C', 'collagen', 'than tre', 'ngọc trai', 'cam thảo',
+    'dầu dừa', 'mật ong', 'bơ hạt mỡ', 'rau má', 'nghệ', 'cà phê', 'tảo biển', 'hoa cúc',
+]
+BRANDS = ['Lan', 'Mai', 'Sen', 'Cúc', 'Đào', 'Huệ', 'Vy', 'An']
+
+
+@dataclass
+class SyntheticScale:
+    products: int = 20000
+    batches: int = 200000
+    export_lines: int = 100000
+    seed: int = 42
+
+
+def _chunks(sequence, size=CHUNK_SIZE):
+    for start in range(0, len(sequence), size):
+        yield start, sequence[start:start + size]
+
+
+def _ids_by_code(model, field, prefix):
+    """Id của các dòng có mã bắt đầu bằng prefix, theo thứ tự mã (mã được đánh số có độ dài cố định)"""
+    return list(
+        model.objects.filter(**{f'{field}__startswith': prefix})
+        .order_by(field)
+        .values_list('pk', flat=True)
+    )
+
+
+def build_catalog(scale, user=None, stdout=None):
+    """Tạo danh mục, sản phẩm, phiếu nhập/lô hàng và phiếu xuất theo scale; trả về số dòng đã tạo"""
+    rng = random.Random(scale.seed)
+    today = timezone.localdate()
+    now = timezone.now()
+    if user is None:
+        user, _ = User.objects.get_or_create(username='synthetic')
+
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    with transaction.atomic():
+        Category.objects.bulk_create([Category(name=name) for name in CATEGORY_NAMES])
+        categories = list(Category.objects.filter(name__in=CATEGORY_NAMES).order_by('pk'))
+
+        # Sản phẩm: tên tiếng Việt có dấu để tìm kiếm có ý nghĩa; khoảng 5% ngừng kinh doanh
+        product_rows = []
+        for index in range(scale.products):
+            category = categories[index % len(categories)]
+            purchase_price = Decimal(rng.randrange(20, 800) * 1000)
+            product_rows.append(Product(
+                code=f'{SYNTHETIC_PREFIX}SP{index:07d}',
+                name=f'{category.name} {rng.choice(NAME_WORDS)} {rng.choice(BRANDS)} {index}',
+                category=category,
+                unit=rng.choice(Product.UNIT_CHOICES)[0],
+                purchase_price=purchase_price,
+                selling_price=purchase_price * Decimal('1.4'),
+                expiry_date=today + datetime.timedelta(days=rng.randint(-60, 900)),
+                is_active=rng.random() > 0.05,
+            ))
+        for product in product_rows:
+            product.search_text = build_search_text(product, product.category.name)
+        for _, chunk in _chunks(product_rows):
+            Product.objects.bulk_create(chunk)
+        product_ids = _ids_by_code(Product, 'code', f'{SYNTHETIC_PREFIX}SP')
+        for _, chunk in _chunks(product_ids, 1000):
+            index_products(chunk)
+        log(f'  {len(product_ids)} sản phẩm')
+
+        # Lô hàng: lô thứ i thuộc sản phẩm i % số sản phẩm; số lượng còn lại tính sau các dòng xuất
+        batch_product = [index % scale.products for index in range(scale.batches)]
+        batch_quantity = [rng.randint(10, 200) for _ in range(scale.batches)]
+        batch_day = [rng.randrange(HISTORY_DAYS) for _ in range(scale.batches)]
+        remaining = list(batch_quantity)
+
+        export_lines = []
+        for _ in range(scale.export_lines):
+            index = rng.randrange(scale.batches)
+            # Lô đã hết thì lấy lô kế tiếp còn hàng
+            for _attempt in range(20):
+                if remaining[index]:
+                    break
+                index = (index + 1) % scale.batches
+            quantity = min(rng.randint(1, 10), remaining[index])
+            if not quantity:
+                continue
+            remaining[index] -= quantity
+            export_lines.append((index, quantity, rng.choice((0, 0, 0, 5, 10))))
+
+        import_count = -(-scale.batches // IMPORT_LINES_PER_ORDER)
+        Import.objects.bulk_create([
+            Import(
+                import_code=f'{SYNTHETIC_PREFIX}PN{number:07d}',
+                import_date=now - datetime.timedelta(days=rng.randrange(HISTORY_DAYS), minutes=rng.randrange(1440)),
+                supplier=f'Nhà cung cấp {number % 50}',
+                created_by=user,
+            )
+            for number in range(import_count)
+        ], batch_size=1000)
+        import_ids = _ids_by_code(Import, 'import_code', f'{SYNTHETIC_PREFIX}PN')
+
+        synthetic_products = Product.objects.filter(code__startswith=f'{SYNTHETIC_PREFIX}SP')
+        prices = dict(synthetic_products.values_list('pk', 'purchase_price'))
+        expiry = dict(synthetic_products.values_list('pk', 'expiry_date'))
+        for _, chunk in _chunks(range(scale.batches)):
+            ImportItem.objects.bulk_create([
+                ImportItem(
+                    import_order_id=import_ids[index // IMPORT_LINES_PER_ORDER],
+                    product_id=product_ids[batch_product[index]],
+                    quantity=batch_quantity[index],
+                    unit_price=prices[product_ids[batch_product[index]]],
+                )
+                for index in chunk
+            ])
+            # Database trống nên các dòng nhập mới là các dòng có id lớn nhất, theo thứ tự chèn
+            chunk_item_ids = list(
+                ImportItem.objects.order_by('-pk').values_list('pk', flat=True)[:len(chunk)]
+            )[::-1]
+            Batch.objects.bulk_create([
+                Batch(
+                    product_id=product_ids[batch_product[index]],
+                    batch_code=f'{SYNTHETIC_PREFIX}LO{index:08d}',
+                    import_date=today - datetime.timedelta(days=batch_day[index]),
+                    import_quantity=batch_quantity[index],
+                    remaining_quantity=remaining[index],
+                    expiry_date=expiry[product_ids[batch_product[index]]],
+                    import_item_id=item_id,
+                    created_by=user,
+                )
+                for index, item_id in zip(chunk, chunk_item_ids)
+            ])
+        batch_ids = _ids_by_code(Batch, 'batch_code', f'{SYNTHETIC_PREFIX}LO')
+        log(f'  {len(batch_ids)} lô hàng trong {len(import_ids)} phiếu nhập')
+
+        export_count = -(-len(export_lines) // EXPORT_LINES_PER_ORDER)
+        Export.objects.bulk_create([
+            Export(
+                export_code=f'{SYNTHETIC_PREFIX}PX{number:07d}',
+                export_date=now - datetime.timedelta(days=rng.randrange(HISTORY_DAYS), minutes=rng.randrange(1440)),
+                customer=f'Khách hàng {number % 500}',
+                created_by=user,
+            )
+            for number in range(export_count)
+        ], batch_size=1000)
+        export_ids = _ids_by_code(Export, 'export_code', f'{SYNTHETIC_PREFIX}PX')
+        for start, chunk in _chunks(export_lines):
+            ExportItem.objects.bulk_create([
+                ExportItem(
+                    export_order_id=export_ids[(start + offset) // EXPORT_LINES_PER_ORDER],
+                    batch_id=batch_ids[index],
+                    quantity=quantity,
+                    unit_price=prices[product_ids[batch_product[index]]] * Decimal('1.4'),
+                    discount_percent=discount,
+                )
+                for offset, (index, quantity, discount) in enumerate(chunk)
+            ])
+        # Mỗi dòng xuất lấy trọn từ một lô
+        allocations = ExportItem.objects.filter(export_order__export_code__startswith=f'{SYNTHETIC_PREFIX}PX').order_by('pk')
+        for _, chunk in _chunks(list(allocations.values_list('pk', 'batch_id', 'quantity'))):
+            ExportAllocation.objects.bulk_create([
+                ExportAllocation(export_item_id=pk, batch_id=batch_id, quantity=quantity)
+                for pk, batch_id, quantity in chunk
+            ])
+        log(f'  {len(export_lines)} dòng xuất trong {len(export_ids)} phiếu xuất')
+
+        # bulk_create không gửi signal nên đồng bộ các cột lưu sẵn và sổ biến động thủ công
+        synthetic_products.refresh_stock()
+        Import.objects.filter(import_code__startswith=f'{SYNTHETIC_PREFIX}PN').refresh_totals()
+        Export.objects.filter(export_code__startswith=f'{SYNTHETIC_PREFIX}PX').refresh_totals()
+
+        # Tồn đầu kỳ theo từng lô còn hàng, số dư cộng dồn theo sản phẩm (giống migration sổ biến động)
+        balances = [0] * scale.products
+        movements = []
+        for index in sorted(range(scale.batches), key=lambda index: (batch_product[index], index)):
+            if not remaining[index]:
+                continue
+            balances[batch_product[index]] += remaining[index]
+            movements.append(StockMovement(
+                product_id=product_ids[batch_product[index]],
+                batch_id=batch_ids[index],
+                delta=remaining[index],
+                balance=balances[batch_product[index]],
+                reason='opening',
+                created_at=now,
+            ))
+            if len(movements) >= CHUNK_SIZE:
+                StockMovement.objects.bulk_create(movements)
+                movements = []
+        StockMovement.objects.bulk_create(movements)
+
+    InventorySnapshot.take(today)
+    InventoryVersion.bump()
+    return {
+        'products': len(product_ids),
+        'batches': len(batch_ids),
+        'imports': len(import_ids),
+        'exports': len(export_ids),
+        'export_lines': len(export_lines),
+    }
@@ -0,0 +1,111 @@
+"""Công việc nền của kho: đọc file Excel nhập kho và ghi phiếu nhập từ dữ liệu đã xác nhận"""
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from jobs.registry import JobError, job_handler
+from products.models import Category
+from .excel import ExcelImportError, stage_excel_rows, staged_rows
+from .importer import bulk_import_rows, category_lookup, collect_staged_rows
+from .models import Import
+
+
+@job_handler('excel_stage')
+def stage_excel_upload(job):
+    """Đọc file Excel đã upload vào bảng tạm StagedImportRow"""
+    job.update_progress(5, 'Đang đọc file Excel')
+    input_file = job.input_file
+    if input_file is None:
+        raise JobError('Không tìm thấy file Excel đã upload, vui lòng upload lại.')
+    try:
+        with input_file.open() as file:
+            total = stage_excel_rows(
+                file,
+                job.params['upload_id'],
+                job.created_by,
+                progress=lambda count: job.update_progress(50, f'Đã đọc {count} dòng'),
+            )
+    except ExcelImportError as e:
+        raise JobError(str(e))
+    finally:
+        input_file.delete()
+    return {
+        'url': reverse('inventory:import_excel_confirm'),
+        'message': f'Đã đọc {total} dòng từ file Excel. Vui lòng xác nhận dữ liệu.',
+    }
+
+
+def _commit_result(import_order, message, **extra):
+    return {
+        'url': reverse('inventory:import_detail', args=[import_order.pk]),
+        'import_id': import_order.pk,
+        'message': message,
+        **extra,
+    }
+
+
+def _existing_import(job):
+    """Kết quả của phiếu nhập đã được tạo bởi một lần chạy trước của công việc (nếu có)"""
+    import_order = Import.objects.filter(source_job=job).first()
+    if import_order is None:
+        return None
+    return _commit_result(
+        import_order,
+        f'Phiếu nhập {import_order.import_code} đã được tạo ở lần chạy trước.',
+        rows=import_order.item_count,
+    )
+
+
+@job_handler('excel_commit')
+def commit_excel_import(job):
+    """Tạo phiếu nhập kho từ các dòng Excel đã xác nhận.
+
+    Công việc có thể bị chạy lại khi worker bị coi là treo (heartbeat không được
+    cập nhật trong transaction dài); phiếu nhập gắn với công việc bằng source_job
+    (unique) nên lần chạy lại trả về phiếu đã có thay vì tạo phiếu thứ hai.
+    """
+    existing = _existing_import(job)
+    if existing is not None:
+        return existing
+
+    user = job.created_by
+    staged = staged_rows(job.params['upload_id'], user)
+    _, category_ids_by_name = category_lookup()
+    rows, problem_rows = collect_staged_rows(staged, category_ids_by_name, timezone.now().date())
+    if problem_rows:
+        raise JobError(f'Còn {len(problem_rows)} dòng chưa hợp lệ. Vui lòng sửa hoặc bỏ chọn các dòng này.')
+    if not rows:
+        raise JobError('Không có dòng nào được chọn để import.')
+
+    job.update_progress(20, f'Đang ghi {len(rows)} dòng')
+    try:
+        with transaction.atomic():
+            # Tạo phiếu nhập kho; lần chạy song song của cùng công việc dừng ở đây (source_job unique)
+            import_order = Import.objects.create(
+                import_date=timezone.now(),
+                supplier=job.params.get('supplier', ''),
+                notes=job.params.get('notes', ''),
+                created_by=user,
+                source_job=job,
+            )
+            result = bulk_import_rows(import_order, rows, user)
+
+            # Xóa dữ liệu tạm
+            staged.delete()
+    except IntegrityError:
+        existing = _existing_import(job)
+        if existing is None:
+            raise
+        return existing
+    except Category.DoesNotExist:
+        raise JobError('Có danh mục đã bị xóa trong lúc xác nhận. Vui lòng chọn lại danh mục.')
+
+    return _commit_result(
+        import_order,
+        (
+            f'Đã import thành công {result.rows} sản phẩm '
+            f'({result.elapsed:.2f} giây, {result.rows_per_second:.0f} dòng/giây)!'
+        ),
+        rows=result.rows,
+        rows_per_second=round(result.rows_per_second, 1),
+    )
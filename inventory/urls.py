@@ -14,6 +14,8 @@ urlpatterns = [
     path('import/<int:pk>/delete/', views.import_delete, name='import_delete'),
     path('import/excel/', views.import_excel, name='import_excel'),
     path('import/excel/confirm/', views.import_excel_confirm, name='import_excel_confirm'),
+    path('import/excel/confirm/rows/<int:row_number>/', views.import_excel_row_update, name='import_excel_row_update'),
+    path('import/excel/confirm/include/', views.import_excel_include, name='import_excel_include'),
     path('import/excel/template/', views.download_excel_template, name='download_excel_template'),
     
     # AJAX
@@ -21,6 +23,8 @@ urlpatterns = [
     path('create-product-ajax/', views.create_product_ajax, name='create_product_ajax'),
     path('get-batch-info/<int:batch_id>/', views.get_batch_info, name='get_batch_info'),
     path('get-product-info/<int:product_id>/', views.get_product_info, name='get_product_info_detail'),
+    path('lookup/', views.inventory_lookup, name='inventory_lookup'),
+    path('export/product-typeahead/', views.export_product_typeahead, name='export_product_typeahead'),
     
     # Export
     path('export/', views.export_list, name='export_list'),
@@ -2,25 +2,40 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Q, Sum
+from django.db.models.fields.json import KeyTextTransform
 from django.http import JsonResponse, HttpResponse
+from django.urls import reverse
 from django.utils import timezone
-from .models import Import, ImportItem, Batch, Export, ExportItem
-from .forms import ImportForm, ImportItemForm, ImportExcelForm, ImportItemBulkForm, ImportItemFormSet, ExportForm, ExportItemForm, ExportItemFormSet, ImportManualForm
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from .models import Import, ImportItem, Batch, Export, ExportItem, InventoryVersion, StagedImportRow, stock_document
+from .forms import ImportForm, ImportItemForm, ImportExcelForm, StagedImportRowForm, ImportItemFormSet, ExportForm, ExportItemForm, ExportItemFormSet, ImportManualForm
+from .allocation import export_product, delete_export_item, delete_export, update_export_item_quantity, InsufficientStockError
+from .importer import category_lookup, collect_staged_rows
+from .excel import staged_rows
+from jobs.models import Job
+from jobs.views import redirect_to_job
 from products.models import Product, Category
+from products.pagination import KeysetPaginator
+from products.search import search_products
 import json
 import io
+import uuid
 import xlsxwriter
 
+# Số dòng Excel hiển thị trên một trang của bảng xác nhận import
+IMPORT_CONFIRM_PAGE_SIZE = 50
+
 @login_required
 def import_list(request):
     """Danh sách phiếu nhập kho"""
-    imports = Import.objects.all().order_by('-import_date')
+    imports = Import.objects.select_related('created_by')
     
-    # Phân trang
-    paginator = Paginator(imports, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Phân trang theo con trỏ (import_date, id): trang sâu tốn chi phí như trang đầu
+    paginator = KeysetPaginator(imports, 20, ('-import_date', '-id'), with_total=True)
+    page_obj = paginator.get_page(request.GET)
     
     context = {
         'page_obj': page_obj,
@@ -93,13 +108,15 @@ def import_manual_create(request):
                         )
                         
                         # Tạo lô hàng
-                        batch = Batch.objects.create(
-                            product=product,
-                            import_date=import_order.import_date.date(),
-                            import_quantity=quantity,
-                            remaining_quantity=quantity,
-                            created_by=request.user
-                        )
+                        with stock_document(import_order.import_code):
+                            batch = Batch.objects.create(
+                                product=product,
+                                import_date=import_order.import_date.date(),
+                                import_quantity=quantity,
+                                remaining_quantity=quantity,
+                                import_item=item,
+                                created_by=request.user
+                            )
                         
                         success_count += 1
                         
@@ -147,16 +164,20 @@ def import_add_items(request, pk):
                 item.product.expiry_date = expiry_date
                 item.product.save()
             
-            # Tạo lô hàng
-            batch = Batch.objects.create(
-                product=item.product,
-                import_date=import_order.import_date.date(),
-                import_quantity=item.quantity,
-                remaining_quantity=item.quantity,
-                created_by=request.user
-            )
+            # Tạo dòng nhập rồi tạo lô hàng gắn với dòng đó
+            with transaction.atomic():
+                item.save()
+                with stock_document(import_order.import_code):
+                    batch = Batch.objects.create(
+                        product=item.product,
+                        import_date=import_order.import_date.date(),
+                        import_quantity=item.quantity,
+                        remaining_quantity=item.quantity,
+                        expiry_date=expiry_date,
+                        import_item=item,
+                        created_by=request.user
+                    )
             
-            item.save()
             messages.success(request, f'Đã thêm {item.quantity} {item.product.unit} {item.product.name}')
             return redirect('inventory:import_add_items', pk=pk)
     else:
@@ -179,15 +200,21 @@ def import_excel(request):
     if request.method == 'POST':
         form = ImportExcelForm(request.POST, request.FILES)
         if form.is_valid():
-            # Lưu dữ liệu Excel đã được xử lý vào session
-            request.session['excel_data'] = form.excel_data
-            
-            # Lưu thông tin danh mục thiếu nếu có
-            if hasattr(form, 'missing_categories'):
-                request.session['missing_categories'] = form.missing_categories
-            
-            messages.success(request, 'File Excel đã được upload thành công! Vui lòng xác nhận dữ liệu.')
-            return redirect('inventory:import_excel_confirm')
+            # File được đọc nền vào bảng tạm, session chỉ giữ mã upload
+            StagedImportRow.purge_stale()
+            upload_id = uuid.uuid4()
+            request.session['excel_upload_id'] = str(upload_id)
+            job = Job.enqueue(
+                'excel_stage',
+                request.user,
+                params={'upload_id': str(upload_id)},
+                input_file=form.cleaned_data['excel_file'],
+            )
+            if job.status == 'failed':
+                form.add_error('excel_file', job.message)
+            else:
+                messages.success(request, 'File Excel đã được upload thành công! Dữ liệu đang được đọc.')
+                return redirect_to_job(request, job)
     else:
         form = ImportExcelForm()
     
@@ -197,139 +224,146 @@ def import_excel(request):
     }
     return render(request, 'inventory/import_excel.html', context)
 
+def _staged_row_form(row, categories, category_ids_by_name, today, data=None):
+    """Form của một dòng chờ nhập kèm lỗi hiện tại (lỗi đã lưu hoặc lỗi của dữ liệu Excel)"""
+    if row.values is not None:
+        initial, issues = row.values, row.errors
+    else:
+        initial, issues = StagedImportRowForm.initial_from_excel(row.data, category_ids_by_name, today)
+    form = StagedImportRowForm(
+        data=data,
+        initial=initial,
+        prefix=f'row-{row.row_number}',
+        categories=categories,
+        excel_category=str(row.data.get('Danh mục') or ''),
+    )
+    return form, issues
+
+def _active_excel_job(kind, upload_id, user):
+    return Job.objects.filter(
+        kind=kind, created_by=user, params__upload_id=upload_id, status__in=Job.ACTIVE_STATUSES
+    ).first()
+
 @login_required
 def import_excel_confirm(request):
-    """Xác nhận dữ liệu import từ Excel"""
-    from datetime import datetime
-    
-    excel_data = request.session.get('excel_data')
-    missing_categories = request.session.get('missing_categories', [])
-    
-    if not excel_data:
+    """Xác nhận dữ liệu import từ Excel.
+
+    Bảng xác nhận hiển thị từng trang dòng chờ nhập; chỉnh sửa được lưu từng
+    dòng qua import_excel_row_update nên chỉ các dòng đã sửa phải kiểm tra lại.
+    Phiếu nhập được ghi bởi công việc nền.
+    """
+    upload_id = request.session.get('excel_upload_id')
+    staged = staged_rows(upload_id, request.user) if upload_id else StagedImportRow.objects.none()
+    total_rows = staged.count()
+    
+    if not total_rows:
+        # File vẫn đang được đọc
+        job = _active_excel_job('excel_stage', upload_id, request.user) if upload_id else None
+        if job is not None:
+            return redirect(job)
         messages.error(request, 'Không có dữ liệu Excel để xác nhận.')
         return redirect('inventory:import_excel')
     
+    categories, category_ids_by_name = category_lookup()
+    today = timezone.now().date()
+    
     if request.method == 'POST':
-        form = ImportItemBulkForm(excel_data=excel_data, data=request.POST)
-        if form.is_valid():
-            # Tạo phiếu nhập kho
-            import_order = Import.objects.create(
-                import_date=timezone.now(),
-                supplier=request.POST.get('supplier', ''),
-                notes=request.POST.get('notes', ''),
-                created_by=request.user
+        job = _active_excel_job('excel_commit', upload_id, request.user)
+        if job is not None:
+            return redirect(job)
+        
+        _, problem_rows = collect_staged_rows(staged, category_ids_by_name, today)
+        if problem_rows:
+            first_page = problem_rows[0] // IMPORT_CONFIRM_PAGE_SIZE + 1
+            messages.error(
+                request,
+                f'Còn {len(problem_rows)} dòng chưa hợp lệ (dòng đầu tiên ở trang {first_page}). '
+                'Vui lòng sửa hoặc bỏ chọn các dòng này.'
             )
-            
-            # Xử lý từng item
-            for index, row in enumerate(excel_data):
-                if form.cleaned_data.get(f'include_{index}', False):
-                    product_name = form.cleaned_data[f'product_name_{index}']  # Lấy từ form đã chỉnh sửa
-                    category_name = form.cleaned_data[f'category_{index}']  # Lấy từ form đã chỉnh sửa
-                    quantity = form.cleaned_data[f'quantity_{index}']
-                    import_price = form.cleaned_data[f'import_price_{index}']
-                    selling_price = form.cleaned_data[f'selling_price_{index}']
-                    unit = form.cleaned_data[f'unit_{index}']  # Lấy từ form đã chỉnh sửa
-                    description = row.get('Mô tả', '') or ''  # Đảm bảo description không bao giờ là None
-                    expiry_date = form.cleaned_data[f'expiry_date_{index}']  # Lấy từ form đã chỉnh sửa
-                    
-                    # Chuyển đổi expiry_date từ string thành date object nếu cần
-                    if isinstance(expiry_date, str):
-                        try:
-                            expiry_date = datetime.strptime(expiry_date, '%Y-%m-%d').date()
-                        except ValueError:
-                            # Nếu không parse được, sử dụng ngày mặc định
-                            expiry_date = timezone.now().date() + timezone.timedelta(days=365)
-                    
-                    # Xử lý danh mục
-                    category_value = form.cleaned_data[f'category_{index}']
-                    
-                    if category_value == 'new':
-                        # Người dùng chọn tạo danh mục mới
-                        category, category_created = Category.objects.get_or_create(
-                            name=category_name
-                        )
-                    else:
-                        # Người dùng chọn danh mục có sẵn
-                        # category_value có thể là Category object hoặc ID string
-                        if isinstance(category_value, Category):
-                            category = category_value
-                        else:
-                            category = Category.objects.get(id=category_value)
-                    
-                    # Tìm hoặc tạo sản phẩm
-                    product, created = Product.objects.get_or_create(
-                        name=product_name,
-                        category=category,
-                        defaults={
-                            'unit': unit,
-                            'selling_price': selling_price,
-                            'purchase_price': import_price,
-                            'description': description or '',  # Đảm bảo description không bao giờ là None
-                            'is_active': True
-                        }
-                    )
-                    
-                    # Cập nhật thông tin sản phẩm cũ
-                    if not created:
-                        # Cập nhật giá bán nếu có
-                        if selling_price:
-                            product.selling_price = selling_price
-                        # Cập nhật giá nhập nếu chưa có
-                        if not product.purchase_price and import_price:
-                            product.purchase_price = import_price
-                        # Cập nhật đơn vị nếu chưa có
-                        if not product.unit:
-                            product.unit = unit
-                        # Cập nhật mô tả nếu chưa có
-                        if not product.description and description:
-                            product.description = description
-                        elif not product.description:
-                            product.description = ''  # Đảm bảo description không bao giờ là None
-                        product.save()
-                    
-                    # Tạo ImportItem
-                    ImportItem.objects.create(
-                        import_order=import_order,
-                        product=product,
-                        quantity=quantity,
-                        unit_price=import_price
-                    )
-                    
-                    # Cập nhật hạn sử dụng của sản phẩm nếu chưa có
-                    if not product.expiry_date and expiry_date:
-                        product.expiry_date = expiry_date
-                        product.save()
-                    
-                    # Tạo lô hàng
-                    Batch.objects.create(
-                        product=product,
-                        import_date=import_order.import_date.date(),
-                        import_quantity=quantity,
-                        remaining_quantity=quantity,
-                        created_by=request.user
-                    )
-            
-            # Xóa dữ liệu session
-            del request.session['excel_data']
-            if 'missing_categories' in request.session:
-                del request.session['missing_categories']
-            
-            messages.success(request, f'Đã import thành công {import_order.items.count()} sản phẩm!')
-            return redirect('inventory:import_detail', pk=import_order.pk)
-        else:
-            # Form không hợp lệ, hiển thị lỗi
-            messages.error(request, 'Vui lòng kiểm tra lại dữ liệu. Có lỗi validation.')
-    else:
-        form = ImportItemBulkForm(excel_data=excel_data)
+            return redirect(f"{reverse('inventory:import_excel_confirm')}?page={first_page}")
+        if not staged.filter(include=True).exists():
+            messages.error(request, 'Vui lòng chọn ít nhất một sản phẩm để import.')
+            return redirect('inventory:import_excel_confirm')
+        
+        # Ghi phiếu nhập trong công việc nền
+        job = Job.enqueue('excel_commit', request.user, params={
+            'upload_id': upload_id,
+            'supplier': request.POST.get('supplier', ''),
+            'notes': request.POST.get('notes', ''),
+        })
+        if job.status == 'failed':
+            messages.error(request, job.message)
+            return redirect('inventory:import_excel_confirm')
+        return redirect_to_job(request, job)
+    
+    # Chỉ dựng form cho các dòng của trang hiện tại
+    paginator = Paginator(staged, IMPORT_CONFIRM_PAGE_SIZE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    page_rows = []
+    for row in page_obj:
+        form, issues = _staged_row_form(row, categories, category_ids_by_name, today)
+        page_rows.append({'row': row, 'form': form, 'issues': issues})
+    
+    # Danh mục trong file chưa có trong hệ thống (chỉ để cảnh báo)
+    category_names = set(
+        staged.annotate(category_name=KeyTextTransform('Danh mục', 'data'))
+        .exclude(category_name=None)
+        .order_by()
+        .values_list('category_name', flat=True)
+        .distinct()
+    )
+    missing_categories = sorted(category_names - set(category_ids_by_name))
     
     context = {
-        'form': form,
-        'excel_data': excel_data,
+        'page_obj': page_obj,
+        'page_rows': page_rows,
+        'total_rows': total_rows,
+        'selected_count': staged.filter(include=True).count(),
         'missing_categories': missing_categories,
         'title': 'Xác nhận dữ liệu import',
     }
     return render(request, 'inventory/import_excel_confirm.html', context)
 
+@login_required
+def import_excel_row_update(request, row_number):
+    """Lưu chỉnh sửa một dòng trên bảng xác nhận import qua AJAX, chỉ kiểm tra dòng này"""
+    if request.method == 'POST':
+        upload_id = request.session.get('excel_upload_id')
+        if not upload_id:
+            return JsonResponse({'success': False, 'error': 'Không có dữ liệu Excel để xác nhận'}, status=400)
+        row = get_object_or_404(staged_rows(upload_id, request.user), row_number=row_number)
+        
+        categories, category_ids_by_name = category_lookup()
+        form, _ = _staged_row_form(row, categories, category_ids_by_name, timezone.now().date(), data=request.POST)
+        if form.is_valid():
+            row.values = form.stored_values()
+            row.errors = {}
+        else:
+            row.values = form.raw_values()
+            row.errors = {field: errors[0] for field, errors in form.errors.items()}
+        row.save(update_fields=['values', 'errors'])
+        return JsonResponse({'success': True, 'valid': not row.errors, 'errors': row.errors})
+    return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
+@login_required
+def import_excel_include(request):
+    """Chọn/bỏ chọn một dòng (hoặc tất cả các dòng nếu không có row) qua AJAX"""
+    if request.method == 'POST':
+        upload_id = request.session.get('excel_upload_id')
+        if not upload_id:
+            return JsonResponse({'success': False, 'error': 'Không có dữ liệu Excel để xác nhận'}, status=400)
+        staged = staged_rows(upload_id, request.user)
+        rows = staged
+        if request.POST.get('row'):
+            try:
+                row_number = int(request.POST['row'])
+            except ValueError:
+                return JsonResponse({'success': False, 'error': 'Số thứ tự dòng không hợp lệ'}, status=400)
+            rows = staged.filter(pk=get_object_or_404(staged, row_number=row_number).pk)
+        rows.update(include=request.POST.get('include') == '1')
+        return JsonResponse({'success': True, 'selected_count': staged.filter(include=True).count()})
+    return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
 @login_required
 def import_detail(request, pk):
     """Chi tiết phiếu nhập kho"""
@@ -357,75 +391,74 @@ def import_update(request, pk):
     if request.method == 'POST':
         form = ImportManualForm(request.POST, instance=import_order)
         if form.is_valid():
-            # Cập nhật thông tin phiếu nhập
-            import_order = form.save()
-            
             # Xử lý danh sách sản phẩm
             products = request.POST.getlist('products[]')
             quantities = request.POST.getlist('quantities[]')
             purchase_prices = request.POST.getlist('purchase_prices[]')
             selling_prices = request.POST.getlist('selling_prices[]')
             
-            # Lưu thông tin items trước khi xóa để xóa batches
-            items_to_delete = list(import_order.items.all())
-            
-            # Xóa tất cả items cũ
-            import_order.items.all().delete()
-            
-            # Xóa batches liên quan đến phiếu nhập này
-            for item in items_to_delete:
-                Batch.objects.filter(
-                    product=item.product,
-                    import_date=import_order.import_date.date(),
-                    import_quantity=item.quantity
-                ).delete()
-            
-            success_count = 0
-            for i in range(len(products)):
-                if products[i] and quantities[i]:
-                    try:
-                        product = Product.objects.get(id=products[i])
-                        quantity = int(quantities[i])
-                        
-                        # Sử dụng giá từ form hoặc từ sản phẩm
-                        purchase_price = float(purchase_prices[i]) if purchase_prices[i] else (product.purchase_price or 0)
-                        selling_price = float(selling_prices[i]) if selling_prices[i] else (product.selling_price or 0)
-                        
-                        # Cập nhật giá nhập và giá bán của sản phẩm nếu chưa có
-                        if not product.purchase_price:
-                            product.purchase_price = purchase_price
-                        if not product.selling_price and selling_price:
-                            product.selling_price = selling_price
-                        product.save()
-                        
-                        # Tạo item nhập kho
-                        item = ImportItem.objects.create(
-                            import_order=import_order,
-                            product=product,
-                            quantity=quantity,
-                            unit_price=purchase_price
-                        )
-                        
-                        # Tạo lô hàng
-                        batch = Batch.objects.create(
-                            product=product,
-                            import_date=import_order.import_date.date(),
-                            import_quantity=quantity,
-                            remaining_quantity=quantity,
-                            created_by=request.user
-                        )
-                        
-                        success_count += 1
-                        
-                    except (Product.DoesNotExist, ValueError) as e:
-                        messages.error(request, f'Lỗi khi xử lý sản phẩm thứ {i+1}: {str(e)}')
-            
-            if success_count > 0:
-                messages.success(request, f'Đã cập nhật phiếu nhập kho thành công với {success_count} sản phẩm!')
-                return redirect('inventory:import_detail', pk=import_order.pk)
-            else:
-                messages.error(request, 'Không có sản phẩm nào được thêm vào phiếu nhập kho.')
-                return redirect('inventory:import_update', pk=import_order.pk)
+            # Sửa cả phiếu trong một giao dịch để lỗi giữa chừng không làm mất dòng/lô cũ
+            with transaction.atomic():
+                # Cập nhật thông tin phiếu nhập
+                import_order = form.save()
+                
+                # Xóa các lô do phiếu này tạo ra rồi xóa các dòng cũ (khóa sản phẩm trước lô hàng)
+                own_batches = Batch.objects.filter(import_item__import_order=import_order)
+                Product.objects.filter(pk__in=own_batches.values('product_id')).lock_for_update()
+                with stock_document(import_order.import_code):
+                    own_batches.delete()
+                import_order.items.all().delete()
+                
+                success_count = 0
+                for i in range(len(products)):
+                    if products[i] and quantities[i]:
+                        try:
+                            product = Product.objects.get(id=products[i])
+                            quantity = int(quantities[i])
+                            
+                            # Sử dụng giá từ form hoặc từ sản phẩm
+                            purchase_price = float(purchase_prices[i]) if purchase_prices[i] else (product.purchase_price or 0)
+                            selling_price = float(selling_prices[i]) if selling_prices[i] else (product.selling_price or 0)
+                            
+                            # Cập nhật giá nhập và giá bán của sản phẩm nếu chưa có
+                            if not product.purchase_price:
+                                product.purchase_price = purchase_price
+                            if not product.selling_price and selling_price:
+                                product.selling_price = selling_price
+                            product.save()
+                            
+                            # Tạo item nhập kho
+                            item = ImportItem.objects.create(
+                                import_order=import_order,
+                                product=product,
+                                quantity=quantity,
+                                unit_price=purchase_price
+                            )
+                            
+                            # Tạo lô hàng
+                            with stock_document(import_order.import_code):
+                                batch = Batch.objects.create(
+                                    product=product,
+                                    import_date=import_order.import_date.date(),
+                                    import_quantity=quantity,
+                                    remaining_quantity=quantity,
+                                    import_item=item,
+                                    created_by=request.user
+                                )
+                            
+                            success_count += 1
+                            
+                        except (Product.DoesNotExist, ValueError) as e:
+                            messages.error(request, f'Lỗi khi xử lý sản phẩm thứ {i+1}: {str(e)}')
+                
+                if success_count > 0:
+                    messages.success(request, f'Đã cập nhật phiếu nhập kho thành công với {success_count} sản phẩm!')
+                    return redirect('inventory:import_detail', pk=import_order.pk)
+                
+                # Không có dòng hợp lệ nào: giữ nguyên phiếu như trước khi sửa
+                transaction.set_rollback(True)
+            messages.error(request, 'Không có sản phẩm nào được thêm vào phiếu nhập kho.')
+            return redirect('inventory:import_update', pk=import_order.pk)
     else:
         form = ImportManualForm(instance=import_order)
     
@@ -452,16 +485,15 @@ def import_delete(request, pk):
     import_order = get_object_or_404(Import, pk=pk)
     
     if request.method == 'POST':
-        # Xóa tất cả batches liên quan
-        for item in import_order.items.all():
-            Batch.objects.filter(
-                product=item.product,
-                import_date=import_order.import_date.date(),
-                import_quantity=item.quantity
-            ).delete()
-        
-        # Xóa phiếu nhập
-        import_order.delete()
+        with transaction.atomic():
+            # Xóa các lô do phiếu này tạo ra (khóa sản phẩm trước lô hàng)
+            own_batches = Batch.objects.filter(import_item__import_order=import_order)
+            Product.objects.filter(pk__in=own_batches.values('product_id')).lock_for_update()
+            with stock_document(import_order.import_code):
+                own_batches.delete()
+            
+            # Xóa phiếu nhập
+            import_order.delete()
         messages.success(request, f'Đã xóa phiếu nhập kho {import_order.import_code} thành công!')
         return redirect('inventory:import_list')
     
@@ -602,16 +634,142 @@ def get_product_info(request, product_id):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+# Số ID tối đa cho mỗi loại trong một lần tra cứu hàng loạt
+INVENTORY_LOOKUP_MAX_IDS = 200
+
+def _inventory_state(request):
+    """Phiên bản dữ liệu kho của request, chỉ đọc một lần cho cả ETag và Last-Modified"""
+    if not hasattr(request, '_inventory_state'):
+        request._inventory_state = InventoryVersion.state()
+    return request._inventory_state
+
+def _inventory_etag(request, *args, **kwargs):
+    version, _ = _inventory_state(request)
+    return f'inventory-v{version}'
+
+def _inventory_last_modified(request, *args, **kwargs):
+    return _inventory_state(request)[1]
+
+def _parse_ids(value):
+    """Danh sách ID từ chuỗi "1,2,3" (bỏ trùng, giữ thứ tự); ValueError nếu có giá trị không hợp lệ"""
+    ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    if len(ids) > INVENTORY_LOOKUP_MAX_IDS:
+        raise ValueError(value)
+    return ids
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_inventory_etag, last_modified_func=_inventory_last_modified)
+def inventory_lookup(request):
+    """Tra cứu hàng loạt thông tin sản phẩm/lô hàng qua AJAX.
+
+    GET ?products=1,2,3&batches=4,5 trả về tồn kho, giá và đơn vị, mỗi loại một
+    câu truy vấn. ETag/Last-Modified theo phiên bản dữ liệu kho nên trình duyệt
+    kiểm tra lại bằng If-None-Match và nhận 304 khi kho chưa thay đổi.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+    try:
+        product_ids = _parse_ids(request.GET.get('products', ''))
+        batch_ids = _parse_ids(request.GET.get('batches', ''))
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': f'Danh sách ID không hợp lệ (tối đa {INVENTORY_LOOKUP_MAX_IDS} ID mỗi loại)'
+        })
+
+    products = {}
+    if product_ids:
+        rows = Product.objects.filter(id__in=product_ids, is_active=True).values(
+            'id', 'code', 'name', 'unit', 'stock_quantity', 'purchase_price', 'selling_price', 'category__name'
+        )
+        for row in rows:
+            products[row['id']] = {
+                'id': row['id'],
+                'code': row['code'],
+                'name': row['name'],
+                'category': row['category__name'],
+                'unit': row['unit'],
+                'total_stock': row['stock_quantity'],
+                'purchase_price': float(row['purchase_price']) if row['purchase_price'] else 0,
+                'selling_price': float(row['selling_price']) if row['selling_price'] else 0,
+            }
+
+    batches = {}
+    if batch_ids:
+        rows = Batch.objects.filter(id__in=batch_ids, is_active=True).values(
+            'id', 'batch_code', 'import_date', 'remaining_quantity',
+            'product_id', 'product__name', 'product__unit', 'product__purchase_price', 'product__selling_price',
+        )
+        for row in rows:
+            batches[row['id']] = {
+                'id': row['id'],
+                'batch_code': row['batch_code'],
+                'product_id': row['product_id'],
+                'product_name': row['product__name'],
+                'unit': row['product__unit'],
+                'remaining_quantity': row['remaining_quantity'],
+                'import_date': row['import_date'].strftime('%d/%m/%Y'),
+                'import_price': float(row['product__purchase_price']) if row['product__purchase_price'] else 0,
+                'selling_price': float(row['product__selling_price']) if row['product__selling_price'] else 0,
+            }
+
+    return JsonResponse({
+        'success': True,
+        'version': _inventory_state(request)[0],
+        'products': products,
+        'batches': batches,
+    })
+
+PRODUCT_TYPEAHEAD_LIMIT = 10
+PRODUCT_TYPEAHEAD_MAX_LIMIT = 50
+
+@login_required
+def export_product_typeahead(request):
+    """Tìm sản phẩm còn hàng theo tiền tố cho ô chọn sản phẩm của phiếu xuất (AJAX)"""
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+    try:
+        limit = int(request.GET.get('limit', PRODUCT_TYPEAHEAD_LIMIT))
+    except ValueError:
+        limit = PRODUCT_TYPEAHEAD_LIMIT
+    limit = max(1, min(limit, PRODUCT_TYPEAHEAD_MAX_LIMIT))
+
+    query = request.GET.get('q', '').strip()
+    products = search_products(Product.objects.filter(is_active=True, stock_quantity__gt=0), query)
+    if 'search_rank' not in products.query.annotations:
+        # Chưa nhập từ khóa (hoặc chỉ có ký tự đặc biệt): không trả về cả danh mục
+        return JsonResponse({'success': True, 'products': []})
+
+    rows = (
+        products.order_by('-search_rank', 'name', 'id')
+        .values('id', 'code', 'name', 'unit', 'stock_quantity', 'selling_price', 'category__name')[:limit]
+    )
+    return JsonResponse({
+        'success': True,
+        'products': [
+            {
+                'id': row['id'],
+                'code': row['code'],
+                'name': row['name'],
+                'category': row['category__name'],
+                'unit': row['unit'],
+                'stock': row['stock_quantity'],
+                'selling_price': float(row['selling_price']) if row['selling_price'] else 0,
+            }
+            for row in rows
+        ],
+    })
+
 # Export views (giữ nguyên)
 @login_required
 def export_list(request):
     """Danh sách phiếu xuất kho"""
-    exports = Export.objects.all().order_by('-export_date')
+    exports = Export.objects.select_related('created_by')
     
-    # Phân trang
-    paginator = Paginator(exports, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Phân trang theo con trỏ (export_date, id): trang sâu tốn chi phí như trang đầu
+    paginator = KeysetPaginator(exports, 20, ('-export_date', '-id'), with_total=True)
+    page_obj = paginator.get_page(request.GET)
     
     context = {
         'page_obj': page_obj,
@@ -651,40 +809,28 @@ def export_add_items(request, pk):
             try:
                 item = ExportItem.objects.get(id=delete_item_id, export_order=export_order)
                 
-                # Hoàn trả số lượng về tất cả các batch của sản phẩm này
-                # Tính toán lại số lượng cần hoàn trả cho từng batch
-                product = item.batch.product
-                remaining_quantity = item.quantity
-                
-                # Lấy tất cả các batch của sản phẩm này theo thứ tự import_date (FIFO)
-                batches = product.batches.filter(is_active=True).order_by('import_date')
-                
-                for batch in batches:
-                    if remaining_quantity <= 0:
-                        break
-                    
-                    # Tính số lượng đã xuất từ batch này (dựa trên remaining_quantity hiện tại)
-                    # Giả sử batch ban đầu có import_quantity, và remaining_quantity hiện tại
-                    # Số lượng đã xuất = import_quantity - remaining_quantity
-                    original_quantity = batch.import_quantity
-                    current_remaining = batch.remaining_quantity
-                    exported_from_batch = original_quantity - current_remaining
-                    
-                    if exported_from_batch > 0:
-                        # Hoàn trả số lượng cho batch này
-                        restore_quantity = min(remaining_quantity, exported_from_batch)
-                        batch.remaining_quantity += restore_quantity
-                        batch.save()
-                        remaining_quantity -= restore_quantity
-                        print(f"Restored {restore_quantity} to batch {batch.batch_code}")
-                
-                item.delete()
+                # Hoàn trả số lượng về đúng các lô đã xuất (theo ExportAllocation)
+                delete_export_item(item)
                 messages.success(request, 'Đã xóa sản phẩm khỏi phiếu xuất')
                 return redirect('inventory:export_add_items', pk=pk)
             except ExportItem.DoesNotExist:
                 messages.error(request, 'Không tìm thấy sản phẩm cần xóa')
                 return redirect('inventory:export_add_items', pk=pk)
         
+        # Xử lý sửa số lượng item: hoàn trả các lô cũ rồi phân bổ lại FIFO trong một transaction
+        update_item_id = request.POST.get('update_item')
+        if update_item_id:
+            try:
+                item = ExportItem.objects.get(id=update_item_id, export_order=export_order)
+                quantity = int(request.POST.get('quantity', ''))
+                update_export_item_quantity(item, quantity)
+                messages.success(request, f'Đã cập nhật số lượng thành {quantity}')
+            except (ExportItem.DoesNotExist, ValueError):
+                messages.error(request, 'Số lượng không hợp lệ hoặc không tìm thấy sản phẩm cần sửa')
+            except InsufficientStockError as e:
+                messages.error(request, str(e))
+            return redirect('inventory:export_add_items', pk=pk)
+        
         # Xử lý thêm item mới
         form = ExportItemForm(request.POST)
         if form.is_valid():
@@ -693,57 +839,13 @@ def export_add_items(request, pk):
             unit_price = form.cleaned_data['unit_price']
             discount_percent = form.cleaned_data.get('discount_percent', 0)
             
-            # Kiểm tra tổng tồn kho của sản phẩm
-            total_stock = product.total_stock
-            if quantity > total_stock:
-                messages.error(request, f'Số lượng xuất ({quantity}) vượt quá tồn kho ({total_stock})')
-                return redirect('inventory:export_add_items', pk=pk)
-            
-            # Kiểm tra tổng tồn kho có đủ không
-            total_available = sum(batch.remaining_quantity for batch in product.batches.filter(is_active=True, remaining_quantity__gt=0))
-            
-            if quantity > total_available:
-                messages.error(request, f'Số lượng xuất ({quantity}) vượt quá tồn kho hiện có ({total_available})')
-                return redirect('inventory:export_add_items', pk=pk)
-            
-            # Tìm batch có số lượng phù hợp để xuất (FIFO)
-            remaining_quantity = quantity
-            batches_to_update = []
-            
-            for batch in product.batches.filter(is_active=True, remaining_quantity__gt=0).order_by('import_date'):
-                if remaining_quantity <= 0:
-                    break
-                    
-                batch_quantity = min(remaining_quantity, batch.remaining_quantity)
-                batches_to_update.append((batch, batch_quantity))
-                remaining_quantity -= batch_quantity
-            
-            # Tạo một ExportItem duy nhất cho sản phẩm này
-            # Sử dụng batch đầu tiên làm đại diện
-            first_batch = batches_to_update[0][0]
-            
+            # Khóa các lô hàng và trừ tồn kho theo FIFO trong một transaction
             try:
-                # Tạo ExportItem mà không trigger validation save() của model
-                export_item = ExportItem(
-                    export_order=export_order,
-                    batch=first_batch,
-                    quantity=quantity,  # Tổng số lượng cần xuất
-                    unit_price=unit_price,
-                    discount_percent=discount_percent
-                )
-                
-                # Cập nhật số lượng tồn kho cho tất cả các batch được sử dụng TRƯỚC khi lưu ExportItem
-                for batch, batch_quantity in batches_to_update:
-                    batch.remaining_quantity -= batch_quantity
-                    batch.save()
-                    print(f"Updated batch {batch.batch_code}: remaining_quantity = {batch.remaining_quantity}")
-                
-                # Bây giờ lưu ExportItem (sau khi đã cập nhật remaining_quantity)
-                export_item.save()
-                print(f"Created ExportItem: {export_item}")
-                    
+                export_product(export_order, product, quantity, unit_price, discount_percent)
+            except (InsufficientStockError, ValueError) as e:
+                messages.error(request, str(e))
+                return redirect('inventory:export_add_items', pk=pk)
             except Exception as e:
-                print(f"Error creating ExportItem: {e}")
                 messages.error(request, f'Lỗi khi tạo chi tiết xuất kho: {e}')
                 return redirect('inventory:export_add_items', pk=pk)
             
@@ -802,33 +904,8 @@ def export_delete(request, pk):
     export_order = get_object_or_404(Export, pk=pk)
     
     if request.method == 'POST':
-        # Hoàn trả số lượng về các batch
-        for item in export_order.items.all():
-            # Hoàn trả số lượng về tất cả các batch của sản phẩm này
-            product = item.batch.product
-            remaining_quantity = item.quantity
-            
-            # Lấy tất cả các batch của sản phẩm này theo thứ tự import_date (FIFO)
-            batches = product.batches.filter(is_active=True).order_by('import_date')
-            
-            for batch in batches:
-                if remaining_quantity <= 0:
-                    break
-                
-                # Tính số lượng đã xuất từ batch này
-                original_quantity = batch.import_quantity
-                current_remaining = batch.remaining_quantity
-                exported_from_batch = original_quantity - current_remaining
-                
-                if exported_from_batch > 0:
-                    # Hoàn trả số lượng cho batch này
-                    restore_quantity = min(remaining_quantity, exported_from_batch)
-                    batch.remaining_quantity += restore_quantity
-                    batch.save()
-                    remaining_quantity -= restore_quantity
-        
-        # Xóa phiếu xuất
-        export_order.delete()
+        # Hoàn trả số lượng về đúng các lô đã xuất rồi xóa phiếu xuất
+        delete_export(export_order)
         messages.success(request, 'Phiếu xuất kho đã được xóa thành công!')
         return redirect('inventory:export_list')
     
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs.models import Job, default_worker_name
+
+
+class Command(BaseCommand):
+    help = "Worker chạy các công việc nền (import Excel, xuất báo cáo) từ hàng đợi trong database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Chạy hết các công việc đang chờ rồi thoát',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help='Số giây chờ giữa hai lần kiểm tra khi hàng đợi trống (mặc định 2)',
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            default=0,
+            help='Thoát sau khi chạy số công việc này (0: không giới hạn)',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=600,
+            help='Chạy lại công việc không cập nhật tiến độ quá số giây này (mặc định 600)',
+        )
+
+    def handle(self, *args, **options):
+        worker = default_worker_name()
+        processed = 0
+        self.stdout.write(f"Worker {worker} bắt đầu nhận công việc")
+
+        try:
+            while not options['max_jobs'] or processed < options['max_jobs']:
+                close_old_connections()
+                requeued = Job.requeue_stale(options['stale_after'])
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f"Đưa lại {requeued} công việc bị treo vào hàng đợi"))
+
+                job = Job.claim_next(worker)
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                started = time.perf_counter()
+                job.run()
+                processed += 1
+                style = self.style.SUCCESS if job.status == 'succeeded' else self.style.ERROR
+                self.stdout.write(style(
+                    f"{job} - {time.perf_counter() - started:.2f}s - {job.message}"
+                ))
+        except KeyboardInterrupt:
+            self.stdout.write("Dừng worker")
+
+        self.stdout.write(f"Đã chạy {processed} công việc")
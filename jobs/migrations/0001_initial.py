@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('excel_stage', 'Đọc file Excel nhập kho'), ('excel_commit', 'Nhập kho từ Excel'), ('inventory_report', 'Báo cáo tồn kho (Excel)'), ('import_export_report', 'Báo cáo nhập/xuất (Excel)'), ('profit_report', 'Báo cáo lợi nhuận (Excel)')], max_length=30, verbose_name='Loại công việc')),
+                ('status', models.CharField(choices=[('queued', 'Đang chờ'), ('running', 'Đang chạy'), ('succeeded', 'Hoàn thành'), ('failed', 'Lỗi')], db_index=True, default='queued', max_length=10, verbose_name='Trạng thái')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Tham số')),
+                ('input_file', models.FileField(blank=True, upload_to='jobs/input/', verbose_name='File đầu vào')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='Tiến độ (%)')),
+                ('message', models.CharField(blank=True, max_length=255, verbose_name='Thông báo')),
+                ('result', models.JSONField(blank=True, default=dict, verbose_name='Kết quả')),
+                ('result_file', models.FileField(blank=True, upload_to='jobs/results/%Y/%m/', verbose_name='File kết quả')),
+                ('error', models.TextField(blank=True, verbose_name='Lỗi')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Số lần chạy')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Worker')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to=settings.AUTH_USER_MODEL, verbose_name='Người tạo')),
+            ],
+            options={
+                'verbose_name': 'Công việc nền',
+                'verbose_name_plural': 'Công việc nền',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='job_queue_idx')],
+            },
+        ),
+    ]
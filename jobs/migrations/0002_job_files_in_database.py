@@ -0,0 +1,78 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def copy_files_to_database(apps, schema_editor):
+    """Chép file đầu vào/kết quả đang nằm trong MEDIA_ROOT vào JobFile (bỏ qua file đã mất)"""
+    Job = apps.get_model('jobs', 'Job')
+    JobFile = apps.get_model('jobs', 'JobFile')
+    JobFileChunk = apps.get_model('jobs', 'JobFileChunk')
+
+    for job in Job.objects.exclude(input_file='', result_file='').iterator():
+        for role, field in (('input', job.input_file), ('result', job.result_file)):
+            if not field:
+                continue
+            try:
+                with field.open('rb') as source:
+                    job_file = JobFile.objects.create(job=job, role=role, name=field.name.rsplit('/', 1)[-1])
+                    index = 0
+                    while data := source.read(CHUNK_SIZE):
+                        JobFileChunk.objects.create(file=job_file, index=index, data=data)
+                        job_file.size += len(data)
+                        index += 1
+                    job_file.save(update_fields=['size'])
+            except OSError:
+                continue
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('input', 'File đầu vào'), ('result', 'File kết quả')], max_length=10, verbose_name='Loại file')),
+                ('name', models.CharField(max_length=255, verbose_name='Tên file')),
+                ('size', models.PositiveBigIntegerField(default=0, verbose_name='Kích thước (byte)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='jobs.job', verbose_name='Công việc')),
+            ],
+            options={
+                'verbose_name': 'File công việc nền',
+                'verbose_name_plural': 'File công việc nền',
+                'constraints': [models.UniqueConstraint(fields=('job', 'role'), name='unique_job_file_role')],
+            },
+        ),
+        migrations.CreateModel(
+            name='JobFileChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField(verbose_name='Thứ tự')),
+                ('data', models.BinaryField(verbose_name='Dữ liệu')),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='file_chunks', to='jobs.jobfile', verbose_name='File')),
+            ],
+            options={
+                'verbose_name': 'Đoạn file công việc nền',
+                'verbose_name_plural': 'Đoạn file công việc nền',
+                'constraints': [models.UniqueConstraint(fields=('file', 'index'), name='unique_job_file_chunk')],
+            },
+        ),
+        migrations.RunPython(copy_files_to_database, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='job',
+            name='input_file',
+        ),
+        migrations.RemoveField(
+            model_name='job',
+            name='result_file',
+        ),
+    ]
@@ -0,0 +1,238 @@
+import logging
+import os
+import socket
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .registry import JobError, get_handler
+
+logger = logging.getLogger(__name__)
+
+
+class Job(models.Model):
+    """Công việc chạy nền (import Excel, xuất báo cáo) được lưu trong database.
+
+    Web worker chỉ tạo Job; lệnh `run_jobs` nhận và chạy từng công việc, cập nhật
+    tiến độ để trang trạng thái hỏi định kỳ. Không cần message broker bên ngoài.
+    File đầu vào và file kết quả nằm trong JobFile vì worker có thể chạy trên máy
+    khác, không dùng chung ổ đĩa với web.
+    """
+    KIND_CHOICES = [
+        ('excel_stage', 'Đọc file Excel nhập kho'),
+        ('excel_commit', 'Nhập kho từ Excel'),
+        ('inventory_report', 'Báo cáo tồn kho (Excel)'),
+        ('import_export_report', 'Báo cáo nhập/xuất (Excel)'),
+        ('profit_report', 'Báo cáo lợi nhuận (Excel)'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Đang chờ'),
+        ('running', 'Đang chạy'),
+        ('succeeded', 'Hoàn thành'),
+        ('failed', 'Lỗi'),
+    ]
+    ACTIVE_STATUSES = ['queued', 'running']
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, verbose_name="Loại công việc")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True, verbose_name="Trạng thái")
+    params = models.JSONField(default=dict, blank=True, verbose_name="Tham số")
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="Tiến độ (%)")
+    message = models.CharField(max_length=255, blank=True, verbose_name="Thông báo")
+    result = models.JSONField(default=dict, blank=True, verbose_name="Kết quả")
+    error = models.TextField(blank=True, verbose_name="Lỗi")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Số lần chạy")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="Worker")
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs', verbose_name="Người tạo")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Công việc nền"
+        verbose_name_plural = "Công việc nền"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
+
+    def get_absolute_url(self):
+        return reverse('jobs:job_detail', args=[self.pk])
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    @classmethod
+    def enqueue(cls, kind, user, params=None, input_file=None):
+        """Tạo công việc mới; chạy ngay trong request nếu bật JOBS_RUN_INLINE (môi trường dev)"""
+        # Job và file đầu vào được ghi cùng transaction để worker không nhận Job khi file chưa có
+        with transaction.atomic():
+            job = cls.objects.create(kind=kind, created_by=user, params=params or {})
+            if input_file is not None:
+                JobFile.store(job, 'input', os.path.basename(input_file.name), input_file)
+        if settings.JOBS_RUN_INLINE:
+            if cls.objects.filter(pk=job.pk, status='queued').update(
+                status='running', started_at=timezone.now(), heartbeat_at=timezone.now(), attempts=1, worker='inline'
+            ):
+                job.refresh_from_db()
+                job.run()
+        return job
+
+    @classmethod
+    def claim_next(cls, worker):
+        """Nhận công việc đang chờ lâu nhất.
+
+        Việc nhận dùng UPDATE có điều kiện status='queued' nên khi nhiều worker
+        cùng chạy, mỗi công việc chỉ được một worker nhận.
+        """
+        while True:
+            job = cls.objects.filter(status='queued').order_by('created_at', 'id').first()
+            if job is None:
+                return None
+            now = timezone.now()
+            claimed = cls.objects.filter(pk=job.pk, status='queued').update(
+                status='running',
+                worker=worker,
+                started_at=now,
+                heartbeat_at=now,
+                attempts=models.F('attempts') + 1,
+            )
+            if claimed:
+                job.refresh_from_db()
+                return job
+
+    @classmethod
+    def requeue_stale(cls, stale_after):
+        """Đưa lại vào hàng đợi các công việc của worker đã dừng (không cập nhật quá stale_after giây)"""
+        cutoff = timezone.now() - timezone.timedelta(seconds=stale_after)
+        return cls.objects.filter(status='running', heartbeat_at__lt=cutoff).update(
+            status='queued', worker='', message='Chạy lại do worker bị dừng'
+        )
+
+    def update_progress(self, progress, message=''):
+        """Ghi tiến độ (0-100) mà không ghi đè các trường khác"""
+        self.progress = max(0, min(100, int(progress)))
+        self.message = message[:255]
+        self.heartbeat_at = timezone.now()
+        Job.objects.filter(pk=self.pk).update(
+            progress=self.progress, message=self.message, heartbeat_at=self.heartbeat_at
+        )
+
+    @property
+    def input_file(self):
+        return self.files.filter(role='input').first()
+
+    @property
+    def result_file(self):
+        return self.files.filter(role='result').first()
+
+    def save_result_file(self, filename, fileobj):
+        JobFile.store(self, 'result', filename, fileobj)
+
+    def run(self):
+        """Chạy hàm xử lý của công việc và lưu kết quả hoặc lỗi"""
+        try:
+            result = get_handler(self.kind)(self)
+        except JobError as e:
+            self._finish('failed', error=str(e), message=str(e)[:255])
+        except Exception as e:
+            logger.exception("Job %s failed", self.pk)
+            self._finish('failed', error=f"{type(e).__name__}: {e}", message='Có lỗi khi xử lý, vui lòng thử lại')
+        else:
+            self.result = result or {}
+            self._finish('succeeded', message=self.result.get('message', 'Hoàn thành'), progress=100)
+
+    def _finish(self, status, message='', error='', progress=None):
+        self.status = status
+        self.message = message
+        self.error = error
+        if progress is not None:
+            self.progress = progress
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'message', 'error', 'progress', 'result', 'finished_at'])
+
+
+class JobFile(models.Model):
+    """File đầu vào/kết quả của công việc nền, lưu trong database theo từng đoạn (JobFileChunk).
+
+    Đọc và ghi từng đoạn nên không phải giữ cả file lớn trong bộ nhớ.
+    """
+    ROLE_CHOICES = [
+        ('input', 'File đầu vào'),
+        ('result', 'File kết quả'),
+    ]
+    CHUNK_SIZE = 1024 * 1024
+
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='files', verbose_name="Công việc")
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, verbose_name="Loại file")
+    name = models.CharField(max_length=255, verbose_name="Tên file")
+    size = models.PositiveBigIntegerField(default=0, verbose_name="Kích thước (byte)")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "File công việc nền"
+        verbose_name_plural = "File công việc nền"
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'role'], name='unique_job_file_role'),
+        ]
+
+    def __str__(self):
+        return f"{self.job_id} {self.role}: {self.name}"
+
+    @classmethod
+    def store(cls, job, role, name, fileobj):
+        """Ghi nội dung fileobj (đọc từ vị trí đầu) thay cho file cùng loại của công việc"""
+        if hasattr(fileobj, 'seek'):
+            fileobj.seek(0)
+        with transaction.atomic():
+            cls.objects.filter(job=job, role=role).delete()
+            job_file = cls.objects.create(job=job, role=role, name=name)
+            index = 0
+            while True:
+                data = fileobj.read(cls.CHUNK_SIZE)
+                if not data:
+                    break
+                JobFileChunk.objects.create(file=job_file, index=index, data=data)
+                job_file.size += len(data)
+                index += 1
+            cls.objects.filter(pk=job_file.pk).update(size=job_file.size)
+        return job_file
+
+    def chunks(self):
+        """Nội dung file theo từng đoạn, mỗi lần chỉ tải một đoạn"""
+        chunk_ids = list(self.file_chunks.order_by('index').values_list('pk', flat=True))
+        for pk in chunk_ids:
+            yield bytes(JobFileChunk.objects.values_list('data', flat=True).get(pk=pk))
+
+    def open(self):
+        """File tạm (xóa khi đóng) chứa nội dung, có phần mở rộng như tên file gốc"""
+        output = tempfile.NamedTemporaryFile(suffix=os.path.splitext(self.name)[1])
+        for data in self.chunks():
+            output.write(data)
+        output.seek(0)
+        return output
+
+
+class JobFileChunk(models.Model):
+    file = models.ForeignKey(JobFile, on_delete=models.CASCADE, related_name='file_chunks', verbose_name="File")
+    index = models.PositiveIntegerField(verbose_name="Thứ tự")
+    data = models.BinaryField(verbose_name="Dữ liệu")
+
+    class Meta:
+        verbose_name = "Đoạn file công việc nền"
+        verbose_name_plural = "Đoạn file công việc nền"
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'index'], name='unique_job_file_chunk'),
+        ]
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
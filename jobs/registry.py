@@ -0,0 +1,25 @@
+"""Đăng ký hàm xử lý cho từng loại công việc nền.
+
+Mỗi app khai báo hàm xử lý trong module `tasks.py` bằng decorator job_handler;
+các module này được nạp tự động khi cần chạy công việc.
+"""
+from django.utils.module_loading import autodiscover_modules
+
+JOB_HANDLERS = {}
+
+
+class JobError(Exception):
+    """Lỗi nghiệp vụ khi chạy công việc nền, thông báo được hiển thị cho người dùng"""
+
+
+def job_handler(kind):
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def get_handler(kind):
+    if kind not in JOB_HANDLERS:
+        autodiscover_modules('tasks')
+    return JOB_HANDLERS[kind]
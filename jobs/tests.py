@@ -0,0 +1,91 @@
+import io
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Job, JobFile
+from .registry import JobError, job_handler
+
+
+@job_handler('test_ok')
+def _ok(job):
+    job.update_progress(50, 'Đang chạy')
+    return {'message': 'Xong', 'value': job.params['value']}
+
+
+@job_handler('test_error')
+def _error(job):
+    raise JobError('Dữ liệu không hợp lệ')
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='clerk')
+
+    def test_claim_is_exclusive_and_fifo(self):
+        first = Job.enqueue('test_ok', self.user, params={'value': 1})
+        second = Job.enqueue('test_ok', self.user, params={'value': 2})
+
+        self.assertEqual(Job.claim_next('w1').pk, first.pk)
+        self.assertEqual(Job.claim_next('w2').pk, second.pk)
+        self.assertIsNone(Job.claim_next('w3'))
+        self.assertEqual(Job.objects.get(pk=first.pk).worker, 'w1')
+
+    def test_run_records_result_and_errors(self):
+        Job.enqueue('test_ok', self.user, params={'value': 7})
+        Job.enqueue('test_error', self.user)
+
+        job = Job.claim_next('w1')
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.message), ('succeeded', 100, 'Xong'))
+        self.assertEqual(job.result['value'], 7)
+
+        job = Job.claim_next('w1')
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.message), ('failed', 'Dữ liệu không hợp lệ'))
+
+    def test_requeue_stale_running_jobs(self):
+        job = Job.enqueue('test_ok', self.user, params={'value': 1})
+        Job.claim_next('w1')
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timezone.timedelta(hours=1))
+
+        self.assertEqual(Job.requeue_stale(600), 1)
+        self.assertEqual(Job.claim_next('w2').attempts, 2)
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_run_inline(self):
+        job = Job.enqueue('test_ok', self.user, params={'value': 3})
+        self.assertEqual(job.status, 'succeeded')
+
+    @mock.patch.object(JobFile, 'CHUNK_SIZE', 4)
+    def test_files_are_stored_in_database(self):
+        upload = io.BytesIO(b'0123456789')
+        upload.name = '/tmp/upload/nhap kho.xlsx'
+        job = Job.enqueue('test_ok', self.user, params={'value': 1}, input_file=upload)
+        self.assertEqual((job.input_file.name, job.input_file.size), ('nhap kho.xlsx', 10))
+        self.assertEqual(job.input_file.file_chunks.count(), 3)
+        with job.input_file.open() as file:
+            self.assertTrue(file.name.endswith('.xlsx'))
+            self.assertEqual(file.read(), b'0123456789')
+
+        # Lưu lại file kết quả thay thế file cũ
+        job.save_result_file('cu.xlsx', io.BytesIO(b'old'))
+        job.save_result_file('bao_cao.xlsx', io.BytesIO(b'abcdefghij'))
+        self.assertEqual(JobFile.objects.filter(job=job, role='result').count(), 1)
+
+        self.client.force_login(self.user)
+        url = reverse('jobs:job_download', args=[job.pk])
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'abcdefghij')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertIn('bao_cao.xlsx', response['Content-Disposition'])
+        self.assertContains(self.client.get(reverse('jobs:job_list')), url)
+
+        other = User.objects.create(username='other')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
@@ -0,0 +1,88 @@
+import mimetypes
+
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db.models import Exists, OuterRef
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.utils.http import content_disposition_header
+
+from .models import Job, JobFile
+
+
+def redirect_to_job(request, job):
+    """Chuyển đến trang theo dõi công việc vừa tạo.
+
+    Nếu công việc đã xong ngay (JOBS_RUN_INLINE) và có trang kết quả thì chuyển thẳng đến đó.
+    """
+    if job.status == 'succeeded' and job.result.get('url'):
+        messages.success(request, job.message)
+        return redirect(job.result['url'])
+    return redirect(job)
+
+def _job_status(job):
+    """Dữ liệu trạng thái công việc cho trang theo dõi (AJAX)"""
+    return {
+        'id': job.pk,
+        'kind': job.get_kind_display(),
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': job.progress,
+        'message': job.message,
+        'is_active': job.is_active,
+        'result_url': job.result.get('url', ''),
+        'download_url': (
+            reverse('jobs:job_download', args=[job.pk]) if job.files.filter(role='result').exists() else ''
+        ),
+    }
+
+@login_required
+def job_list(request):
+    """Khu vực tải về: các công việc nền và file kết quả của người dùng"""
+    jobs = Job.objects.filter(created_by=request.user).annotate(
+        has_result_file=Exists(JobFile.objects.filter(job=OuterRef('pk'), role='result'))
+    ).order_by('-created_at')
+
+    # Phân trang
+    paginator = Paginator(jobs, 20)
+    page_number = request.GET.get('page')
+    page_obj = paginator.get_page(page_number)
+
+    context = {
+        'page_obj': page_obj,
+    }
+    return render(request, 'jobs/job_list.html', context)
+
+@login_required
+def job_detail(request, pk):
+    """Trang theo dõi tiến độ một công việc nền"""
+    job = get_object_or_404(Job, pk=pk, created_by=request.user)
+    context = {
+        'job': job,
+        'status': _job_status(job),
+    }
+    return render(request, 'jobs/job_detail.html', context)
+
+@login_required
+def job_status(request, pk):
+    """Trạng thái và tiến độ công việc nền qua AJAX"""
+    job = get_object_or_404(Job, pk=pk, created_by=request.user)
+    return JsonResponse({'success': True, 'job': _job_status(job)})
+
+@login_required
+def job_download(request, pk):
+    """Tải file kết quả của công việc nền (đọc từ database theo từng đoạn)"""
+    job = get_object_or_404(Job, pk=pk, created_by=request.user)
+    result_file = job.result_file
+    if result_file is None:
+        raise Http404("Công việc chưa có file kết quả")
+    filename = job.result.get('filename') or result_file.name
+    response = StreamingHttpResponse(
+        result_file.chunks(),
+        content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+    )
+    response['Content-Length'] = result_file.size
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
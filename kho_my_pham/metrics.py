@@ -0,0 +1,273 @@
+"""Số liệu vận hành theo định dạng văn bản của Prometheus tại /metrics.
+
+MetricsMiddleware đo thời gian xử lý và mã trạng thái của từng request theo
+tên URL; số câu truy vấn và thời gian SQL lấy từ signal query_stats_recorded
+của QueryStatsMiddleware. Các số liệu này nằm trong bộ nhớ của từng process:
+khi gunicorn chạy nhiều worker, mỗi lần scrape chỉ đọc được worker nhận request.
+
+Công việc nền (import Excel, xuất báo cáo Excel) chạy trong process `run_jobs`
+nên được tính từ bảng Job lúc scrape. Bộ nhớ của các worker gunicorn đọc từ
+/proc (chỉ có trên Linux).
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .querystats import query_stats_recorded
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Giới hạn trên (giây) của các bucket histogram thời gian xử lý request
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Nhãn view cho request không khớp URL nào (404), tránh tạo nhãn theo từng đường dẫn
+UNMATCHED_VIEW = 'unmatched'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Một họ số liệu có nhãn; giá trị được giữ trong bộ nhớ của process"""
+
+    type = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class CounterMetric(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}' for labels, value in items
+        ]
+
+
+class HistogramMetric(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts, total = self._values.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[labels] = (counts, total + value)
+
+    def count(self, *labels):
+        return sum(self._values.get(labels, ([], 0.0))[0])
+
+    def render(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        lines = self.header()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _labels(self.labelnames, labels, le=_number(bound))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+REQUESTS = CounterMetric(
+    'kho_http_requests_total', 'Số request theo tên URL, phương thức và mã trạng thái.',
+    ('view', 'method', 'status'),
+)
+REQUEST_DURATION = HistogramMetric(
+    'kho_http_request_duration_seconds', 'Thời gian xử lý request theo tên URL (giây).', ('view',),
+)
+DB_QUERIES = CounterMetric('kho_db_queries_total', 'Số câu truy vấn database theo tên URL.', ('view',))
+DB_DURATION = CounterMetric(
+    'kho_db_query_duration_seconds_total', 'Tổng thời gian chạy câu truy vấn database theo tên URL (giây).', ('view',),
+)
+DB_DUPLICATES = CounterMetric(
+    'kho_db_duplicate_queries_total', 'Số câu truy vấn lặp lại cùng dạng (nghi N+1) theo tên URL.', ('view',),
+)
+
+REGISTRY = [REQUESTS, REQUEST_DURATION, DB_QUERIES, DB_DURATION, DB_DUPLICATES]
+
+
+def _view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else UNMATCHED_VIEW
+
+
+class MetricsMiddleware:
+    """Đếm request và đo thời gian xử lý theo tên URL; đặt đầu MIDDLEWARE để tính cả các middleware khác"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        view = _view_label(request)
+        REQUEST_DURATION.observe(time.perf_counter() - started, view)
+        REQUESTS.inc(view, request.method, str(response.status_code))
+        return response
+
+
+@receiver(query_stats_recorded)
+def record_query_stats(sender, request, view_name, stats, **kwargs):
+    view = view_name or UNMATCHED_VIEW
+    DB_QUERIES.inc(view, amount=stats.count)
+    DB_DURATION.inc(view, amount=stats.duration)
+    DB_DUPLICATES.inc(view, amount=stats.duplicates)
+
+
+def _job_lines():
+    """Số công việc nền theo loại/trạng thái, thời gian chạy và tốc độ import Excel gần nhất"""
+    from jobs.models import Job
+
+    duration = ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())
+    rows = (
+        Job.objects.order_by()
+        .values('kind', 'status')
+        .annotate(total=Count('id'), duration=Sum(duration))
+        .order_by('kind', 'status')
+    )
+    lines = [
+        '# HELP kho_jobs Số công việc nền theo loại và trạng thái.',
+        '# TYPE kho_jobs gauge',
+    ]
+    finished = []
+    for row in rows:
+        lines.append(f'kho_jobs{_labels(("kind", "status"), (row["kind"], row["status"]))} {row["total"]}')
+        if row['status'] == 'succeeded':
+            finished.append(row)
+    lines += [
+        '# HELP kho_job_duration_seconds Thời gian chạy của các công việc nền đã hoàn thành (giây).',
+        '# TYPE kho_job_duration_seconds summary',
+    ]
+    for row in finished:
+        seconds = row['duration'].total_seconds() if row['duration'] else 0.0
+        lines.append(f'kho_job_duration_seconds_sum{_labels(("kind",), (row["kind"],))} {_number(seconds)}')
+        lines.append(f'kho_job_duration_seconds_count{_labels(("kind",), (row["kind"],))} {row["total"]}')
+
+    last_import = (
+        Job.objects.filter(kind='excel_commit', status='succeeded')
+        .order_by('-finished_at', '-id')
+        .values_list('result', flat=True)
+        .first()
+    )
+    if last_import and 'rows_per_second' in last_import:
+        lines += [
+            '# HELP kho_excel_import_rows_per_second Tốc độ ghi của lần import Excel gần nhất (dòng/giây).',
+            '# TYPE kho_excel_import_rows_per_second gauge',
+            f'kho_excel_import_rows_per_second {_number(float(last_import["rows_per_second"]))}',
+            '# HELP kho_excel_import_rows Số dòng của lần import Excel gần nhất.',
+            '# TYPE kho_excel_import_rows gauge',
+            f'kho_excel_import_rows {int(last_import.get("rows", 0))}',
+        ]
+    return lines
+
+
+def _resident_memory(pid):
+    """Bộ nhớ thực (VmRSS, byte) của process, None nếu không đọc được"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+def _worker_pids():
+    """Các worker gunicorn (process con của master), hoặc chỉ process hiện tại khi chạy server khác"""
+    if not os.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'):
+        return [os.getpid()]
+    master = os.getppid()
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                # Trường thứ 4 là ppid, đứng sau tên process trong ngoặc đơn
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == master:
+            pids.append(int(entry))
+    return sorted(pids) or [os.getpid()]
+
+
+def _memory_lines():
+    if not os.path.isdir('/proc'):
+        return []
+    lines = [
+        '# HELP kho_worker_resident_memory_bytes Bộ nhớ thực của từng worker web (byte).',
+        '# TYPE kho_worker_resident_memory_bytes gauge',
+    ]
+    for pid in _worker_pids():
+        memory = _resident_memory(pid)
+        if memory is not None:
+            lines.append(f'kho_worker_resident_memory_bytes{_labels(("pid",), (pid,))} {memory}')
+    return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    lines += _job_lines()
+    lines += _memory_lines()
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Số liệu cho Prometheus; nếu đặt METRICS_TOKEN thì cần header Authorization: Bearer <token>"""
+    token = settings.METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden('Forbidden')
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
@@ -0,0 +1,135 @@
+"""Đo số câu truy vấn, các câu cùng dạng lặp lại (N+1) và thời gian SQL của từng request.
+
+QueryStatsMiddleware gắn QueryStats vào request (request.query_stats), ghi log
+theo tên URL và gửi signal query_stats_recorded cho các nơi tổng hợp số liệu.
+Khi DEBUG bật, một dạng câu SQL lặp lại quá QUERY_REPEAT_WARNING_THRESHOLD lần
+trong một request được cảnh báo trong log. QueryBudgetMixin dùng cho test để
+khai báo số câu truy vấn tối đa của từng view.
+
+Câu truy vấn chạy trong lúc gửi StreamingHttpResponse (sau khi view trả về)
+không được tính.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+# Gửi sau mỗi request: sender=QueryStatsMiddleware, request, view_name, stats
+query_stats_recorded = Signal()
+
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Dạng của câu SQL: bỏ giá trị cụ thể, gộp danh sách IN (...) có độ dài khác nhau"""
+    sql = _NUMBER.sub('%s', _STRING.sub('%s', sql))
+    return _SPACES.sub(' ', _IN_LIST.sub('(...)', sql)).strip()
+
+
+class QueryStats:
+    """Số câu truy vấn, tổng thời gian SQL và số lần lặp lại của từng câu SQL"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.statements[sql] += 1
+
+    def fingerprints(self):
+        """Số lần chạy của từng dạng câu SQL"""
+        shapes = Counter()
+        for sql, count in self.statements.items():
+            shapes[fingerprint(sql)] += count
+        return shapes
+
+    def repeated(self, threshold=1):
+        """Các dạng câu SQL chạy nhiều hơn threshold lần, nhiều nhất trước"""
+        return [(shape, count) for shape, count in self.fingerprints().most_common() if count > threshold]
+
+    @property
+    def duplicates(self):
+        """Số câu truy vấn thừa: tổng số lần chạy lại của các dạng câu SQL đã gặp"""
+        return sum(count - 1 for _, count in self.repeated())
+
+    def report(self, limit=5):
+        lines = [f'{self.count} câu truy vấn, {self.duration * 1000:.1f} ms SQL']
+        for shape, count in self.repeated()[:limit]:
+            lines.append(f'  {count}x {shape[:200]}')
+        return '\n'.join(lines)
+
+
+class QueryRecorder:
+    """Ghi lại mọi câu truy vấn của các kết nối database trong khối `with recorder.record()`"""
+
+    def __init__(self):
+        self.stats = QueryStats()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.stats.add(sql, time.perf_counter() - started)
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self.stats
+
+
+class QueryStatsMiddleware:
+    """Đo số câu truy vấn và thời gian SQL của từng request, gắn theo tên URL"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.record() as stats:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view_name = match.view_name if match else ''
+        request.query_stats = stats
+        logger.debug(
+            'view=%s queries=%d duplicates=%d sql_ms=%.1f',
+            view_name or request.path, stats.count, stats.duplicates, stats.duration * 1000,
+        )
+        if settings.DEBUG:
+            threshold = settings.QUERY_REPEAT_WARNING_THRESHOLD
+            for shape, count in stats.repeated(threshold):
+                logger.warning(
+                    'Có thể là N+1 ở %s: một dạng câu SQL chạy %d lần trong một request: %s',
+                    view_name or request.path, count, shape[:300],
+                )
+        query_stats_recorded.send(sender=type(self), request=request, view_name=view_name, stats=stats)
+        return response
+
+
+class QueryBudgetMixin:
+    """Mixin cho TestCase: kiểm tra số câu truy vấn của một request không vượt ngân sách"""
+
+    def assertQueryBudget(self, url, budget, data=None):
+        """GET url (đã đăng nhập qua self.client), trả về QueryStats để so sánh giữa các lần gọi"""
+        recorder = QueryRecorder()
+        with recorder.record() as stats:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200, url)
+        self.assertLessEqual(stats.count, budget, f'{url} vượt ngân sách {budget} câu truy vấn\n{stats.report()}')
+        return stats
@@ -49,9 +49,11 @@ INSTALLED_APPS = [
     'products',
     'inventory',
     'reports',
+    'jobs',
 ]
 
 MIDDLEWARE = [
+    'kho_my_pham.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'kho_my_pham.querystats.QueryStatsMiddleware',
 ]
 
 ROOT_URLCONF = 'kho_my_pham.urls'
@@ -97,6 +100,30 @@ DATABASES = {
 }
 
 
+# Cache
+# Mặc định dùng bộ nhớ cục bộ của từng worker; đặt CACHE_BACKEND/CACHE_LOCATION
+# (ví dụ django.core.cache.backends.db.DatabaseCache) để các worker dùng chung cache.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='kho-my-pham'),
+    }
+}
+
+# Thời gian giữ snapshot dashboard (giây); snapshot tự hết hiệu lực khi dữ liệu kho thay đổi
+DASHBOARD_CACHE_TIMEOUT = config('DASHBOARD_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Khi DEBUG bật, cảnh báo trong log nếu một dạng câu SQL chạy quá số lần này trong một request (N+1)
+QUERY_REPEAT_WARNING_THRESHOLD = config('QUERY_REPEAT_WARNING_THRESHOLD', default=10, cast=int)
+
+# Nếu đặt, /metrics yêu cầu header Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Công việc nền (import Excel, xuất báo cáo) chạy bởi lệnh `python manage.py run_jobs`.
+# Bật JOBS_RUN_INLINE để chạy ngay trong request khi phát triển không có worker.
+JOBS_RUN_INLINE = config('JOBS_RUN_INLINE', default=False, cast=bool)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -176,8 +203,11 @@ if not DEBUG:
     # Static files with whitenoise
     STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
     
-    # Add whitenoise middleware
-    MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+    # Add whitenoise middleware (ngay sau SecurityMiddleware)
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+        'whitenoise.middleware.WhiteNoiseMiddleware',
+    )
     
     # Logging for production
     LOGGING = {
@@ -14,18 +14,36 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import logging
+
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from django.db import DatabaseError, connection
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import views as auth_views
 from accounts import views as account_views
+from kho_my_pham.metrics import metrics_view
+
+logger = logging.getLogger(__name__)
+
 
 @csrf_exempt
 def health_check(request):
-    """Health check endpoint for deployment"""
+    """Health check endpoint for deployment: chạy thử một câu truy vấn, trả về 503 nếu database lỗi"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except DatabaseError:
+        logger.exception("Health check: database unavailable")
+        return JsonResponse({
+            'status': 'unhealthy',
+            'message': 'Database unavailable',
+            'database': 'unavailable'
+        }, status=503)
     return JsonResponse({
         'status': 'healthy',
         'message': 'Kho My Pham is running',
@@ -35,6 +53,7 @@ def health_check(request):
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('health/', health_check, name='health_check'),
+    path('metrics', metrics_view, name='metrics'),
     
     # Authentication URLs
     path('accounts/login/', auth_views.LoginView.as_view(template_name='accounts/login.html'), name='login'),
@@ -46,6 +65,7 @@ urlpatterns = [
     path('', include('products.urls')),
     path('inventory/', include('inventory.urls')),
     path('reports/', include('reports.urls')),
+    path('jobs/', include('jobs.urls')),
 ]
 
 # Serve media files during development
@@ -0,0 +1,178 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from inventory.models import EXPIRY_WARNING_DAYS, Batch, ExportItem, ImportItem, InventoryVersion
+from .models import Category, Product
+
+
+class DashboardMetrics:
+    """Tính toàn bộ số liệu dashboard bằng một số câu truy vấn GROUP BY cố định.
+
+    Số câu truy vấn không phụ thuộc vào số lượng sản phẩm hay danh mục.
+    """
+
+    panel_size = 3        # Số sản phẩm hiển thị trong các bảng cảnh báo
+    chart_size = 5        # Số cột của biểu đồ top sản phẩm
+    chart_days = 7        # Số ngày của biểu đồ nhập/xuất
+    expiry_warning_days = EXPIRY_WARNING_DAYS  # 9 tháng
+
+    def __init__(self, today=None):
+        self.today = today or timezone.localdate()
+
+    def totals(self):
+        """Tổng số sản phẩm và tổng tồn kho"""
+        return Product.objects.filter(is_active=True).aggregate(
+            total_products=Count('id'),
+            total_stock_value=Coalesce(Sum('stock_quantity'), 0),
+        )
+
+    def expiring_batches(self):
+        """Lô hàng còn hàng của sản phẩm đang bán"""
+        return Batch.objects.in_stock().filter(product__is_active=True)
+
+    def expiry_summary(self):
+        """Số lô/sản phẩm theo nhóm hạn sử dụng (đã hết hạn, 0–3, 3–6, 6–9 tháng)"""
+        return self.expiring_batches().expiry_summary(self.today)
+
+    def expiring_products(self):
+        """Sản phẩm có lô hàng sắp hết hạn (9 tháng), hết hạn sớm nhất trước"""
+        cutoff = self.today + timezone.timedelta(days=self.expiry_warning_days)
+        product_ids = list(
+            self.expiring_batches().filter(expiry_date__lte=cutoff)
+            .values('product_id')
+            .annotate(first_expiry=Min('expiry_date'))
+            .order_by('first_expiry', 'product_id')
+            .values_list('product_id', flat=True)[:self.panel_size]
+        )
+        products = Product.objects.in_bulk(product_ids)
+        return [{'product': products[pk]} for pk in product_ids if pk in products]
+
+    def low_stock_products(self):
+        """Sản phẩm sắp hết hàng (tổng tồn kho <= 1)"""
+        products = Product.objects.filter(is_active=True, stock_quantity__lte=1)[:self.panel_size]
+        return [{'product': product} for product in products]
+
+    def category_stock(self):
+        """Tồn kho theo danh mục"""
+        rows = Category.objects.annotate(
+            stock=Coalesce(Sum('product__stock_quantity', filter=Q(product__is_active=True)), 0)
+        ).values_list('name', 'stock')
+        labels, values = [], []
+        for name, stock in rows:
+            labels.append(name)
+            values.append(stock)
+        return labels, values
+
+    def lowest_stock(self):
+        """Sản phẩm tồn kho thấp nhất"""
+        rows = list(
+            Product.objects.filter(is_active=True)
+            .order_by('stock_quantity', 'name')
+            .values_list('name', 'stock_quantity')[:self.chart_size]
+        )
+        return [name for name, _ in rows], [stock for _, stock in rows]
+
+    def top_exporters(self):
+        """Sản phẩm bán chạy nhất theo số lượng xuất"""
+        rows = list(
+            ExportItem.objects.values('batch__product__name')
+            .annotate(total_export=Sum('quantity'))
+            .order_by('-total_export')[:self.chart_size]
+        )
+        return [row['batch__product__name'] for row in rows], [row['total_export'] for row in rows]
+
+    def daily_movements(self):
+        """Số lượng nhập/xuất theo ngày, mỗi loại một câu GROUP BY"""
+        days = [self.today - timezone.timedelta(days=i) for i in range(self.chart_days - 1, -1, -1)]
+        imports = dict(
+            ImportItem.objects.filter(import_order__import_date__date__gte=days[0])
+            .annotate(day=TruncDate('import_order__import_date'))
+            .values('day')
+            .annotate(total=Sum('quantity'))
+            .values_list('day', 'total')
+        )
+        exports = dict(
+            ExportItem.objects.filter(export_order__export_date__date__gte=days[0])
+            .annotate(day=TruncDate('export_order__export_date'))
+            .values('day')
+            .annotate(total=Sum('quantity'))
+            .values_list('day', 'total')
+        )
+        labels = [day.strftime('%d/%m') for day in days]
+        return labels, [imports.get(day, 0) for day in days], [exports.get(day, 0) for day in days]
+
+    def build(self):
+        """Context đầy đủ cho template dashboard"""
+        totals = self.totals()
+        category_labels, category_stock = self.category_stock()
+        low_stock_names, low_stock_values = self.lowest_stock()
+        top_export_names, top_export_values = self.top_exporters()
+        date_labels, import_data, export_data = self.daily_movements()
+
+        return {
+            'total_products': totals['total_products'],
+            'total_stock_value': totals['total_stock_value'],
+            'expiring_products': self.expiring_products(),
+            'expiry_summary': self.expiry_summary(),
+            'low_stock_products': self.low_stock_products(),
+            # Dashboard chart data
+            'category_labels': json.dumps(category_labels, ensure_ascii=False),
+            'category_stock': json.dumps(category_stock),
+            'low_stock_names': json.dumps(low_stock_names, ensure_ascii=False),
+            'low_stock_values': json.dumps(low_stock_values),
+            'top_export_names': json.dumps(top_export_names, ensure_ascii=False),
+            'top_export_values': json.dumps(top_export_values),
+            'date_labels': json.dumps(date_labels),
+            'import_data': json.dumps(import_data),
+            'export_data': json.dumps(export_data),
+        }
+
+
+def dashboard_snapshot_key(version, today):
+    """Khóa cache theo phiên bản dữ liệu kho và ngày (nhóm hạn sử dụng, biểu đồ 7 ngày đổi theo ngày)"""
+    return f'dashboard:snapshot:{today:%Y%m%d}:v{version}'
+
+
+def build_dashboard_snapshot(version=None, today=None):
+    """Tính lại và lưu snapshot dashboard cho phiên bản dữ liệu kho hiện tại"""
+    if version is None:
+        version = InventoryVersion.current()
+    today = today or timezone.localdate()
+    snapshot = DashboardMetrics(today).build()
+    cache.set(dashboard_snapshot_key(version, today), snapshot, settings.DASHBOARD_CACHE_TIMEOUT)
+    return snapshot
+
+
+def get_dashboard_snapshot(wait_timeout=5):
+    """Snapshot dashboard theo phiên bản dữ liệu kho.
+
+    Chỉ một request tính lại snapshot sau mỗi thay đổi; các request đồng thời
+    chờ snapshot đó thay vì cùng tính lại.
+    """
+    version = InventoryVersion.current()
+    today = timezone.localdate()
+    key = dashboard_snapshot_key(version, today)
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        return snapshot
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, wait_timeout * 2):
+        try:
+            return build_dashboard_snapshot(version, today)
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        snapshot = cache.get(key)
+        if snapshot is not None:
+            return snapshot
+    return build_dashboard_snapshot(version, today)
@@ -0,0 +1,194 @@
+import json
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from inventory.models import Export
+from inventory.synthetic import SYNTHETIC_PREFIX, SyntheticScale, build_catalog
+from kho_my_pham.querystats import QueryRecorder
+from products.models import Product
+
+# (tên, URL name, tham số GET) của các trang được đo
+PAGES = [
+    ('dashboard', 'products:dashboard', {}),
+    ('product_list', 'products:product_list', {}),
+    ('product_search', 'products:product_list', {'search': 'kem duong'}),
+    ('export_typeahead', 'inventory:export_product_typeahead', {'q': 'son'}),
+    ('import_list', 'inventory:import_list', {}),
+    ('export_list', 'inventory:export_list', {}),
+    ('inventory_report', 'reports:inventory_report', {}),
+    ('stock_history_report', 'reports:stock_history_report', {}),
+    ('import_export_report', 'reports:import_export_report', {}),
+    ('profit_report', 'reports:profit_report', {}),
+    ('inventory_excel', 'reports:export_inventory_excel', {}),
+    ('import_export_excel', 'reports:export_import_export_excel', {}),
+    ('profit_excel', 'reports:export_profit_excel', {}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Sinh bộ dữ liệu giả lập trong một database test riêng rồi đo thời gian, số câu truy vấn "
+        "và bộ nhớ đỉnh của các trang chính, ghi kết quả ra file JSON để so sánh giữa các lần chạy"
+    )
+
+    def add_arguments(self, parser):
+        defaults = SyntheticScale()
+        parser.add_argument('--products', type=int, default=defaults.products, help='Số sản phẩm')
+        parser.add_argument('--batches', type=int, default=defaults.batches, help='Số lô hàng')
+        parser.add_argument('--export-lines', type=int, default=defaults.export_lines, help='Số dòng xuất kho')
+        parser.add_argument('--seed', type=int, default=defaults.seed, help='Seed của bộ sinh dữ liệu')
+        parser.add_argument('--repeat', type=int, default=3, help='Số lần đo mỗi trang (lấy trung vị)')
+        parser.add_argument('--output', default='benchmark.json', help='File JSON kết quả')
+        parser.add_argument('--compare', help='File JSON của lần chạy trước để so sánh')
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Giữ database test và dữ liệu đã sinh cho lần chạy sau (không dùng được với SQLite trong bộ nhớ)',
+        )
+
+    def handle(self, *args, **options):
+        scale = SyntheticScale(
+            products=options['products'],
+            batches=options['batches'],
+            export_lines=options['export_lines'],
+            seed=options['seed'],
+        )
+        if min(scale.products, scale.batches, options['repeat']) < 1 or scale.export_lines < 0:
+            raise CommandError('Số sản phẩm, số lô và số lần đo phải lớn hơn 0')
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    previous = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Không đọc được file so sánh {options['compare']}: {e}")
+
+        # Không bao giờ sinh dữ liệu vào database thật: dùng database test giống `manage.py test`
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            report = self._run(scale, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self._print(report, previous)
+        self.stdout.write(self.style.SUCCESS(f"Đã ghi kết quả vào {options['output']}"))
+
+    def _run(self, scale, repeat):
+        user, _ = User.objects.get_or_create(username='benchmark')
+        started = time.perf_counter()
+        if Product.objects.filter(code__startswith=SYNTHETIC_PREFIX).exists():
+            self.stdout.write('Dùng lại dữ liệu giả lập trong database test (--keepdb)')
+            dataset = None
+        else:
+            self.stdout.write(
+                f'Sinh dữ liệu: {scale.products} sản phẩm, {scale.batches} lô, {scale.export_lines} dòng xuất'
+            )
+            dataset = build_catalog(scale, user=user, stdout=self.stdout)
+        seed_seconds = time.perf_counter() - started
+
+        client = Client()
+        client.force_login(user)
+        requests = [
+            (name, 'get', reverse(url_name), params) for name, url_name, params in PAGES
+        ]
+        # Nhập phiếu xuất: mở trang thêm sản phẩm và thêm một dòng (trừ tồn kho theo FIFO)
+        export_order = Export.objects.create(created_by=user)
+        product = Product.objects.filter(is_active=True, stock_quantity__gte=repeat * 2).order_by('pk').first()
+        entry_url = reverse('inventory:export_add_items', args=[export_order.pk])
+        requests.append(('export_entry', 'get', entry_url, {}))
+        if product is not None:
+            requests.append(('export_add_item', 'post', entry_url, {
+                'product': product.pk,
+                'quantity': 1,
+                'unit_price': product.selling_price,
+                'discount_percent': 0,
+            }))
+
+        results = {}
+        for name, method, url, data in requests:
+            results[name] = self._measure(client, method, url, data, repeat)
+            self.stdout.write(f"  {name}: {results[name]['wall_ms']['median']} ms")
+        return {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'scale': asdict(scale),
+            'dataset': dataset,
+            'seed_seconds': round(seed_seconds, 2),
+            'repeat': repeat,
+            'results': results,
+        }
+
+    def _request(self, client, method, url, data):
+        """Gửi request và đọc hết nội dung (kể cả StreamingHttpResponse); trả về (status, số byte)"""
+        response = getattr(client, method)(url, data)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        return response.status_code, size
+
+    def _measure(self, client, method, url, data, repeat):
+        timings = []
+        for _ in range(repeat):
+            # Đo khi cache trống (dashboard có snapshot cache)
+            cache.clear()
+            recorder = QueryRecorder()
+            started = time.perf_counter()
+            with recorder.record() as stats:
+                status, size = self._request(client, method, url, data)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        # Bộ nhớ đo ở lần chạy riêng vì tracemalloc làm chậm request
+        cache.clear()
+        tracemalloc.start()
+        try:
+            self._request(client, method, url, data)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'url': url,
+            'method': method.upper(),
+            'status': status,
+            'wall_ms': {
+                'min': round(min(timings), 1),
+                'median': round(statistics.median(timings), 1),
+                'max': round(max(timings), 1),
+            },
+            'queries': stats.count,
+            'sql_ms': round(stats.duration * 1000, 1),
+            'peak_memory_kb': round(peak / 1024),
+            'response_kb': round(size / 1024, 1),
+        }
+
+    def _print(self, report, previous):
+        previous_results = (previous or {}).get('results', {})
+        self.stdout.write(f"\n{'Trang':<24}{'ms (trung vị)':>15}{'truy vấn':>10}{'bộ nhớ KB':>12}")
+        for name, result in report['results'].items():
+            line = (
+                f"{name:<24}{result['wall_ms']['median']:>15}{result['queries']:>10}"
+                f"{result['peak_memory_kb']:>12}"
+            )
+            before = previous_results.get(name)
+            if before:
+                ratio = result['wall_ms']['median'] / before['wall_ms']['median'] if before['wall_ms']['median'] else 0
+                line += f"   trước: {before['wall_ms']['median']} ms, {before['queries']} truy vấn (x{ratio:.2f})"
+            if result['status'] >= 400:
+                line = self.style.ERROR(f"{line}   HTTP {result['status']}")
+            self.stdout.write(line)
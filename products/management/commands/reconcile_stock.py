@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Kiểm tra và tính lại tồn kho lưu sẵn (Product.stock_quantity) từ các lô hàng"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Chỉ kiểm tra, không ghi lại dữ liệu (thoát với mã lỗi nếu có sai lệch)',
+        )
+
+    def handle(self, *args, **options):
+        # Một câu GROUP BY so sánh giá trị lưu sẵn với tổng remaining_quantity thực tế
+        drifted = (
+            Product.objects
+            .annotate(actual_stock=Coalesce(Sum('batches__remaining_quantity', filter=Q(batches__is_active=True)), 0))
+            .exclude(stock_quantity=F('actual_stock'))
+            .values_list('code', 'stock_quantity', 'actual_stock')
+        )
+        drifted = list(drifted)
+
+        for code, stored, actual in drifted[:20]:
+            self.stdout.write(f"  {code}: lưu {stored}, thực tế {actual}")
+        if len(drifted) > 20:
+            self.stdout.write(f"  ... và {len(drifted) - 20} sản phẩm khác")
+
+        if options['check']:
+            if drifted:
+                raise CommandError(f"Có {len(drifted)} sản phẩm sai lệch tồn kho")
+            self.stdout.write(self.style.SUCCESS("Tồn kho lưu sẵn khớp với lô hàng"))
+            return
+
+        with transaction.atomic():
+            updated = Product.objects.refresh_stock()
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã tính lại tồn kho cho {updated} sản phẩm ({len(drifted)} sản phẩm bị sai lệch)"
+        ))
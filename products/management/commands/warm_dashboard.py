@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from inventory.models import InventoryVersion
+from products.dashboard import build_dashboard_snapshot
+
+
+class Command(BaseCommand):
+    help = "Tính trước snapshot dashboard cho phiên bản dữ liệu kho hiện tại (chạy sau deploy/import)"
+
+    def handle(self, *args, **options):
+        version = InventoryVersion.current()
+        build_dashboard_snapshot(version)
+        self.stdout.write(self.style.SUCCESS(f"Đã làm nóng snapshot dashboard (phiên bản dữ liệu v{version})"))
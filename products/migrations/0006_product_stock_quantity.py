@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:46
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_stock_quantity(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Batch = apps.get_model('inventory', 'Batch')
+    batch_stock = (
+        Batch.objects.filter(product=OuterRef('pk'), is_active=True)
+        .order_by()
+        .values('product')
+        .annotate(total=Sum('remaining_quantity'))
+        .values('total')
+    )
+    Product.objects.update(stock_quantity=Coalesce(Subquery(batch_stock), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_alter_product_description'),
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_quantity',
+            field=models.IntegerField(db_index=True, default=0, editable=False, verbose_name='Tồn kho'),
+        ),
+        migrations.RunPython(populate_stock_quantity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:51
+
+from django.db import migrations, models
+
+
+def code_keys(code):
+    """Mọi cách đọc mã dạng PREFIX + YEAR + SEQUENCE thành (tiền tố, năm, số thứ tự).
+
+    Tiền tố lấy từ tên danh mục/sản phẩm lúc tạo (tối đa 3 ký tự) và tên có thể
+    đã bị sửa, nên không suy ra tiền tố từ tên hiện tại mà thử mọi độ dài tiền tố.
+    Cách đọc thừa chỉ làm bộ đếm nhảy số, không bao giờ cấp lại mã đã có.
+    """
+    for length in range(4):
+        rest = (code or '')[length:]
+        if 7 <= len(rest) <= 13 and rest.isascii() and rest.isdigit():
+            yield code[:length], int(rest[:4]), int(rest[4:])
+
+
+def seed_sequences(apps, schema_editor):
+    """Khởi tạo bộ đếm từ số thứ tự lớn nhất của các mã đã có"""
+    DocumentSequence = apps.get_model('products', 'DocumentSequence')
+    Product = apps.get_model('products', 'Product')
+    Batch = apps.get_model('inventory', 'Batch')
+    Import = apps.get_model('inventory', 'Import')
+    Export = apps.get_model('inventory', 'Export')
+
+    querysets = [
+        Product.objects.values_list('code', flat=True),
+        Batch.objects.values_list('batch_code', flat=True),
+        Import.objects.values_list('import_code', flat=True),
+        Export.objects.values_list('export_code', flat=True),
+    ]
+    last_values = {}
+    for queryset in querysets:
+        for code in queryset.iterator():
+            for prefix, year, number in code_keys(code):
+                key = (prefix, year)
+                last_values[key] = max(last_values.get(key, 0), number)
+    DocumentSequence.objects.bulk_create([
+        DocumentSequence(prefix=prefix, year=year, last_value=last_value)
+        for (prefix, year), last_value in last_values.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_stock_quantity'),
+        ('inventory', '0003_export_allocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=50, verbose_name='Tiền tố')),
+                ('year', models.IntegerField(verbose_name='Năm')),
+                ('last_value', models.PositiveIntegerField(default=0, verbose_name='Số cuối đã cấp')),
+            ],
+            options={
+                'verbose_name': 'Bộ đếm chứng từ',
+                'verbose_name_plural': 'Bộ đếm chứng từ',
+                'constraints': [models.UniqueConstraint(fields=('prefix', 'year'), name='unique_document_sequence')],
+            },
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
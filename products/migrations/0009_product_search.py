@@ -0,0 +1,75 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from products.search import SEARCH_TOKEN_LENGTH, normalize_text
+
+
+def populate_search_text(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductSearchToken = apps.get_model('products', 'ProductSearchToken')
+    use_tokens = schema_editor.connection.vendor != 'postgresql'
+    products = Product.objects.select_related('category').only('pk', 'name', 'code', 'category__name')
+    batch = []
+    for product in products.iterator(chunk_size=1000):
+        product.search_text = normalize_text(' '.join(filter(None, [product.name, product.category.name, product.code])))
+        batch.append(product)
+        if len(batch) >= 1000:
+            _save_batch(Product, ProductSearchToken, batch, use_tokens)
+            batch = []
+    _save_batch(Product, ProductSearchToken, batch, use_tokens)
+
+
+def _save_batch(Product, ProductSearchToken, products, use_tokens):
+    Product.objects.bulk_update(products, ['search_text'])
+    if use_tokens:
+        ProductSearchToken.objects.bulk_create([
+            ProductSearchToken(product_id=product.pk, token=token[:SEARCH_TOKEN_LENGTH])
+            for product in products
+            for token in dict.fromkeys(product.search_text.split())
+        ])
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS product_search_trgm_idx '
+            'ON products_product USING gin (search_text gin_trgm_ops)'
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS product_search_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_name_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_text',
+            field=models.CharField(blank=True, default='', editable=False, max_length=400, verbose_name='Nội dung tìm kiếm'),
+        ),
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=50, verbose_name='Từ khóa')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='products.product', verbose_name='Sản phẩm')),
+            ],
+            options={
+                'verbose_name': 'Từ khóa tìm kiếm sản phẩm',
+                'verbose_name_plural': 'Từ khóa tìm kiếm sản phẩm',
+                'indexes': [models.Index(fields=['token', 'product'], name='product_search_token_idx')],
+            },
+        ),
+        migrations.RunPython(populate_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
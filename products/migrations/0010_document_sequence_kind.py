@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+# Loại chứng từ -> (app, model, trường mã)
+KIND_CODES = {
+    'product': ('products', 'Product', 'code'),
+    'batch': ('inventory', 'Batch', 'batch_code'),
+    'import': ('inventory', 'Import', 'import_code'),
+    'export': ('inventory', 'Export', 'export_code'),
+}
+
+
+def code_keys(code):
+    """Mọi cách đọc mã thành (tiền tố tối đa 3 ký tự, năm, số thứ tự), giống 0007_document_sequence"""
+    for length in range(4):
+        rest = (code or '')[length:]
+        if 7 <= len(rest) <= 13 and rest.isascii() and rest.isdigit():
+            yield code[:length], int(rest[:4]), int(rest[4:])
+
+
+def split_sequences(apps, schema_editor):
+    """Tách bộ đếm dùng chung thành một bộ đếm cho mỗi loại chứng từ.
+
+    Trước đây mọi loại chứng từ cùng tiền tố dùng chung một bộ đếm, nên số cuối
+    đã cấp là cận trên cho từng loại: sao chép cho mọi loại để không cấp lại số cũ.
+    Bộ đếm cũ có thể thiếu tiền tố của các mã đã đổi tên danh mục/sản phẩm, nên
+    mỗi loại còn lấy số lớn nhất đọc được từ chính các mã đã có.
+    """
+    DocumentSequence = apps.get_model('products', 'DocumentSequence')
+    shared = list(DocumentSequence.objects.values_list('prefix', 'year', 'last_value'))
+    last_values = {}
+    for kind, (app_label, model_name, field) in KIND_CODES.items():
+        for prefix, year, last_value in shared:
+            last_values[(kind, prefix, year)] = last_value
+        model = apps.get_model(app_label, model_name)
+        for code in model.objects.values_list(field, flat=True).iterator():
+            for prefix, year, number in code_keys(code):
+                key = (kind, prefix, year)
+                last_values[key] = max(last_values.get(key, 0), number)
+    DocumentSequence.objects.all().delete()
+    DocumentSequence.objects.bulk_create([
+        DocumentSequence(kind=kind, prefix=prefix, year=year, last_value=last_value)
+        for (kind, prefix, year), last_value in last_values.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_search'),
+        ('inventory', '0003_export_allocation'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='documentsequence',
+            name='unique_document_sequence',
+        ),
+        migrations.AddField(
+            model_name='documentsequence',
+            name='kind',
+            field=models.CharField(
+                choices=[('product', 'Sản phẩm'), ('batch', 'Lô hàng'), ('import', 'Phiếu nhập'), ('export', 'Phiếu xuất')],
+                default='product', max_length=20, verbose_name='Loại chứng từ',
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(split_sequences, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='documentsequence',
+            constraint=models.UniqueConstraint(fields=('kind', 'prefix', 'year'), name='unique_document_sequence'),
+        ),
+    ]
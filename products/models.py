@@ -1,7 +1,88 @@
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 
+from .search import build_search_text, index_products
+
+class DocumentSequence(models.Model):
+    """Bộ đếm số thứ tự chứng từ theo (loại chứng từ, tiền tố, năm), tăng nguyên tử.
+
+    Thay cho việc đếm các mã đã có (LIKE + COUNT) mỗi lần tạo mã mới: không bị
+    trùng mã khi tạo đồng thời và không dùng lại số đã cấp sau khi xóa. Sản phẩm
+    và lô hàng có cùng tiền tố (3 chữ cái đầu của tên) vẫn dùng bộ đếm riêng.
+    """
+    KIND_CHOICES = [
+        ('product', 'Sản phẩm'),
+        ('batch', 'Lô hàng'),
+        ('import', 'Phiếu nhập'),
+        ('export', 'Phiếu xuất'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Loại chứng từ")
+    prefix = models.CharField(max_length=50, verbose_name="Tiền tố")
+    year = models.IntegerField(verbose_name="Năm")
+    last_value = models.PositiveIntegerField(default=0, verbose_name="Số cuối đã cấp")
+
+    class Meta:
+        verbose_name = "Bộ đếm chứng từ"
+        verbose_name_plural = "Bộ đếm chứng từ"
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'prefix', 'year'], name='unique_document_sequence'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.prefix}{self.year}: {self.last_value}"
+
+    @classmethod
+    def reserve(cls, kind, prefix, year, count=1):
+        """Giữ `count` số liên tiếp trong một lần ghi, trả về số đầu tiên"""
+        if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+            last_value = cls._upsert(kind, prefix, year, count)
+            return last_value - count + 1
+
+        sequence = cls.objects.filter(kind=kind, prefix=prefix, year=year)
+        with transaction.atomic():
+            if not sequence.update(last_value=F('last_value') + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(kind=kind, prefix=prefix, year=year, last_value=count)
+                    return 1
+                except IntegrityError:
+                    # Một transaction khác vừa tạo bộ đếm này
+                    sequence.update(last_value=F('last_value') + count)
+            last_value = sequence.values_list('last_value', flat=True).get()
+        return last_value - count + 1
+
+    @classmethod
+    def _upsert(cls, kind, prefix, year, count):
+        """Tạo hoặc tăng bộ đếm bằng một câu INSERT ... ON CONFLICT ... RETURNING, trả về số cuối"""
+        quote = connection.ops.quote_name
+        table = quote(cls._meta.db_table)
+        sql = (
+            f"INSERT INTO {table} ({quote('kind')}, {quote('prefix')}, {quote('year')}, {quote('last_value')}) "
+            f"VALUES (%s, %s, %s, %s) "
+            f"ON CONFLICT ({quote('kind')}, {quote('prefix')}, {quote('year')}) "
+            f"DO UPDATE SET {quote('last_value')} = {table}.{quote('last_value')} + excluded.{quote('last_value')} "
+            f"RETURNING {quote('last_value')}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [kind, prefix, year, count])
+            return cursor.fetchone()[0]
+
+    @classmethod
+    def next_codes(cls, kind, prefix, year, count=1):
+        """Danh sách `count` mã mới dạng PREFIX + YEAR + SEQUENCE (tối thiểu 3 chữ số)"""
+        first = cls.reserve(kind, prefix, year, count)
+        return [f"{prefix}{year}{number:03d}" for number in range(first, first + count)]
+
+    @classmethod
+    def next_code(cls, kind, prefix, year):
+        return cls.next_codes(kind, prefix, year)[0]
+
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Tên danh mục")
     description = models.TextField(blank=True, verbose_name="Mô tả")
@@ -16,6 +97,35 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    def lock_for_update(self):
+        """Khóa các dòng sản phẩm (SELECT ... FOR UPDATE) theo thứ tự id, trả về danh sách id.
+
+        Phải gọi trong transaction. Các thao tác ghi tồn kho khóa sản phẩm trước
+        lô hàng và theo cùng thứ tự nên xếp hàng tuần tự mà không deadlock.
+        """
+        return list(self.select_for_update().order_by('pk').values_list('pk', flat=True))
+
+    def refresh_stock(self):
+        """Tính lại tồn kho lưu trữ từ các lô hàng đang hoạt động (một câu UPDATE).
+
+        Dòng sản phẩm được khóa trước: trên PostgreSQL (READ COMMITTED), câu UPDATE
+        phải chờ khóa dòng vẫn tính subquery theo snapshot cũ và bỏ sót số lượng lô
+        vừa được transaction khác trừ; câu UPDATE chạy sau khi đã giữ khóa thì thấy đủ.
+        """
+        from inventory.models import Batch
+
+        batch_stock = (
+            Batch.objects.filter(product=OuterRef('pk'), is_active=True)
+            .order_by()
+            .values('product')
+            .annotate(total=Sum('remaining_quantity'))
+            .values('total')
+        )
+        with transaction.atomic():
+            self.lock_for_update()
+            return self.update(stock_quantity=Coalesce(Subquery(batch_stock), 0))
+
 class Product(models.Model):
     UNIT_CHOICES = [
         ('hop', 'Hộp'),
@@ -34,13 +144,23 @@ class Product(models.Model):
     expiry_date = models.DateField(verbose_name="Hạn sử dụng", null=True, blank=True)
     description = models.TextField(blank=True, null=True, verbose_name="Mô tả")
     is_active = models.BooleanField(default=True, verbose_name="Đang hoạt động")
+    # Tồn kho lưu sẵn, được cập nhật cùng transaction với mọi thay đổi của Batch
+    stock_quantity = models.IntegerField(default=0, db_index=True, editable=False, verbose_name="Tồn kho")
+    # Tên, danh mục và mã đã bỏ dấu, viết thường cho tìm kiếm (products.search)
+    search_text = models.CharField(max_length=400, blank=True, default='', editable=False, verbose_name="Nội dung tìm kiếm")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Sản phẩm"
         verbose_name_plural = "Sản phẩm"
         ordering = ['name']
+        indexes = [
+            # Phân trang theo con trỏ trên danh sách sản phẩm (products.pagination)
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.code} - {self.name}"
@@ -52,6 +172,13 @@ class Product(models.Model):
         # Tự động tạo mã sản phẩm nếu chưa có
         if not self.code:
             self.code = self.generate_product_code()
+        self.search_text = build_search_text(self)
+        # Không ghi đè tồn kho bằng giá trị cũ trong bộ nhớ, cột này do Batch duy trì
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'stock_quantity'
+            ]
         super().save(*args, **kwargs)
 
     def generate_product_code(self):
@@ -64,19 +191,13 @@ class Product(models.Model):
         # Lấy năm hiện tại
         current_year = datetime.datetime.now().year
         
-        # Tìm số thứ tự tiếp theo trong năm
-        existing_products = Product.objects.filter(
-            code__startswith=f"{category_prefix}{current_year}"
-        ).count()
-        
-        # Tạo mã mới: CATEGORY + YEAR + SEQUENCE (3 chữ số)
-        sequence = existing_products + 1
-        return f"{category_prefix}{current_year}{sequence:03d}"
+        # Lấy số thứ tự tiếp theo từ bộ đếm: CATEGORY + YEAR + SEQUENCE (3 chữ số)
+        return DocumentSequence.next_code("product", category_prefix, current_year)
 
     @property
     def total_stock(self):
-        """Tổng tồn kho của sản phẩm"""
-        return sum(batch.remaining_quantity for batch in self.batches.filter(is_active=True))
+        """Tổng tồn kho của sản phẩm (đọc từ cột lưu sẵn)"""
+        return self.stock_quantity
 
     @property
     def low_stock_batches(self):
@@ -87,14 +208,39 @@ class Product(models.Model):
     def expiring_batches(self):
         """Các lô hàng sắp hết hạn (9 tháng)"""
         nine_months_from_now = timezone.now().date() + timezone.timedelta(days=270)  # 9 tháng = 270 ngày
-        # Lọc các lô hàng có hạn sử dụng sắp hết
-        expiring_batches = []
-        for batch in self.batches.filter(is_active=True):
-            if batch.expiry_date and batch.expiry_date <= nine_months_from_now:
-                expiring_batches.append(batch)
-        return expiring_batches
+        return self.batches.filter(is_active=True, expiry_date__lte=nine_months_from_now)
 
     @property
     def average_import_price(self):
         """Giá nhập trung bình của sản phẩm (sử dụng giá mua từ sản phẩm)"""
-        return self.purchase_price or 0 
\ No newline at end of file
+        return self.purchase_price or 0 
+class ProductSearchToken(models.Model):
+    """Từng từ trong search_text của sản phẩm, dùng để tìm theo tiền tố khi không có PostgreSQL"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_tokens', verbose_name="Sản phẩm")
+    token = models.CharField(max_length=50, verbose_name="Từ khóa")
+
+    class Meta:
+        verbose_name = "Từ khóa tìm kiếm sản phẩm"
+        verbose_name_plural = "Từ khóa tìm kiếm sản phẩm"
+        indexes = [
+            models.Index(fields=['token', 'product'], name='product_search_token_idx'),
+        ]
+
+    def __str__(self):
+        return self.token
+
+@receiver(post_save, sender=Product)
+def update_product_search_tokens(sender, instance, **kwargs):
+    """Ghi lại từ khóa tìm kiếm khi sản phẩm thay đổi"""
+    index_products([instance.pk])
+
+@receiver(post_save, sender=Category)
+def update_category_search_text(sender, instance, created, **kwargs):
+    """Tên danh mục nằm trong search_text của sản phẩm nên cần tính lại khi đổi tên"""
+    if created:
+        return
+    products = list(Product.objects.filter(category=instance).only('pk', 'name', 'code', 'search_text'))
+    for product in products:
+        product.search_text = build_search_text(product, instance.name)
+    Product.objects.bulk_update(products, ['search_text'], batch_size=1000)
+    index_products([product.pk for product in products])
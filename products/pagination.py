@@ -0,0 +1,189 @@
+"""Phân trang theo con trỏ (keyset) cho các danh sách dài.
+
+Thay vì COUNT(*) và OFFSET như Paginator, mỗi trang được lọc theo giá trị khóa
+sắp xếp của dòng cuối/đầu trang trước (ví dụ (import_date, id) < (x, y)) nên
+trang nào cũng tốn một câu truy vấn giống trang đầu, dùng được index. Con trỏ
+được mã hóa vào URL (?after=... / ?before=...), liên kết trước/sau không bị
+lệch khi có phiếu mới được thêm vào.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.utils.http import urlencode
+
+# Giá trị của ?before= để mở trang cuối cùng
+LAST_PAGE = 'last'
+
+
+class InvalidCursor(Exception):
+    """Con trỏ trong URL không giải mã được"""
+
+
+def approximate_count(queryset):
+    """Số dòng ước lượng từ thống kê của database (EXPLAIN), None nếu không hỗ trợ.
+
+    Chỉ PostgreSQL có ước lượng rẻ cho truy vấn có điều kiện lọc; với database
+    khác không đếm để giữ chi phí mỗi trang không đổi.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPage:
+    """Một trang kết quả; duyệt được như Page của Paginator"""
+
+    def __init__(self, paginator, object_list, has_next, has_previous, params):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.params = params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _query(self, **cursor):
+        params = {key: value for key, value in self.params.items() if key not in ('after', 'before', 'page')}
+        params.update(cursor)
+        return f'?{urlencode(params)}' if params else '?'
+
+    @property
+    def first_query(self):
+        return self._query()
+
+    @property
+    def last_query(self):
+        return self._query(before=LAST_PAGE)
+
+    @property
+    def next_query(self):
+        return self._query(after=self.paginator.encode_cursor(self.object_list[-1]))
+
+    @property
+    def previous_query(self):
+        if not self.object_list:
+            return self.last_query
+        return self._query(before=self.paginator.encode_cursor(self.object_list[0]))
+
+    @property
+    def approximate_total(self):
+        return self.paginator.approximate_total
+
+
+class KeysetPaginator:
+    """Phân trang queryset theo các trường sắp xếp, trường cuối cùng phải là khóa duy nhất.
+
+    ordering: ví dụ ('-import_date', '-id') hoặc ('name', 'id'); có thể dùng cột
+    annotate không rỗng (ví dụ '-search_rank') nếu giá trị so sánh bằng chính xác
+    được sau khi qua JSON (số nguyên, không dùng số thực).
+    """
+
+    def __init__(self, queryset, per_page, ordering, with_total=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.with_total = with_total
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, field) for field in self.fields]
+        # str() giữ đủ micro giây của datetime, to_python() của từng trường đọc lại được
+        data = json.dumps(values, default=str, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(data)
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise InvalidCursor(cursor)
+            return [self._to_python(field, value) for field, value in zip(self.fields, values)]
+        except (ValueError, TypeError, binascii.Error, ValidationError) as e:
+            raise InvalidCursor(cursor) from e
+
+    def _to_python(self, name, value):
+        # Cột annotate (ví dụ điểm xếp hạng) giữ nguyên giá trị JSON
+        if name in self.queryset.query.annotations:
+            return value
+        return self.queryset.model._meta.get_field(name).to_python(value)
+
+    def _seek(self, values, forward):
+        """Điều kiện các dòng đứng sau (forward) hoặc trước con trỏ theo thứ tự sắp xếp"""
+        condition = Q()
+        for index, name in enumerate(self.ordering):
+            descending = name.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{f'{self.fields[index]}__{lookup}': values[index]})
+            for field, value in zip(self.fields[:index], values[:index]):
+                term &= Q(**{field: value})
+            condition |= term
+        return condition
+
+    @staticmethod
+    def _reverse(ordering):
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+
+    def get_page(self, params):
+        """Trang theo ?after= hoặc ?before= trong params (request.GET); con trỏ lỗi trả về trang đầu"""
+        after = params.get('after')
+        before = params.get('before')
+        try:
+            if before == LAST_PAGE:
+                rows = list(self.queryset.order_by(*self._reverse(self.ordering))[:self.per_page + 1])
+                has_previous = len(rows) > self.per_page
+                return self._page(rows[:self.per_page][::-1], False, has_previous, params)
+            if before:
+                values = self.decode_cursor(before)
+                rows = list(
+                    self.queryset.filter(self._seek(values, forward=False))
+                    .order_by(*self._reverse(self.ordering))[:self.per_page + 1]
+                )
+                has_previous = len(rows) > self.per_page
+                return self._page(rows[:self.per_page][::-1], True, has_previous, params)
+            if after:
+                values = self.decode_cursor(after)
+                queryset = self.queryset.filter(self._seek(values, forward=True))
+                has_previous = True
+            else:
+                queryset = self.queryset
+                has_previous = False
+        except InvalidCursor:
+            queryset = self.queryset
+            has_previous = False
+        rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+        return self._page(rows[:self.per_page], len(rows) > self.per_page, has_previous, params)
+
+    def _page(self, rows, has_next, has_previous, params):
+        # Trang rỗng phía sau con trỏ (ví dụ dòng cuối vừa bị xóa): không còn trang kế tiếp
+        if not rows:
+            has_next = False
+        return KeysetPage(self, rows, has_next, has_previous, params)
+
+    @property
+    def approximate_total(self):
+        if not self.with_total:
+            return None
+        if not hasattr(self, '_approximate_total'):
+            self._approximate_total = approximate_count(self.queryset)
+        return self._approximate_total
@@ -0,0 +1,98 @@
+"""Tìm kiếm sản phẩm không phân biệt dấu và hoa/thường.
+
+Mỗi sản phẩm có cột search_text chứa tên, danh mục và mã đã bỏ dấu, viết
+thường ("Son môi Đỏ" -> "son moi do"), nên "son moi" tìm được "Son môi".
+- PostgreSQL: index GIN trigram (pg_trgm) trên search_text, mỗi từ khóa là một
+  điều kiện LIKE '%từ%' dùng được index; xếp hạng bằng độ tương đồng trigram.
+- Database khác (SQLite khi phát triển): bảng ProductSearchToken chứa từng từ
+  của search_text, mỗi từ khóa được tra theo tiền tố bằng khoảng [từ, từ + U+FFFF)
+  trên index; xếp hạng theo số từ khớp trọn vẹn.
+Kết quả có thêm cột search_rank kiểu số nguyên (cao hơn là phù hợp hơn), để con
+trỏ phân trang (KeysetPaginator) so sánh bằng chính xác giữa các dòng cùng điểm.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Case, Exists, ExpressionWrapper, FloatField, IntegerField, OuterRef, Value, When
+from django.db.models.functions import Cast
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+# Số từ khóa tối đa được dùng trong một lần tìm
+MAX_QUERY_TOKENS = 6
+SEARCH_TOKEN_LENGTH = 50
+
+
+def normalize_text(text):
+    """Bỏ dấu tiếng Việt, viết thường, chỉ giữ chữ và số cách nhau một dấu cách"""
+    text = str(text or '').replace('đ', 'd').replace('Đ', 'D')
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def tokenize(text):
+    """Các từ (không trùng, giữ thứ tự) của chuỗi đã chuẩn hóa"""
+    return list(dict.fromkeys(normalize_text(text).split()))
+
+
+def build_search_text(product, category_name=None):
+    """Nội dung cột search_text của sản phẩm: tên, danh mục và mã"""
+    if category_name is None:
+        category_name = product.category.name if product.category_id else ''
+    return normalize_text(' '.join(filter(None, [product.name, category_name, product.code])))
+
+
+def uses_token_table():
+    """Bảng từ khóa chỉ dùng cho database không có trigram index (không phải PostgreSQL)"""
+    return connection.vendor != 'postgresql'
+
+
+def index_products(product_ids):
+    """Ghi lại các từ khóa của sản phẩm vào ProductSearchToken (bỏ qua trên PostgreSQL)"""
+    from .models import Product, ProductSearchToken
+
+    if not uses_token_table():
+        return
+    product_ids = list(product_ids)
+    ProductSearchToken.objects.filter(product_id__in=product_ids).delete()
+    tokens = [
+        ProductSearchToken(product_id=pk, token=token[:SEARCH_TOKEN_LENGTH])
+        for pk, search_text in Product.objects.filter(pk__in=product_ids).values_list('pk', 'search_text')
+        for token in dict.fromkeys(search_text.split())
+    ]
+    ProductSearchToken.objects.bulk_create(tokens, batch_size=1000)
+
+
+def search_products(queryset, query):
+    """Lọc queryset sản phẩm theo từ khóa, thêm cột search_rank; query rỗng trả về queryset"""
+    tokens = tokenize(query)[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return queryset
+    phrase = ' '.join(tokens)
+    # Cụm từ khóa đứng đầu tên sản phẩm được ưu tiên nhất
+    prefix_bonus = Case(When(search_text__startswith=phrase, then=Value(100)), default=Value(0))
+
+    if not uses_token_table():
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        for token in tokens:
+            queryset = queryset.filter(search_text__contains=token)
+        rank = prefix_bonus + TrigramSimilarity('search_text', phrase) * Value(10)
+        # Độ tương đồng là số thực (real): làm tròn theo phần nghìn thành số nguyên để giá trị
+        # đọc ra và ghi vào con trỏ trùng khớp với giá trị database dùng khi sắp xếp
+        rank = ExpressionWrapper(rank * Value(1000), output_field=FloatField())
+        return queryset.annotate(search_rank=Cast(rank, IntegerField()))
+
+    from .models import ProductSearchToken
+
+    rank = prefix_bonus
+    for token in tokens:
+        # Khoảng theo tiền tố trên index (token, product), SQLite duyệt theo rowid từ kết quả này
+        prefixed = ProductSearchToken.objects.filter(token__gte=token, token__lt=token + '\uffff')
+        queryset = queryset.filter(pk__in=prefixed.values('product_id'))
+        # Từ khớp trọn vẹn được điểm cao hơn từ chỉ khớp tiền tố
+        exact = ProductSearchToken.objects.filter(product=OuterRef('pk'), token=token)
+        rank = rank + Case(When(Exists(exact), then=Value(2)), default=Value(1))
+    return queryset.annotate(search_rank=ExpressionWrapper(rank, output_field=IntegerField()))
@@ -0,0 +1,386 @@
+import datetime
+import io
+import json
+import threading
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from inventory.allocation import export_product
+from inventory.models import Batch, Export, Import, ImportItem, InventoryVersion
+from jobs.models import Job
+from kho_my_pham.metrics import REQUESTS
+from kho_my_pham.querystats import QueryBudgetMixin, QueryStats, fingerprint
+from .dashboard import DashboardMetrics, dashboard_snapshot_key, get_dashboard_snapshot
+from .models import Category, DocumentSequence, Product
+from .pagination import KeysetPaginator
+from .search import normalize_text, search_products
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        lipstick = Category.objects.create(name='Son môi')
+        cream = Category.objects.create(name='Kem dưỡng')
+        self.red = Product.objects.create(name='Son môi Đỏ Cam', category=lipstick)
+        self.moist = Product.objects.create(name='Son dưỡng ẩm', category=cream)
+        self.cream = Product.objects.create(name='Kem dưỡng ẩm ban đêm', category=cream)
+
+    def _search(self, query):
+        return list(search_products(Product.objects.all(), query).order_by('-search_rank', 'name', 'id'))
+
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text('  Son MÔI Đỏ-cam! '), 'son moi do cam')
+
+    def test_accent_insensitive_prefix_search(self):
+        self.assertEqual(self._search('son moi'), [self.red])
+        self.assertEqual(self._search('dem'), [self.cream])
+        self.assertEqual(self._search('duong am'), [self.cream, self.moist])
+        self.assertEqual(self._search('xyz'), [])
+
+    def test_rank_prefers_name_prefix(self):
+        # Tên bắt đầu bằng từ khóa xếp trước sản phẩm chỉ khớp theo danh mục
+        self.assertEqual(self._search('kem'), [self.cream, self.moist])
+        # Khớp trọn từ 'am' xếp trước khớp tiền tố của 'amla'
+        oil = Product.objects.create(name='Dầu gội amla', category=self.cream.category)
+        self.assertEqual(self._search('am')[-1], oil)
+
+    def test_rank_cursor_keeps_tied_rows(self):
+        for index in range(5):
+            Product.objects.create(name=f'Son lì {index}', category=self.red.category)
+        paginator = KeysetPaginator(search_products(Product.objects.all(), 'son'), 2, ('-search_rank', 'name', 'id'))
+        rows, params = [], {}
+        while True:
+            page = paginator.get_page(params)
+            rows += list(page)
+            if not page.has_next:
+                break
+            params = {'after': page.next_query.split('after=')[1]}
+        # Điểm là số nguyên nên các dòng cùng điểm với con trỏ không bị bỏ sót
+        self.assertIsInstance(rows[0].search_rank, int)
+        self.assertEqual(rows, self._search('son'))
+
+    def test_index_follows_renames(self):
+        self.cream.name = 'Sữa rửa mặt'
+        self.cream.save()
+        self.assertEqual(self._search('sua rua'), [self.cream])
+
+        category = self.moist.category
+        category.name = 'Chăm sóc da'
+        category.save()
+        self.assertIn(self.moist, self._search('cham soc'))
+
+
+class DocumentSequenceTest(TestCase):
+    def test_reserve_range(self):
+        self.assertEqual(DocumentSequence.reserve('import', 'PN', 2026, 5), 1)
+        self.assertEqual(DocumentSequence.reserve('import', 'PN', 2026), 6)
+        self.assertEqual(DocumentSequence.next_codes('import', 'PN', 2026, 2), ['PN2026007', 'PN2026008'])
+        # Năm mới bắt đầu lại từ 1
+        self.assertEqual(DocumentSequence.next_code('import', 'PN', 2027), 'PN2027001')
+
+    def test_counter_per_document_kind(self):
+        # Sản phẩm của danh mục "Son..." và lô của sản phẩm "Son..." có cùng tiền tố nhưng đếm riêng
+        self.assertEqual(DocumentSequence.next_code('product', 'SON', 2026), 'SON2026001')
+        self.assertEqual(DocumentSequence.next_code('batch', 'SON', 2026), 'SON2026001')
+        self.assertEqual(DocumentSequence.next_code('product', 'SON', 2026), 'SON2026002')
+        self.assertEqual(
+            sorted(DocumentSequence.objects.values_list('kind', 'last_value')),
+            [('batch', 1), ('product', 2)],
+        )
+
+
+@skipUnless(connection.features.has_select_for_update, 'SQLite trong bộ nhớ khóa cả bảng khi ghi đồng thời')
+class DocumentSequenceConcurrencyTest(TransactionTestCase):
+    """Nhiều request cấp mã cùng lúc không bao giờ nhận trùng số (CI chạy trên PostgreSQL)"""
+
+    workers = 8
+    reservations_per_worker = 10
+
+    def _worker(self, numbers, errors):
+        try:
+            for index in range(self.reservations_per_worker):
+                count = 1 + index % 3
+                first = DocumentSequence.reserve('export', 'PX', 2026, count)
+                numbers.extend(range(first, first + count))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def test_concurrent_reservations_are_unique(self):
+        numbers, errors = [], []
+        threads = [threading.Thread(target=self._worker, args=(numbers, errors)) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(numbers), len(set(numbers)))
+        self.assertEqual(sorted(numbers), list(range(1, len(numbers) + 1)))
+        self.assertEqual(DocumentSequence.objects.get(kind='export', prefix='PX', year=2026).last_value, len(numbers))
+
+
+class StockQuantityTest(TestCase):
+    """Product.stock_quantity luôn bằng tổng remaining_quantity của các lô đang hoạt động"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='clerk')
+        self.product = Product.objects.create(name='Serum', category=Category.objects.create(name='Serum'))
+
+    def _batch(self, quantity):
+        return Batch.objects.create(
+            product=self.product, import_date='2025-01-01',
+            import_quantity=quantity, remaining_quantity=quantity, created_by=self.user,
+        )
+
+    def _stock(self):
+        self.product.refresh_from_db()
+        return self.product.stock_quantity
+
+    def test_stock_follows_batch_changes(self):
+        first = self._batch(10)
+        second = self._batch(5)
+        self.assertEqual(self._stock(), 15)
+
+        first.remaining_quantity = 7
+        first.save()
+        self.assertEqual(self._stock(), 12)
+
+        second.is_active = False
+        second.save()
+        self.assertEqual(self._stock(), 7)
+        second.is_active = True
+        second.save()
+        self.assertEqual(self._stock(), 12)
+
+        first.delete()
+        self.assertEqual(self._stock(), 5)
+        # Lưu sản phẩm không ghi đè tồn kho bằng giá trị cũ trong bộ nhớ
+        stale = Product.objects.get(pk=self.product.pk)
+        second.delete()
+        stale.name = 'Serum B5'
+        stale.save()
+        self.assertEqual(self._stock(), 0)
+
+    def test_reconcile_stock_reports_and_fixes_drift(self):
+        self._batch(10)
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=3)
+
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, '1 sản phẩm sai lệch'):
+            call_command('reconcile_stock', check=True, stdout=out)
+        self.assertIn(f'{self.product.code}: lưu 3, thực tế 10', out.getvalue())
+        self.assertEqual(self._stock(), 3)
+
+        call_command('reconcile_stock', stdout=io.StringIO())
+        self.assertEqual(self._stock(), 10)
+        call_command('reconcile_stock', check=True, stdout=io.StringIO())
+
+
+class DashboardMetricsTest(TestCase):
+    """Số liệu dashboard dùng một số câu truy vấn cố định, không phụ thuộc số sản phẩm/danh mục/lô"""
+
+    # totals, expiring_products (2), expiry_summary, low_stock, category, lowest, top, nhập/xuất theo ngày (2)
+    QUERIES = 10
+
+    def setUp(self):
+        self.user = User.objects.create(username='clerk')
+        self.today = timezone.localdate()
+        self.count = 0
+
+    def _seed(self, categories, products_per_category):
+        for category_index in range(categories):
+            category = Category.objects.create(name=f'Danh mục {self.count}-{category_index}')
+            for _ in range(products_per_category):
+                self.count += 1
+                product = Product.objects.create(
+                    name=f'Sản phẩm {self.count}', category=category, purchase_price=1000, selling_price=1500,
+                    expiry_date=self.today + datetime.timedelta(days=30 * (self.count % 12) - 30),
+                )
+                for quantity in (3, 8):
+                    Batch.objects.create(
+                        product=product, import_date=self.today, import_quantity=quantity,
+                        remaining_quantity=quantity, created_by=self.user,
+                    )
+                import_order = Import.objects.create(created_by=self.user)
+                ImportItem.objects.create(import_order=import_order, product=product, quantity=11, unit_price=1000)
+                export_product(Export.objects.create(created_by=self.user), product, 4, 1500)
+
+    def test_fixed_number_of_queries(self):
+        self._seed(categories=2, products_per_category=2)
+        with self.assertNumQueries(self.QUERIES):
+            small = DashboardMetrics(self.today).build()
+        self.assertEqual(small['total_products'], 4)
+        self.assertEqual(len(small['expiring_products']), DashboardMetrics.panel_size)
+
+        self._seed(categories=5, products_per_category=4)
+        with self.assertNumQueries(self.QUERIES):
+            large = DashboardMetrics(self.today).build()
+        self.assertEqual(large['total_products'], 24)
+        self.assertEqual(large['total_stock_value'], 24 * (11 - 4))
+        self.assertEqual(len(json.loads(large['category_labels'])), 7)
+
+
+class DashboardSnapshotTest(TestCase):
+    """Snapshot dashboard được cache theo phiên bản dữ liệu kho và theo ngày"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='clerk')
+        self.today = timezone.localdate()
+        # Chạy callback on_commit để các lần ghi trong test được đăng ký tăng phiên bản lại từ đầu
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(name='Son môi')
+            self.product = Product.objects.create(
+                name='Son đỏ', category=category, purchase_price=1000, selling_price=1500,
+            )
+
+    def _key(self):
+        return dashboard_snapshot_key(InventoryVersion.current(), timezone.localdate())
+
+    def _add_batch(self, quantity):
+        return Batch.objects.create(
+            product=self.product, import_date=self.today, import_quantity=quantity,
+            remaining_quantity=quantity, created_by=self.user,
+        )
+
+    def test_batch_write_changes_snapshot_key(self):
+        key = self._key()
+        self.assertEqual(get_dashboard_snapshot()['total_stock_value'], 0)
+        self.assertIsNotNone(cache.get(key))
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self._add_batch(5)
+            self._add_batch(2)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(self._key(), key)
+        self.assertEqual(get_dashboard_snapshot()['total_stock_value'], 7)
+
+    def test_rolled_back_write_does_not_block_later_bumps(self):
+        key = self._key()
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self._add_batch(5)
+                raise RuntimeError
+        self.assertEqual(self._key(), key)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._add_batch(3)
+        self.assertNotEqual(self._key(), key)
+
+    def test_snapshot_key_changes_with_date(self):
+        get_dashboard_snapshot()
+        tomorrow = self.today + datetime.timedelta(days=1)
+        with mock.patch('django.utils.timezone.localdate', return_value=tomorrow):
+            self.assertNotEqual(self._key(), dashboard_snapshot_key(InventoryVersion.current(), self.today))
+            self.assertIsNone(cache.get(self._key()))
+            get_dashboard_snapshot()
+            self.assertIsNotNone(cache.get(self._key()))
+
+
+class ViewQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Số câu truy vấn của các trang chính không tăng theo số sản phẩm, lô hàng và phiếu"""
+
+    # Số câu truy vấn tối đa của từng trang (đã gồm session và người dùng đăng nhập)
+    QUERY_BUDGETS = {
+        'products:dashboard': 15,
+        'products:product_list': 6,
+        'inventory:import_list': 5,
+        'inventory:export_list': 5,
+        'reports:inventory_report': 6,
+        'reports:profit_report': 5,
+        'reports:import_export_report': 10,
+        'reports:stock_history_report': 5,
+    }
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='clerk', password='x')
+        self.client.login(username='clerk', password='x')
+        self.category = Category.objects.create(name='Son môi')
+        self.seeded = 0
+
+    def _seed(self, count):
+        """Thêm count sản phẩm, mỗi sản phẩm có hai lô (một lô sắp hết hạn) và một phiếu xuất"""
+        today = timezone.localdate()
+        for index in range(self.seeded, self.seeded + count):
+            product = Product.objects.create(
+                name=f'Son {index}', category=self.category,
+                purchase_price=1000, selling_price=1500,
+                expiry_date=today + datetime.timedelta(days=30 * (index % 12)),
+            )
+            import_order = Import.objects.create(created_by=self.user)
+            ImportItem.objects.create(import_order=import_order, product=product, quantity=20, unit_price=1000)
+            for day in (1, 2):
+                Batch.objects.create(
+                    product=product, import_date=f'2025-01-0{day}',
+                    import_quantity=10, remaining_quantity=10, created_by=self.user,
+                )
+            export_order = Export.objects.create(created_by=self.user)
+            export_product(export_order, product, 5, 1500)
+        self.seeded += count
+
+    def _measure(self):
+        counts = {}
+        for name, budget in self.QUERY_BUDGETS.items():
+            cache.clear()
+            counts[name] = self.assertQueryBudget(reverse(name), budget).count
+        return counts
+
+    def test_query_counts_do_not_grow_with_data(self):
+        self._seed(2)
+        small = self._measure()
+        self._seed(10)
+        self.assertEqual(self._measure(), small)
+
+    def test_fingerprint_groups_repeated_lookups(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM p WHERE id = 12 AND name = 'Son ''A''' AND c IN (%s, %s)"),
+            fingerprint('SELECT * FROM p WHERE id = 7 AND name = %s AND c IN (%s)'),
+        )
+        stats = QueryStats()
+        for pk in range(4):
+            stats.add(f'SELECT * FROM p WHERE id = {pk}', 0.001)
+        self.assertEqual((stats.count, stats.duplicates), (4, 3))
+
+
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='clerk', password='x')
+        self.client.login(username='clerk', password='x')
+
+    def test_metrics_by_view(self):
+        before = REQUESTS.value('products:product_list', 'GET', '200')
+        self.client.get(reverse('products:product_list'))
+        started = timezone.now()
+        Job.objects.create(
+            kind='excel_commit', status='succeeded', created_by=self.user,
+            result={'rows': 500, 'rows_per_second': 250.0},
+            started_at=started, finished_at=started + datetime.timedelta(seconds=2),
+        )
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertEqual(REQUESTS.value('products:product_list', 'GET', '200'), before + 1)
+        self.assertIn('kho_http_request_duration_seconds_bucket{view="products:product_list",le="+Inf"}', body)
+        self.assertIn('kho_db_queries_total{view="products:product_list"}', body)
+        self.assertIn('kho_job_duration_seconds_sum{kind="excel_commit"} 2.0', body)
+        self.assertIn('kho_excel_import_rows_per_second 250.0', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_health_check_queries_database(self):
+        response = self.client.get(reverse('health_check'))
+        self.assertEqual(response.json()['database'], 'connected')
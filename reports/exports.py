@@ -0,0 +1,172 @@
+"""Nội dung file Excel của các báo cáo, ghi bằng reports.xlsx_stream.
+
+Mỗi hàm trả về (tên file, danh sách Sheet); dữ liệu được đọc bằng
+.iterator(chunk_size=...) trong lúc ghi nên dùng chung được cho view tải trực
+tiếp (StreamingHttpResponse) và công việc nền (reports.tasks).
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from inventory.models import EXPIRY_WARNING_DAYS, Batch, Import, Export
+from .profit import ProfitEngine
+from .xlsx_stream import Cell, Sheet
+
+REPORT_CHUNK_SIZE = 2000
+
+
+def _title(text):
+    return [Cell(text, 'title')]
+
+
+def _header(headers):
+    return [Cell(header, 'header') for header in headers]
+
+
+def inventory_report_file():
+    """Báo cáo tồn kho chi tiết theo lô hàng"""
+    today = timezone.now().date()
+    expiring_soon = today + timedelta(days=EXPIRY_WARNING_DAYS)  # 9 tháng
+    batches = (
+        Batch.objects.in_stock().filter(product__is_active=True)
+        .select_related('product__category')
+        .order_by('product__name', 'product_id', 'import_date')
+    )
+    headers = ['STT', 'Mã SP', 'Tên sản phẩm', 'Danh mục', 'Đơn vị', 'Tổng tồn kho', 'Lô hàng', 'Hạn sử dụng', 'Số lượng còn', 'Trạng thái']
+
+    def rows():
+        yield _title("BÁO CÁO TỒN KHO CHI TIẾT")
+        yield []
+        yield _header(headers)
+        for number, batch in enumerate(batches.iterator(chunk_size=REPORT_CHUNK_SIZE), 1):
+            product = batch.product
+            # Xác định trạng thái theo hạn sử dụng lưu trên lô
+            if batch.expiry_date and batch.expiry_date < today:
+                status = "Hết hạn"
+            elif batch.expiry_date and batch.expiry_date < expiring_soon:
+                status = "Sắp hết hạn"
+            elif batch.remaining_quantity <= 1:
+                status = "Sắp hết hàng"
+            else:
+                status = "Bình thường"
+
+            yield [
+                number,
+                product.code,
+                product.name,
+                product.category.name,
+                product.unit,
+                product.total_stock,
+                batch.batch_code,
+                batch.expiry_date.strftime('%d/%m/%Y') if batch.expiry_date else '-',
+                batch.remaining_quantity,
+                status,
+            ]
+
+    filename = f"bao_cao_ton_kho_{today.strftime('%Y%m%d')}.xlsx"
+    return filename, [Sheet("Báo cáo tồn kho", rows(), merged=['A1:J1'])]
+
+
+def import_export_report_file(start_date=None, end_date=None):
+    """Báo cáo phiếu nhập/xuất trong khoảng thời gian và bảng tổng hợp"""
+    imports = Import.objects.all()
+    exports = Export.objects.all()
+
+    if start_date:
+        imports = imports.filter(import_date__gte=start_date)
+        exports = exports.filter(export_date__gte=start_date)
+
+    if end_date:
+        imports = imports.filter(import_date__lte=end_date)
+        exports = exports.filter(export_date__lte=end_date)
+
+    headers = ['STT', 'Mã phiếu', 'Ngày nhập', 'Nhà cung cấp', 'Người tạo', 'Tổng giá trị', 'Ghi chú']
+    # Cộng dồn trong lúc ghi hai sheet đầu, dùng cho sheet tổng hợp
+    totals = {'import_count': 0, 'import_value': 0, 'export_count': 0, 'export_value': 0}
+
+    def order_rows(title, orders, kind, code, date, partner):
+        yield _title(title)
+        yield []
+        yield _header(headers)
+        orders = orders.select_related('created_by')
+        for number, order in enumerate(orders.iterator(chunk_size=REPORT_CHUNK_SIZE), 1):
+            total_amount = order.total_amount
+            totals[f'{kind}_count'] += 1
+            totals[f'{kind}_value'] += total_amount
+            yield [
+                number,
+                getattr(order, code),
+                getattr(order, date).strftime('%d/%m/%Y %H:%M'),
+                getattr(order, partner) or '-',
+                order.created_by.get_full_name() or order.created_by.username,
+                total_amount,
+                order.notes or '-',
+            ]
+
+    def summary_rows():
+        yield _title("TỔNG HỢP NHẬP/XUẤT KHO")
+        yield []
+        stats = [
+            ['Chỉ tiêu', 'Giá trị'],
+            ['Tổng phiếu nhập', totals['import_count']],
+            ['Tổng phiếu xuất', totals['export_count']],
+            ['Tổng giá trị nhập', totals['import_value']],
+            ['Tổng giá trị xuất', totals['export_value']],
+            ['Lợi nhuận', totals['export_value'] - totals['import_value']],
+        ]
+        for label, value in stats:
+            yield [Cell(label, 'bold'), value]
+
+    today = timezone.now().date()
+    filename = f"bao_cao_nhap_xuat_{today.strftime('%Y%m%d')}.xlsx"
+    return filename, [
+        Sheet("Phiếu nhập kho", order_rows("BÁO CÁO PHIẾU NHẬP KHO", imports, 'import', 'import_code', 'import_date', 'supplier'), merged=['A1:G1']),
+        Sheet("Phiếu xuất kho", order_rows("BÁO CÁO PHIẾU XUẤT KHO", exports, 'export', 'export_code', 'export_date', 'customer'), merged=['A1:G1']),
+        Sheet("Tổng hợp", summary_rows(), merged=['A1:D1']),
+    ]
+
+
+def profit_report_file(start_date=None, end_date=None):
+    """Báo cáo lợi nhuận theo sản phẩm"""
+    summary = ProfitEngine(start_date, end_date).summary()
+    profit_details = summary['details']
+    total_import_value = summary['total_import_value']
+    total_export_value = summary['total_export_value']
+    total_profit = summary['total_profit']
+    profit_margin_total = summary['profit_margin']
+    
+    headers = ['STT', 'Sản phẩm', 'Danh mục', 'Số lượng xuất', 'Giá nhập TB', 'Giá xuất TB', 'Lợi nhuận/SP', 'Tổng lợi nhuận', 'Tỷ lệ LN (%)']
+
+    def rows():
+        yield _title("BÁO CÁO LỢI NHUẬN")
+        yield []
+        yield [Cell("TỔNG QUAN", 'bold')]
+        stats = [
+            ['Chỉ tiêu', 'Giá trị'],
+            ['Tổng giá trị nhập', total_import_value],
+            ['Tổng giá trị xuất', total_export_value],
+            ['Tổng lợi nhuận', total_profit],
+            ['Tỷ lệ lợi nhuận', f"{profit_margin_total:.1f}%"],
+        ]
+        for label, value in stats:
+            yield [Cell(label, 'bold'), value]
+        yield [Cell("CHI TIẾT LỢI NHUẬN THEO SẢN PHẨM", 'bold')]
+        yield _header(headers)
+        for number, item in enumerate(profit_details, 1):
+            yield [
+                number,
+                item['product'].name,
+                item['product'].category.name,
+                item['total_quantity'],
+                item['avg_import_price'],
+                item['avg_export_price'],
+                item['profit_per_unit'],
+                item['total_profit'],
+                f"{item['profit_margin']:.1f}",
+            ]
+        # Tổng cộng
+        yield [Cell("TỔNG CỘNG", 'bold')] + [None] * 6 + [Cell(total_profit, 'bold'), Cell(f"{profit_margin_total:.1f}", 'bold')]
+
+    today = timezone.now().date()
+    filename = f"bao_cao_loi_nhuan_{today.strftime('%Y%m%d')}.xlsx"
+    return filename, [Sheet("Báo cáo lợi nhuận", rows(), merged=['A1:I1'])]
@@ -0,0 +1,84 @@
+"""Tính lợi nhuận theo sản phẩm bằng một câu truy vấn GROUP BY trên các dòng xuất kho"""
+from decimal import Decimal
+
+from django.db.models import ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from inventory.models import MONEY, export_item_total
+from products.models import Product
+
+
+class ProfitEngine:
+    """Số lượng, doanh thu sau giảm giá, giá vốn và lợi nhuận của từng sản phẩm đã xuất.
+
+    Giá nhập của một dòng xuất là giá mua của sản phẩm (Batch.import_price), doanh
+    thu là ExportItem.total_price; cả hai được tổng hợp trong database.
+    """
+
+    def __init__(self, start_date=None, end_date=None):
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def _export_filter(self):
+        condition = Q(batches__exportitem__isnull=False)
+        if self.start_date:
+            condition &= Q(batches__exportitem__export_order__export_date__gte=self.start_date)
+        if self.end_date:
+            condition &= Q(batches__exportitem__export_order__export_date__lte=self.end_date)
+        return condition
+
+    def queryset(self):
+        """Sản phẩm có xuất kho trong kỳ, kèm các cột tổng hợp, sắp xếp theo lợi nhuận giảm dần"""
+        item = 'batches__exportitem__'
+        return (
+            Product.objects.select_related('category')
+            .filter(self._export_filter())
+            .annotate(
+                total_quantity=Sum(f'{item}quantity'),
+                revenue=Sum(export_item_total(item), output_field=MONEY),
+                avg_import_price=Coalesce(F('purchase_price'), Value(Decimal('0')), output_field=MONEY),
+            )
+            .annotate(
+                cost=ExpressionWrapper(F('avg_import_price') * F('total_quantity'), output_field=MONEY),
+            )
+            .annotate(
+                total_profit=ExpressionWrapper(F('revenue') - F('cost'), output_field=MONEY),
+            )
+            .order_by('-total_profit', 'name')
+        )
+
+    def details(self):
+        """Danh sách dict theo sản phẩm cho template và file Excel"""
+        details = []
+        for product in self.queryset():
+            quantity = product.total_quantity
+            avg_export_price = product.revenue / quantity if quantity else Decimal('0')
+            profit_per_unit = avg_export_price - product.avg_import_price
+            details.append({
+                'product': product,
+                'total_quantity': quantity,
+                'revenue': product.revenue,
+                'cost': product.cost,
+                'avg_import_price': product.avg_import_price,
+                'avg_export_price': avg_export_price,
+                'profit_per_unit': profit_per_unit,
+                'total_profit': product.total_profit,
+                'profit_margin': (
+                    profit_per_unit / product.avg_import_price * 100 if product.avg_import_price > 0 else 0
+                ),
+            })
+        return details
+
+    def summary(self):
+        """Chi tiết theo sản phẩm và số liệu tổng của kỳ báo cáo"""
+        details = self.details()
+        total_export_value = sum((item['revenue'] for item in details), Decimal('0'))
+        total_import_value = sum((item['cost'] for item in details), Decimal('0'))
+        total_profit = total_export_value - total_import_value
+        return {
+            'details': details,
+            'total_import_value': total_import_value,
+            'total_export_value': total_export_value,
+            'total_profit': total_profit,
+            'profit_margin': (total_profit / total_import_value * 100) if total_import_value > 0 else 0,
+        }
@@ -0,0 +1,46 @@
+"""Công việc nền tạo file Excel báo cáo"""
+import tempfile
+import time
+
+from jobs.registry import job_handler
+from .exports import import_export_report_file, inventory_report_file, profit_report_file
+from .xlsx_stream import stream_xlsx
+
+# Khoảng thời gian (giây) giữa hai lần cập nhật heartbeat khi ghi dòng; phải nhỏ hơn nhiều so với
+# --stale-after của run_jobs để báo cáo lớn không bị coi là worker đã dừng
+HEARTBEAT_SECONDS = 30
+
+
+def _save_report(job, builder, **kwargs):
+    job.update_progress(10, 'Đang tạo báo cáo')
+    filename, sheets = builder(**kwargs)
+    last_beat = time.monotonic()
+
+    def heartbeat(rows):
+        nonlocal last_beat
+        if time.monotonic() - last_beat >= HEARTBEAT_SECONDS:
+            job.update_progress(job.progress, f'Đang tạo báo cáo: đã ghi {rows} dòng')
+            last_beat = time.monotonic()
+
+    with tempfile.TemporaryFile() as output:
+        for chunk in stream_xlsx(sheets, on_rows=heartbeat):
+            output.write(chunk)
+        job.update_progress(90, 'Đang lưu file')
+        output.seek(0)
+        job.save_result_file(filename, output)
+    return {'filename': filename, 'message': f'Đã tạo {filename}'}
+
+
+@job_handler('inventory_report')
+def inventory_report(job):
+    return _save_report(job, inventory_report_file)
+
+
+@job_handler('import_export_report')
+def import_export_report(job):
+    return _save_report(job, import_export_report_file, **job.params)
+
+
+@job_handler('profit_report')
+def profit_report(job):
+    return _save_report(job, profit_report_file, **job.params)
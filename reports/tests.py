@@ -1,3 +1,175 @@
-from django.test import TestCase
+import datetime
+import io
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from inventory.allocation import export_product
+from inventory.models import Batch, Export, InventorySnapshot
+from jobs.models import Job
+from products.models import Category, Product
+from . import tasks
+from .profit import ProfitEngine
+from .xlsx_stream import Cell, Sheet, stream_xlsx
+
+
+class StreamXlsxTest(SimpleTestCase):
+    def _read(self, sheets, **kwargs):
+        chunks = list(stream_xlsx(sheets, **kwargs))
+        return chunks, openpyxl.load_workbook(io.BytesIO(b''.join(chunks)))
+
+    def test_workbook_round_trip(self):
+        def summary():
+            yield [Cell('Tổng', 'bold'), 3]
+
+        sheets = [
+            Sheet('Chi tiết', [
+                [Cell('BÁO CÁO', 'title')],
+                [],
+                [Cell('STT', 'header'), Cell('Tên', 'header')],
+                [1, 'Kem <dưỡng> & "serum"'],
+                [2, None, 12.5],
+            ], merged=['A1:C1']),
+            Sheet('Tổng hợp', summary()),
+        ]
+        _, wb = self._read(sheets)
+
+        self.assertEqual(wb.sheetnames, ['Chi tiết', 'Tổng hợp'])
+        ws = wb['Chi tiết']
+        self.assertEqual(ws['A1'].value, 'BÁO CÁO')
+        self.assertTrue(ws['A1'].font.b)
+        self.assertEqual(ws['B4'].value, 'Kem <dưỡng> & "serum"')
+        self.assertEqual(ws['C5'].value, 12.5)
+        self.assertIsNone(ws['B5'].value)
+        self.assertEqual(ws['A3'].fill.fgColor.rgb, 'FF366092')
+        self.assertEqual([str(r) for r in ws.merged_cells.ranges], ['A1:C1'])
+        # Độ rộng cột theo giá trị dài nhất, tiêu đề gộp ô không tính
+        self.assertEqual(ws.column_dimensions['B'].width, len('Kem <dưỡng> & "serum"') + 2)
+        self.assertEqual(ws.column_dimensions['A'].width, len('STT') + 2)
+        self.assertEqual(wb['Tổng hợp']['B1'].value, 3)
+
+    def test_large_sheet_is_streamed_in_chunks(self):
+        rows = ([i, f'Sản phẩm {i}'] for i in range(1, 5001))
+        chunks, wb = self._read([Sheet('Tồn kho', rows)], width_sample_rows=100)
+
+        self.assertGreater(len([chunk for chunk in chunks if chunk]), 5)
+        ws = wb['Tồn kho']
+        self.assertEqual(ws.max_row, 5000)
+        self.assertEqual(ws['B5000'].value, 'Sản phẩm 5000')
+        # Độ rộng chỉ tính trên các dòng mẫu đầu tiên
+        self.assertEqual(ws.column_dimensions['B'].width, len('Sản phẩm 100') + 2)
+
+    def test_on_rows_counts_rows_of_all_sheets(self):
+        counts = []
+        sheets = [Sheet('Một', ([i] for i in range(1200))), Sheet('Hai', ([i] for i in range(600)))]
+        list(stream_xlsx(sheets, width_sample_rows=10, on_rows=counts.append))
+        self.assertEqual(counts, [500, 1000, 1700])
+
+
+class ReportJobTest(TestCase):
+    def test_long_report_keeps_heartbeat_fresh(self):
+        user = User.objects.create(username='clerk')
+        job = Job.objects.create(kind='inventory_report', created_by=user, status='running')
+        stale = timezone.now() - timezone.timedelta(hours=1)
+        beats = []
+
+        def builder():
+            def rows():
+                for i in range(2000):
+                    if i == 100:
+                        Job.objects.filter(pk=job.pk).update(heartbeat_at=stale)
+                    if i == 1600:
+                        # Giữa lúc ghi dòng heartbeat đã được làm mới nên worker khác không chạy lại công việc
+                        beats.append(Job.objects.get(pk=job.pk).heartbeat_at)
+                    yield [i]
+            return 'bao_cao.xlsx', [Sheet('Tồn kho', rows())]
+
+        with mock.patch.object(tasks, 'HEARTBEAT_SECONDS', 0):
+            result = tasks._save_report(job, builder)
+        self.assertEqual(result['filename'], 'bao_cao.xlsx')
+        self.assertGreater(beats[0], stale)
+        self.assertEqual(Job.requeue_stale(600), 0)
+        self.assertEqual(job.result_file.name, 'bao_cao.xlsx')
+
+
+class ProfitEngineTest(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='clerk')
+        category = Category.objects.create(name='Serum')
+        self.product = Product.objects.create(name='Serum B5', category=category, purchase_price=1000)
+        for day in (1, 2):
+            Batch.objects.create(
+                product=self.product,
+                import_date=f'2025-01-0{day}',
+                import_quantity=5,
+                remaining_quantity=5,
+                created_by=user,
+            )
+        export_order = Export.objects.create(created_by=user)
+        # 7 sản phẩm lấy từ hai lô: 4 * 2000 * 90% + 3 * 3000
+        export_product(export_order, self.product, 4, 2000, discount_percent=10)
+        export_product(export_order, self.product, 3, 3000)
+
+    def test_summary_per_product_in_one_query(self):
+        with self.assertNumQueries(1):
+            summary = ProfitEngine().summary()
+
+        [detail] = summary['details']
+        self.assertEqual(detail['product'], self.product)
+        self.assertEqual(detail['total_quantity'], 7)
+        self.assertEqual(detail['revenue'], Decimal('16200'))
+        self.assertEqual(detail['cost'], Decimal('7000'))
+        self.assertEqual(detail['total_profit'], Decimal('9200'))
+        self.assertEqual(summary['total_profit'], Decimal('9200'))
+
+    def test_date_filter(self):
+        self.assertEqual(ProfitEngine(start_date='2999-01-01').summary()['details'], [])
+
+
+class InventorySnapshotTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='clerk', password='x')
+        category = Category.objects.create(name='Toner')
+        self.product = Product.objects.create(name='Toner hoa hồng', category=category, purchase_price=Decimal('20000'))
+        Product.objects.create(name='Toner hết hàng', category=category)
+        for quantity in (4, 6):
+            Batch.objects.create(
+                product=self.product,
+                import_date=datetime.date(2025, 1, 1),
+                import_quantity=quantity,
+                remaining_quantity=quantity,
+                created_by=self.user,
+            )
+
+    def test_take_snapshot_is_idempotent(self):
+        day = datetime.date(2025, 1, 31)
+        call_command('take_inventory_snapshot', date=day.isoformat(), stdout=io.StringIO())
+        call_command('take_inventory_snapshot', date=day.isoformat(), stdout=io.StringIO())
+
+        snapshot = InventorySnapshot.objects.get()
+        self.assertEqual(
+            (snapshot.snapshot_date, snapshot.product, snapshot.quantity, snapshot.batch_count),
+            (day, self.product, 10, 2),
+        )
+        self.assertEqual(snapshot.stock_value, Decimal('200000'))
+
+    def test_history_report_reads_latest_snapshot_before_date(self):
+        InventorySnapshot.take(datetime.date(2025, 1, 31))
+        Batch.objects.filter(product=self.product).first().delete()
+        InventorySnapshot.take(datetime.date(2025, 2, 28))
+
+        self.client.login(username='clerk', password='x')
+        response = self.client.get(reverse('reports:stock_history_report'), {'date': '2025-02-15'})
+        self.assertEqual(response.context['snapshot_date'], datetime.date(2025, 1, 31))
+        self.assertEqual(response.context['total_quantity'], 10)
+        self.assertEqual(
+            list(InventorySnapshot.objects.as_of(datetime.date(2025, 3, 1)).values_list('quantity', flat=True)),
+            [Batch.objects.get().remaining_quantity],
+        )
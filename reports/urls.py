@@ -7,6 +7,7 @@ urlpatterns = [
     path('', views.report_list, name='report_list'),
     path('inventory/', views.inventory_report, name='inventory_report'),
     path('inventory/export-excel/', views.export_inventory_excel, name='export_inventory_excel'),
+    path('inventory/history/', views.stock_history_report, name='stock_history_report'),
     path('import-export/', views.import_export_report, name='import_export_report'),
     path('import-export/export-excel/', views.export_import_export_excel, name='export_import_export_excel'),
     path('profit/', views.profit_report, name='profit_report'),
@@ -0,0 +1,261 @@
+"""Ghi file .xlsx theo kiểu streaming với bộ nhớ không đổi.
+
+File được nén bằng zipfile vào một luồng không seek được, mỗi dòng được
+chuyển thành XML và nén ngay khi đọc từ database, nên byte đầu tiên được gửi
+đi ngay và bộ nhớ không tăng theo số dòng. Độ rộng cột được tính dần trong lúc
+ghi các dòng đầu tiên của sheet (thẻ <cols> phải đứng trước dữ liệu trong
+SpreadsheetML), sau đó các dòng còn lại được ghi thẳng ra luồng.
+"""
+import datetime
+import io
+import re
+import zipfile
+from dataclasses import dataclass, field
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from openpyxl.utils import get_column_letter
+
+CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Số dòng đầu tiên của mỗi sheet dùng để tính độ rộng cột
+WIDTH_SAMPLE_ROWS = 1000
+# Số dòng giữa hai lần trả dữ liệu đã nén (và gọi on_rows)
+FLUSH_ROWS = 500
+MAX_COLUMN_WIDTH = 50
+
+# Kiểu định dạng ô, chỉ số tương ứng với cellXfs trong styles.xml
+STYLES = {None: 0, 'title': 1, 'header': 2, 'bold': 3}
+
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+@dataclass
+class Cell:
+    """Ô có định dạng; ô thường chỉ cần ghi giá trị"""
+    value: object
+    style: str = None
+
+
+@dataclass
+class Sheet:
+    """Một sheet: tiêu đề, các dòng (iterable, có thể là generator) và vùng gộp ô"""
+    title: str
+    rows: object
+    merged: list = field(default_factory=list)
+
+
+class ColumnWidths:
+    """Độ rộng cột tính dần theo độ dài giá trị (giống adjust_column_width trước đây)"""
+
+    def __init__(self):
+        self.lengths = {}
+
+    def update(self, row):
+        for index, cell in enumerate(row, 1):
+            value = cell.value if isinstance(cell, Cell) else cell
+            # Tiêu đề gộp ô không làm rộng cột đầu tiên
+            if value is None or (isinstance(cell, Cell) and cell.style == 'title'):
+                continue
+            length = len(str(value))
+            if length > self.lengths.get(index, 0):
+                self.lengths[index] = length
+
+    def xml(self):
+        if not self.lengths:
+            return ''
+        cols = ''.join(
+            f'<col min="{index}" max="{index}" width="{min(length + 2, MAX_COLUMN_WIDTH)}" customWidth="1"/>'
+            for index, length in sorted(self.lengths.items())
+        )
+        return f'<cols>{cols}</cols>'
+
+
+class _Sink(io.RawIOBase):
+    """Luồng ghi không seek được, giữ tạm các byte đã nén cho tới khi được lấy ra"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _cell_xml(ref, cell):
+    style = 0
+    value = cell
+    if isinstance(cell, Cell):
+        style = STYLES[cell.style]
+        value = cell.value
+    if value is None:
+        return f'<c r="{ref}" s="{style}"/>' if style else ''
+    style_attr = f' s="{style}"' if style else ''
+    if isinstance(value, bool):
+        value = str(value)
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c r="{ref}"{style_attr}><v>{value}</v></c>'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.strftime('%d/%m/%Y')
+    text = escape(_ILLEGAL_XML_CHARS.sub('', str(value)))
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row_xml(number, row):
+    cells = ''.join(
+        _cell_xml(f'{get_column_letter(index)}{number}', cell)
+        for index, cell in enumerate(row, 1)
+    )
+    return f'<row r="{number}">{cells}</row>'
+
+
+def _content_types_xml(sheet_count):
+    overrides = ''.join(
+        f'<Override PartName="/xl/worksheets/sheet{index}.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for index in range(1, sheet_count + 1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        f'{overrides}</Types>'
+    )
+
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="4">'
+    '<font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="16"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><color rgb="FFFFFFFF"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font>'
+    '</fonts>'
+    '<fills count="3">'
+    '<fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FF366092"/><bgColor rgb="FF366092"/></patternFill></fill>'
+    '</fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1">'
+    '<alignment horizontal="center"/></xf>'
+    '<xf numFmtId="0" fontId="2" fillId="2" borderId="0" xfId="0" applyFont="1" applyFill="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="center"/></xf>'
+    '<xf numFmtId="0" fontId="3" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+def _workbook_xml(sheets):
+    entries = ''.join(
+        f'<sheet name="{escape(sheet.title[:31], {chr(34): "&quot;"})}" sheetId="{index}" r:id="rId{index}"/>'
+        for index, sheet in enumerate(sheets, 1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets>{entries}</sheets></workbook>'
+    )
+
+
+def _workbook_rels_xml(sheet_count):
+    relationships = ''.join(
+        f'<Relationship Id="rId{index}" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        f'Target="worksheets/sheet{index}.xml"/>'
+        for index in range(1, sheet_count + 1)
+    )
+    styles_id = sheet_count + 1
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'{relationships}<Relationship Id="rId{styles_id}" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/></Relationships>'
+    )
+
+
+def stream_xlsx(sheets, width_sample_rows=WIDTH_SAMPLE_ROWS, on_rows=None):
+    """Sinh nội dung file .xlsx theo từng đoạn byte từ danh sách Sheet.
+
+    Các sheet được ghi lần lượt; dòng của sheet sau chỉ được đọc khi sheet
+    trước đã ghi xong (có thể dựa vào đó để cộng dồn số liệu tổng hợp).
+    on_rows(số dòng đã ghi của mọi sheet) được gọi mỗi FLUSH_ROWS dòng.
+    """
+    sink = _Sink()
+    written = 0
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _content_types_xml(len(sheets)))
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _workbook_xml(sheets))
+        archive.writestr('xl/_rels/workbook.xml.rels', _workbook_rels_xml(len(sheets)))
+        archive.writestr('xl/styles.xml', _STYLES)
+        yield sink.pop()
+
+        for index, sheet in enumerate(sheets, 1):
+            with archive.open(f'xl/worksheets/sheet{index}.xml', 'w', force_zip64=True) as part:
+                part.write(
+                    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                )
+                rows = iter(sheet.rows)
+                number = 0
+
+                # Giữ các dòng đầu để tính độ rộng cột trước khi ghi <cols>
+                widths = ColumnWidths()
+                sample = []
+                for row in rows:
+                    widths.update(row)
+                    sample.append(row)
+                    if len(sample) >= width_sample_rows:
+                        break
+                part.write(f'{widths.xml()}<sheetData>'.encode())
+                for row in sample:
+                    number += 1
+                    part.write(_row_xml(number, row).encode())
+                del sample
+
+                for row in rows:
+                    number += 1
+                    part.write(_row_xml(number, row).encode())
+                    if number % FLUSH_ROWS == 0:
+                        if on_rows is not None:
+                            on_rows(written + number)
+                        yield sink.pop()
+                written += number
+
+                part.write(b'</sheetData>')
+                if sheet.merged:
+                    cells = ''.join(f'<mergeCell ref="{ref}"/>' for ref in sheet.merged)
+                    part.write(f'<mergeCells count="{len(sheet.merged)}">{cells}</mergeCells>'.encode())
+                part.write(b'</worksheet>')
+            yield sink.pop()
+    yield sink.pop()